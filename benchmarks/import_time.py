@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Import-time benchmark for octorecon.py
+Runs CLI invocations under `python -X importtime` and reports wall time, total import time and the
+heaviest imports, so startup regressions (e.g. pandas/matplotlib loaded eagerly again) show up.
+"""
+
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'octorecon.py')
+HEAVY_MODULES = ('pandas', 'numpy', 'matplotlib', 'matplotlib.pyplot', 'seaborn')
+IMPORTTIME_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+def run_once(args):
+    # -> (wall seconds, {module: (self us, cumulative us, depth)}) for one `python -X importtime octorecon.py args` run
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, '-X', 'importtime', SCRIPT] + args, capture_output=True, text=True)
+    wall = time.perf_counter() - start
+    modules = {}
+    for line in proc.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match: modules[match.group(4)] = (int(match.group(1)), int(match.group(2)), len(match.group(3)) // 2)
+    return wall, modules
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure octorecon.py startup and import cost with python -X importtime.')
+    parser.add_argument('--runs', type=int, default=5, help='Runs per command (the median is reported). Default: 5.')
+    parser.add_argument('--top', type=int, default=10, help='Heaviest top-level imports to list. Default: 10.')
+    parser.add_argument('--sample', help='History database or CSV used for the --diagnose run (skipped when omitted).')
+    args = parser.parse_args()
+
+    commands = [('--help', ['--help'])]
+    if args.sample: commands.append(('--diagnose', [args.sample, '--diagnose', '--no-cache']))
+
+    for label, command in commands:
+        runs = [run_once(command) for _ in range(args.runs)]
+        walls = [wall for wall, _ in runs]
+        modules = runs[-1][1]
+        top_level = sorted(((cumulative, name) for name, (_, cumulative, depth) in modules.items() if depth == 0), reverse=True)
+        print(f"octorecon.py {label}: median {statistics.median(walls) * 1000:.0f} ms wall, "
+              f"min {min(walls) * 1000:.0f} ms, {sum(c for c, _ in top_level) / 1000:.0f} ms importing {len(modules)} modules")
+        loaded = [name for name in HEAVY_MODULES if name in modules]
+        print(f"  heavy modules loaded: {', '.join(loaded) if loaded else 'none'}")
+        for cumulative, name in top_level[:args.top]: print(f"  {cumulative / 1000:8.1f} ms  {name}")
+        print()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Memory benchmark for octorecon.py's analyzed frame
+Analyzes a History file/CSV (or a synthetic urls table) and reports bytes per row of the result, column by column,
+in the compact layout the analyzer emits and in the previous all-object layout (object strings, int64 counts and
+hour, a stored 'date' column), so regressions in the per-row footprint show up.
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import pandas as pd
+import octorecon
+import synthetic_history
+
+def legacy_layout(df):
+    # The frame as the analyzer built it before compact_result_frame
+    df = df.copy()
+    for column in df.columns:
+        if isinstance(df[column].dtype, pd.CategoricalDtype): df[column] = df[column].to_numpy(dtype=object)
+    for column in ('hour', 'visit_count', 'typed_count'): df[column] = df[column].astype('int64')
+    df.insert(df.columns.get_loc('hour'), 'date', df['datetime'].dt.date.to_numpy(dtype=object))
+    return df
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure bytes per analyzed row of octorecon.py result frames.')
+    parser.add_argument('--sample', help='History database or CSV to analyze. Default: a synthetic urls table.')
+    parser.add_argument('--rows', type=int, default=200000, help='Rows of the synthetic urls table (see synthetic_history.py). Default: 200000.')
+    parser.add_argument('--visits', action='store_true', help='Analyze the History visits table (with --sample).')
+    args = parser.parse_args()
+
+    analyzer = octorecon.BrowserHistoryAnalyzer('09:00', '17:00', octorecon.parse_work_days_arg('M,T,W,Th,F'),
+                                                synthetic_history.WORK_KEYWORDS.split(','))
+    if args.sample: df = analyzer.analyze_file(args.sample, visits=args.visits)
+    else: df = octorecon.concat_results([analyzer.analyze_dataframe(urls) for urls, _ in synthetic_history.HistoryGenerator(args.rows).chunks()])
+    if df.empty: print("Nothing analyzed."); return
+
+    layouts = [('before', legacy_layout(df)), ('after', df)]
+    usage = {label: frame.memory_usage(deep=True, index=False) for label, frame in layouts}
+    print(f"{len(df)} analyzed rows")
+    print(f"  {'column':<22}{'before':>10}{'after':>10}  bytes/row")
+    for column in usage['before'].index:
+        after = usage['after'].get(column)
+        print(f"  {column:<22}{usage['before'][column] / len(df):>10.1f}{'-' if after is None else f'{after / len(df):.1f}':>10}")
+    before, after = usage['before'].sum() / len(df), usage['after'].sum() / len(df)
+    print(f"  {'total':<22}{before:>10.1f}{after:>10.1f}  ({before / after:.1f}x smaller, {usage['after'].sum() / 2**20:.1f} MiB)")
+
+if __name__ == "__main__":
+    main()
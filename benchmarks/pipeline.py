@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+Pipeline benchmark for octorecon.py
+Generates a synthetic history (see synthetic_history.py) and times each stage of the analysis separately: reading
+the CSV and the History database, timestamp parsing, categorization, inappropriate-keyword matching, work-hours
+marking, the end-to-end analyze_csv/--visits runs and generate_report. Reports seconds, rows/sec and peak traced
+memory per stage, and saves them as JSON; --compare against an earlier JSON flags stages that got slower.
+"""
+
+import argparse
+import contextlib
+import datetime
+import gc
+import hashlib
+import io
+import json
+import os
+import platform
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import numpy as np
+import pandas as pd
+import octorecon
+import synthetic_history
+
+STAGES = ['read_csv', 'read_history', 'timestamps', 'categorize', 'inappropriate', 'work_hours', 'analyze_csv', 'analyze_visits', 'report']
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def git_commit():
+    try: return subprocess.run(['git', '-C', REPO_DIR, 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError): return None
+
+def dataset_paths(args, data_dir):
+    # Files are named after the generator settings, so a --data-dir is reused across runs and commits
+    settings = [args.rows, args.mix, args.url_length, args.visits_per_url, args.days, args.end, args.inappropriate_share, args.seed, args.timezone]
+    key = hashlib.sha256(json.dumps(settings).encode('utf-8')).hexdigest()[:12]
+    base = os.path.join(data_dir, f"history-{args.rows}-{key}")
+    return base + '.csv', base + '.sqlite'
+
+def stage_steps(ctx, analyzer, engine, report_dir, paged_tables):
+    # name -> (untimed setup, timed step); each step may leave inputs for later stages in ctx
+    def categorize():
+        urls = ctx['urls']
+        if engine == 'columnar': ctx['categories'] = analyzer.categorize_url_column(urls)
+        else: ctx['categories'] = pd.Series([analyzer.categorize_url(u) for u in urls], index=urls.index, dtype=object)
+
+    def inappropriate():
+        if engine == 'columnar':
+            decoded = octorecon.decode_urls(ctx['urls'])
+            return analyzer.is_inappropriate_column(decoded.str.lower(), ctx['categories'], octorecon.split_urls(decoded)['netloc'].str.lower())
+        return [analyzer.is_inappropriate(u, c, d) for u, c, d in zip(ctx['urls'], ctx['categories'], ctx['domains'])]
+
+    def inappropriate_setup():
+        if 'categories' not in ctx: categorize()
+        if engine == 'rows': ctx['domains'] = octorecon.split_urls(ctx['urls'])['netloc'].str.lower()
+
+    def timestamps():
+        if engine == 'columnar': ctx['datetimes'] = analyzer.parse_timestamp_column(ctx['raw']['last_visit_time'])
+        else: ctx['datetimes'] = [analyzer.parse_timestamp(ts) for ts in ctx['raw']['last_visit_time']]
+
+    def work_hours():
+        if engine == 'columnar': return analyzer.is_work_hours_column(ctx['datetimes'])
+        return [analyzer.is_work_hours(dt) for dt in ctx['datetimes']]
+
+    def read_csv():
+        ctx['raw'] = pd.read_csv(ctx['csv'], on_bad_lines='skip', low_memory=False)
+        ctx['urls'] = ctx['raw']['url'].astype(str)
+
+    def analyze_csv(): ctx['analyzed'] = analyzer.analyze_csv(ctx['csv'], engine)
+
+    def report(): analyzer.generate_report(ctx['analyzed'], os.path.join(report_dir, 'report.html'), paged_tables=paged_tables)
+
+    def needs(*keys):
+        def setup():
+            if 'raw' in keys and 'raw' not in ctx: read_csv()
+            if 'datetimes' in keys and 'datetimes' not in ctx: timestamps()
+            if 'analyzed' in keys and 'analyzed' not in ctx: analyze_csv()
+        return setup
+
+    return {
+        'read_csv': (needs(), read_csv),
+        'read_history': (needs(), lambda: pd.concat(list(octorecon.iter_history_db(ctx['sqlite'])), ignore_index=True)),
+        'timestamps': (needs('raw'), timestamps),
+        'categorize': (needs('raw'), categorize),
+        'inappropriate': (lambda: (needs('raw')(), inappropriate_setup()), inappropriate),
+        'work_hours': (needs('raw', 'datetimes'), work_hours),
+        'analyze_csv': (needs(), analyze_csv),
+        'analyze_visits': (needs(), lambda: analyzer.analyze_history_db(ctx['sqlite'], engine, visits=True)),
+        'report': (needs('analyzed'), report),
+    }
+
+def measure(setup, step, repeat, memory):
+    # -> (best wall seconds of `repeat` runs, peak traced bytes of one more run or None)
+    with contextlib.redirect_stdout(io.StringIO()):
+        setup()
+        best = None
+        for _ in range(repeat):
+            gc.collect()
+            start = time.perf_counter()
+            step()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        peak = None
+        if memory:
+            gc.collect()
+            tracemalloc.start()
+            try:
+                step()
+                peak = tracemalloc.get_traced_memory()[1]
+            finally: tracemalloc.stop()
+    return best, peak
+
+def max_rss_kb():
+    # Peak resident memory of the whole run (not available on Windows)
+    try:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    except ImportError: return None
+
+def compare(results, baseline, threshold):
+    # Prints per-stage speed against baseline; returns the stages slower by more than threshold (a fraction)
+    slower = []
+    print(f"\nCompared with {baseline.get('commit') or 'baseline'} ({baseline.get('timestamp', '?')}):")
+    for name, stage in results['stages'].items():
+        base = baseline.get('stages', {}).get(name)
+        if not base or not base.get('seconds'): continue
+        ratio = stage['seconds'] / base['seconds']
+        mark = '  SLOWER' if ratio > 1 + threshold else ''
+        memory = ''
+        if stage.get('peak_bytes') and base.get('peak_bytes'): memory = f", memory {stage['peak_bytes'] / base['peak_bytes']:.2f}x"
+        print(f"  {name:<16} {base['seconds']:8.3f}s -> {stage['seconds']:8.3f}s  ({ratio:.2f}x time{memory}){mark}")
+        if mark: slower.append(name)
+    return slower
+
+def main():
+    parser = argparse.ArgumentParser(description='Time each stage of the octorecon.py pipeline on a synthetic history.')
+    synthetic_history.add_generator_arguments(parser)
+    parser.add_argument('--stages', default=','.join(STAGES), help=f'Comma-separated stages to run. Default: {",".join(STAGES)}.')
+    parser.add_argument('--engine', choices=octorecon.ANALYSIS_ENGINES, default='columnar', help='Analysis engine to time. Default: columnar.')
+    parser.add_argument('--repeat', type=int, default=1, help='Timed runs per stage (the fastest is reported). Default: 1.')
+    parser.add_argument('--no-memory', action='store_true', help='Skip the extra tracemalloc run per stage that measures peak memory.')
+    parser.add_argument('--paged-tables', action='store_true', help='Time the report with --paged-tables.')
+    parser.add_argument('--data-dir', help='Keep the generated files here and reuse them on later runs with the same settings.')
+    parser.add_argument('--json', metavar='FILE', help='Save the results as JSON.')
+    parser.add_argument('--compare', metavar='FILE', help='JSON of an earlier run; stages more than --threshold slower are flagged (exit status 1).')
+    parser.add_argument('--threshold', type=float, default=0.1, help='Slowdown tolerated by --compare, as a fraction. Default: 0.1.')
+    args = parser.parse_args()
+    stages = [s.strip() for s in args.stages.split(',') if s.strip()]
+    unknown = [s for s in stages if s not in STAGES]
+    if unknown: parser.error(f"unknown stages: {', '.join(unknown)} (choose from {', '.join(STAGES)})")
+    if args.rows < 1 or args.repeat < 1: parser.error('--rows and --repeat must be positive')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = args.data_dir or tmp
+        os.makedirs(data_dir, exist_ok=True)
+        csv_path, sqlite_path = dataset_paths(args, data_dir)
+        if not (os.path.exists(csv_path) and os.path.exists(sqlite_path)):
+            start = time.perf_counter()
+            urls, visits = synthetic_history.write_history(synthetic_history.generator_from_args(args), csv_path + '.tmp', sqlite_path + '.tmp')
+            os.replace(csv_path + '.tmp', csv_path)
+            os.replace(sqlite_path + '.tmp', sqlite_path)
+            print(f"Generated {urls} URLs and {visits} visits in {time.perf_counter() - start:.1f}s")
+        with sqlite3.connect(sqlite_path) as conn: visit_rows = conn.execute('SELECT COUNT(*) FROM visits').fetchone()[0]
+
+        analyzer = octorecon.BrowserHistoryAnalyzer('09:00', '17:00', octorecon.parse_work_days_arg('M,T,W,Th,F'),
+                                                    synthetic_history.WORK_KEYWORDS.split(','), timezone=args.timezone)
+        ctx = {'csv': csv_path, 'sqlite': sqlite_path}
+        steps = stage_steps(ctx, analyzer, args.engine, tmp, args.paged_tables)
+        results = {'commit': git_commit(), 'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+                   'python': platform.python_version(), 'pandas': pd.__version__, 'numpy': np.__version__,
+                   'platform': platform.platform(), 'cpus': os.cpu_count(), 'engine': args.engine,
+                   'settings': {k: getattr(args, k) for k in ('rows', 'mix', 'url_length', 'visits_per_url', 'days', 'end', 'inappropriate_share', 'seed', 'timezone', 'repeat', 'paged_tables')},
+                   'visits': visit_rows, 'stages': {}}
+        print(f"{'stage':<16}{'seconds':>10}{'rows/sec':>14}{'peak MiB':>10}")
+        for name in stages:
+            seconds, peak = measure(*steps[name], args.repeat, not args.no_memory)
+            rows = visit_rows if name == 'analyze_visits' else args.rows
+            results['stages'][name] = {'seconds': round(seconds, 6), 'rows': rows, 'rows_per_sec': round(rows / seconds, 1) if seconds else None, 'peak_bytes': peak}
+            print(f"{name:<16}{seconds:>10.3f}{rows / seconds if seconds else float('inf'):>14,.0f}{'-' if peak is None else f'{peak / 2**20:.1f}':>10}")
+        results['max_rss_kb'] = max_rss_kb()
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f: json.dump(results, f, indent=2)
+        print(f"Results: {args.json}")
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f: baseline = json.load(f)
+        if compare(results, baseline, args.threshold): sys.exit(1)
+
+if __name__ == "__main__":
+    main()
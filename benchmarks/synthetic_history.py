@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Synthetic Chromium/Brave history generator for the octorecon.py benchmarks
+Writes a `urls` CSV export and/or a SQLite file with the History schema (urls, visits, meta), at any scale, offline
+and reproducibly (--seed). Domains are drawn from the analyzer's own category rules so the category mix is what
+octorecon.py will find; URL lengths, visits per URL and the spread of visit times are configurable.
+"""
+
+import argparse
+import csv
+import os
+import sqlite3
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import numpy as np
+import pandas as pd
+import octorecon
+
+DEFAULT_MIX = 'other=0.45,work=0.15,social_media=0.1,streaming=0.08,shopping=0.08,news=0.06,gaming=0.04,infrastructure_internal=0.03,adult=0.01'
+WORK_DOMAINS = ['jira.mycorp.com', 'wiki.mycorp.com', 'mail.mycorp.com', 'mycorp.atlassian.net', 'intranet.mycorp.com']
+WORK_KEYWORDS = 'mycorp.com,mycorp.atlassian'  # pass to octorecon.py so the 'work' share is recognized
+CHUNK_URLS = 100000
+# Relative visit activity per hour of day: quiet nights, a working-day plateau, an evening bump
+HOUR_WEIGHTS = np.array([1, 1, 1, 1, 1, 2, 4, 8, 14, 16, 16, 14, 12, 15, 16, 15, 13, 10, 9, 10, 10, 8, 5, 2], dtype=float)
+PATH_WORDS = np.array(['account', 'search', 'watch', 'item', 'article', 'view', 'profile', 'browse', 'docs', 'issues',
+                       'results', 'video', 'cart', 'thread', 'post', 'page', 'dashboard', 'settings', 'news', 'login'])
+FILLER = 'q7w2e9r4t1y8u3i6o5p0a2s4d6f8g1h3j5k7l9z0' * 50  # path padding that matches no rule or keyword
+TRANSITIONS = np.array([0x30000000, 0x30000001, 0x10000008])  # link, typed, reload (with chain start/end bits)
+URLS_SCHEMA = """CREATE TABLE urls(id INTEGER PRIMARY KEY AUTOINCREMENT,url LONGVARCHAR,title LONGVARCHAR,
+    visit_count INTEGER DEFAULT 0 NOT NULL,typed_count INTEGER DEFAULT 0 NOT NULL,last_visit_time INTEGER NOT NULL,
+    hidden INTEGER DEFAULT 0 NOT NULL)"""
+VISITS_SCHEMA = """CREATE TABLE visits(id INTEGER PRIMARY KEY AUTOINCREMENT,url INTEGER NOT NULL,visit_time INTEGER NOT NULL,
+    from_visit INTEGER,transition INTEGER DEFAULT 0 NOT NULL,segment_id INTEGER,visit_duration INTEGER DEFAULT 0 NOT NULL,
+    incremented_omnibox_typed_score BOOLEAN DEFAULT FALSE NOT NULL)"""
+HISTORY_INDEXES = ['CREATE INDEX urls_url_index ON urls (url)', 'CREATE INDEX visits_url_index ON visits (url)',
+                   'CREATE INDEX visits_time_index ON visits (visit_time)', 'CREATE INDEX visits_from_index ON visits (from_visit)']
+CSV_COLUMNS = ['id', 'url', 'title', 'visit_count', 'typed_count', 'last_visit_time', 'hidden']
+
+def parse_mix(mix):
+    # "category=share,..." -> (categories, probabilities normalized to 1)
+    shares = {}
+    for item in mix.split(','):
+        name, _, share = item.partition('=')
+        shares[name.strip()] = float(share)
+    total = sum(shares.values())
+    if total <= 0: raise ValueError("Category mix shares must add up to more than 0.")
+    return list(shares), np.array(list(shares.values())) / total
+
+def category_hosts():
+    # Host names per category, taken from the analyzer's plain domain keywords (not regexes, nor host/path
+    # keywords such as abc.net.au/news, which the host and path rules never match as a whole)
+    analyzer = octorecon.BrowserHistoryAnalyzer('09:00', '17:00', ['M'])
+    hosts = {}
+    for category, keywords in analyzer.patterns.items():
+        plain = [k for k in keywords if '.' in k and not any(c in k for c in '^$\\[/')]
+        hosts[category] = [h if h.count('.') > 1 else 'www.' + h for h in plain] or [f'www.{k}.com' for k in keywords if k.isalnum()]
+    hosts['infrastructure_internal'] += ['192.168.1.1', '10.0.0.12', '172.16.4.20', 'localhost']
+    hosts['work'] = WORK_DOMAINS
+    hosts['other'] = [f"www.{word}{i}.{tld}" for i, (word, tld) in enumerate(zip(np.resize(PATH_WORDS, 5000), ['com', 'org', 'net', 'com.au', 'io'] * 1000))]
+    return {category: np.array(names) for category, names in hosts.items()}
+
+class HistoryGenerator:
+    # Generates `urls` rows (and their `visits`) chunk by chunk, so 10M-row histories never sit in memory whole
+    def __init__(self, rows, mix=DEFAULT_MIX, url_length=70, visits_per_url=3.0, days=90, end=None,
+                 inappropriate_share=0.01, seed=0, timezone=octorecon.DEFAULT_TIMEZONE):
+        self.rows, self.url_length, self.visits_per_url, self.days = rows, url_length, visits_per_url, days
+        self.inappropriate_share = inappropriate_share
+        self.categories, self.probabilities = parse_mix(mix)
+        hosts = category_hosts()
+        unknown = [c for c in self.categories if c not in hosts]
+        if unknown: raise ValueError(f"Unknown categories in mix: {', '.join(unknown)}. Known: {', '.join(sorted(hosts))}.")
+        self.hosts = [hosts[c] for c in self.categories]
+        # Days end at local midnight of `timezone` (its UTC offset at the end date), so HOUR_WEIGHTS are local hours
+        end = pd.Timestamp(end or '2026-01-01', tz=timezone)
+        self.end_us = end.value // 1000 + octorecon.WEBKIT_EPOCH_OFFSET_US
+        self.rng = np.random.default_rng(seed)
+        self.keywords = np.array(sorted(octorecon.BrowserHistoryAnalyzer('09:00', '17:00', ['M']).inappropriate_keywords))
+
+    def _urls(self, n):
+        rng = self.rng
+        category_ids = rng.choice(len(self.categories), n, p=self.probabilities)
+        hosts = np.empty(n, dtype=object)
+        for i, pool in enumerate(self.hosts):
+            picked = category_ids == i
+            # Zipf-like popularity: a few hosts of each category get most of its URLs
+            hosts[picked] = pool[np.minimum(rng.zipf(1.5, picked.sum()) - 1, len(pool) - 1)]
+        path_lengths = np.maximum(rng.lognormal(np.log(max(self.url_length - 30, 4)), 0.6, n).astype(int), 1)
+        words = PATH_WORDS[rng.integers(0, len(PATH_WORDS), n)]
+        flagged = rng.random(n) < self.inappropriate_share
+        slugs = [f"{w}/{FILLER[:max(length - len(w), 0)]}" for w, length in zip(words, path_lengths)]
+        for i in np.flatnonzero(flagged): slugs[i] = f"{words[i]}/{self.keywords[rng.integers(len(self.keywords))]}-{slugs[i]}"
+        ids = rng.integers(0, 10 ** 9, n)
+        return [f"https://{h}/{s}?id={i}" for h, s, i in zip(hosts, slugs, ids)]
+
+    def _visit_times(self, n):
+        # Uniform day within the window, hour of day from HOUR_WEIGHTS, uniform within the hour
+        rng = self.rng
+        day = rng.integers(0, self.days, n)
+        hour = rng.choice(24, n, p=HOUR_WEIGHTS / HOUR_WEIGHTS.sum())
+        within = rng.integers(0, 3600 * 1000000, n)
+        return self.end_us - (day + 1) * 86400 * 1000000 + hour * 3600 * 1000000 + within
+
+    def chunks(self):
+        # Yields (urls frame, visits frame) with History column names, ids continuing across chunks
+        next_url_id, next_visit_id = 1, 1
+        for start in range(0, self.rows, CHUNK_URLS):
+            n = min(CHUNK_URLS, self.rows - start)
+            counts = np.maximum(self.rng.poisson(max(self.visits_per_url - 1, 0), n) + 1, 1)
+            url_ids = np.arange(next_url_id, next_url_id + n)
+            visit_url = np.repeat(url_ids, counts)
+            visit_time = self._visit_times(len(visit_url))
+            last_visit = pd.Series(visit_time).groupby(visit_url).max().to_numpy()
+            urls = pd.DataFrame({'id': url_ids, 'url': self._urls(n), 'title': [f"Page {i}" for i in url_ids],
+                                 'visit_count': counts, 'typed_count': self.rng.binomial(counts, 0.05),
+                                 'last_visit_time': last_visit, 'hidden': 0})
+            visits = pd.DataFrame({'id': np.arange(next_visit_id, next_visit_id + len(visit_url)), 'url': visit_url,
+                                   'visit_time': visit_time, 'from_visit': 0,
+                                   'transition': self.rng.choice(TRANSITIONS, len(visit_url)),
+                                   'segment_id': 0, 'visit_duration': self.rng.exponential(60e6, len(visit_url)).astype('int64'),
+                                   'incremented_omnibox_typed_score': 0})
+            next_url_id += n
+            next_visit_id += len(visit_url)
+            yield urls, visits
+
+def write_history(generator, csv_path=None, sqlite_path=None):
+    # Writes the generator's rows as a urls CSV export and/or a History SQLite file; returns (urls, visits) written
+    for path in (csv_path, sqlite_path):
+        if path and os.path.exists(path): os.remove(path)
+    conn = None
+    if sqlite_path:
+        conn = sqlite3.connect(sqlite_path)
+        conn.execute('PRAGMA journal_mode=OFF')
+        conn.execute('PRAGMA synchronous=OFF')
+        conn.execute('CREATE TABLE meta(key LONGVARCHAR NOT NULL UNIQUE PRIMARY KEY, value LONGVARCHAR)')
+        conn.executemany('INSERT INTO meta VALUES (?, ?)', [('version', '67'), ('last_compatible_version', '16')])
+        conn.execute(URLS_SCHEMA)
+        conn.execute(VISITS_SCHEMA)
+    url_total = visit_total = 0
+    try:
+        for urls, visits in generator.chunks():
+            if csv_path: urls[CSV_COLUMNS].to_csv(csv_path, mode='a', header=url_total == 0, index=False, quoting=csv.QUOTE_MINIMAL)
+            if conn is not None:
+                conn.executemany('INSERT INTO urls VALUES (?, ?, ?, ?, ?, ?, ?)', urls[CSV_COLUMNS].itertuples(index=False, name=None))
+                conn.executemany('INSERT INTO visits VALUES (?, ?, ?, ?, ?, ?, ?, ?)', visits.itertuples(index=False, name=None))
+            url_total += len(urls)
+            visit_total += len(visits)
+        if conn is not None:
+            for statement in HISTORY_INDEXES: conn.execute(statement)
+            conn.commit()
+    finally:
+        if conn is not None: conn.close()
+    return url_total, visit_total
+
+def add_generator_arguments(parser):
+    parser.add_argument('--rows', type=int, default=100000, help='Rows of the urls table (10k to 10M and beyond). Default: 100000.')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help=f'Category mix as "category=share,...". Default: {DEFAULT_MIX}.')
+    parser.add_argument('--url-length', type=int, default=70, help='Typical URL length in characters (log-normally spread). Default: 70.')
+    parser.add_argument('--visits-per-url', type=float, default=3.0, help='Mean visits per URL in the visits table. Default: 3.')
+    parser.add_argument('--days', type=int, default=90, help='Days of history the visit times are spread over. Default: 90.')
+    parser.add_argument('--end', default='2026-01-01', help='Date (UTC) the history ends at. Default: 2026-01-01.')
+    parser.add_argument('--inappropriate-share', type=float, default=0.01, help='Share of URLs carrying an inappropriate keyword. Default: 0.01.')
+    parser.add_argument('--timezone', default=octorecon.DEFAULT_TIMEZONE, help=f'Timezone whose hours of day the visit times follow. Default: {octorecon.DEFAULT_TIMEZONE}.')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed; the same arguments and seed give the same files. Default: 0.')
+
+def generator_from_args(args):
+    return HistoryGenerator(args.rows, args.mix, args.url_length, args.visits_per_url, args.days, args.end, args.inappropriate_share, args.seed, args.timezone)
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic Chromium/Brave history (urls CSV and/or History SQLite).')
+    add_generator_arguments(parser)
+    parser.add_argument('--csv', help='Write the urls table as a CSV export to this path.')
+    parser.add_argument('--sqlite', help='Write a History SQLite file (urls, visits, meta) to this path.')
+    args = parser.parse_args()
+    if not args.csv and not args.sqlite: parser.error('give --csv and/or --sqlite')
+    if args.rows < 1: parser.error('--rows must be positive')
+    start = time.perf_counter()
+    try: urls, visits = write_history(generator_from_args(args), args.csv, args.sqlite)
+    except ValueError as e: print(f"Error: {e}"); return
+    print(f"Generated {urls} URLs and {visits} visits in {time.perf_counter() - start:.1f}s "
+          f"(--work-keywords {WORK_KEYWORDS} makes the 'work' share count as work)")
+
+if __name__ == "__main__":
+    main()
@@ -6,28 +6,1885 @@ Analyzes Brave browser history for workplace investigation
 
 import csv
 import argparse
+import bisect
 import datetime
 import pytz
-import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
-from urllib.parse import urlparse, unquote
-import numpy as np
+from urllib.parse import urlparse, unquote, quote, uses_params, parse_qs
 import re 
 import os
+import sys
+import time
+import json
+import hashlib
+import io
+import itertools
+import collections
+import pickle
+import glob
+import shutil
 import html
+import sqlite3
 import traceback
+import threading
+from contextlib import closing, contextmanager, nullcontext, redirect_stdout
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+import importlib.util
+
+def lazy_import(name):
+    # The module's code runs on first attribute access, so --help, --diagnose and the like never pay for pandas/seaborn
+    if name in sys.modules: return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    spec.loader = importlib.util.LazyLoader(spec.loader)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+def load_lazy_modules(*modules):
+    # Runs the deferred imports of lazy_import modules now (any attribute access does; __dict__ has no side effects)
+    for module in modules: module.__dict__
+
+pd = lazy_import('pandas')
+np = lazy_import('numpy')
+sns = lazy_import('seaborn')  # imports pyplot when first used; render_chart selects the Agg backend before that
+
+ANALYSIS_ENGINES = ('columnar', 'rows')
+DEFAULT_CHUNKSIZE = 100000
+SQLITE_HEADER = b'SQLite format 3\x00'
+HISTORY_URL_COLUMNS = ['id', 'url', 'visit_count', 'typed_count', 'last_visit_time']
+HISTORY_VISIT_COLUMNS = ['id', 'url', 'visit_time', 'transition', 'visit_duration']
+# Firefox visit_type -> Chromium core transition (link, typed, auto_bookmark, auto_subframe, manual_subframe, reload);
+# redirects and downloads count as links
+FIREFOX_TRANSITIONS = {1: 0, 2: 1, 3: 2, 4: 3, 5: 0, 6: 0, 7: 0, 8: 4, 9: 8}
+WEBKIT_EPOCH = datetime.datetime(1601, 1, 1, tzinfo=datetime.timezone.utc)  # History timestamps: microseconds since then
+WEBKIT_EPOCH_OFFSET_US = 11644473600 * 1000000  # WebKit -> Unix epoch
+# Usable WebKit range: a day inside datetime.min/max, so converting to any timezone cannot overflow
+MIN_WEBKIT_US = (datetime.datetime(1, 1, 2, tzinfo=datetime.timezone.utc) - WEBKIT_EPOCH) // datetime.timedelta(microseconds=1)
+MAX_WEBKIT_US = (datetime.datetime(9999, 12, 31, tzinfo=datetime.timezone.utc) - WEBKIT_EPOCH) // datetime.timedelta(microseconds=1)
+DEFAULT_TIMEZONE = 'Australia/Sydney'
+SECOND_LEVEL_LABELS = ('com', 'co', 'org', 'net', 'gov', 'edu', 'ac')  # fallback when the Public Suffix List is missing
+PUBLIC_SUFFIX_LIST_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'public_suffix_list.dat')
+DOMAIN_CACHE_SIZE = 65536  # distinct netlocs memoized by RuleEngine.resolve_domain
+DAY_ABBREVIATIONS = ['M', 'T', 'W', 'Th', 'F', 'Sa', 'Su']
+DAY_ALIASES = {'M': 'M', 'MON': 'M', 'TU': 'T', 'TUE':'T', 'T': 'T', 'W': 'W', 'WED':'W', 
+               'TH': 'Th', 'THU':'Th', 'F': 'F', 'FRI':'F', 'SA': 'Sa', 'SAT':'Sa', 'SU': 'Su', 'SUN':'Su'}
+TIME_OF_DAY_FORMATS = ["%H:%M", "%I:%M%p", "%H", "%I%p"]
+CATEGORY_CHECK_ORDER = ['infrastructure_internal', 'adult', 'streaming', 'shopping', 'gaming', 'social_media', 'news']
+DOMAIN_ONLY_CATEGORIES = ('infrastructure_internal', 'adult')  # their keywords are not matched against path/query
+WEEKDAY_NAMES = [datetime.date(2024, 1, 1 + i).strftime('%A') for i in range(7)]  # Monday first, as dt.weekday()
+# urllib.parse.urlsplit as a regex, so netloc/path/query can be pulled out of a whole column at once
+URL_SPLIT_PATTERN = r'^(?:(?P<scheme>[A-Za-z][A-Za-z0-9+.\-]*):)?(?://(?P<netloc>[^/?#]*))?(?P<path>[^?#]*)(?:\?(?P<query>[^#]*))?'
+URL_LEADING_STRIP_CHARS = ''.join(chr(c) for c in range(0x21))
+RULESET_VERSION = 2  # bump when matching semantics change, so cached categorizations are not reused
+DEFAULT_CACHE_PATH = os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'), 'octorecon', 'url_categories.sqlite')
+DEFAULT_CACHE_SIZE = 2000000
+
+def parse_time_of_day(value):
+    for fmt in TIME_OF_DAY_FORMATS:
+        try: return datetime.datetime.strptime(value.upper().replace(" ", ""), fmt).time()
+        except ValueError: pass
+    return None
+
+def parse_work_days_arg(days_string):
+    work_days_list = []
+    for day_in in [day.strip().upper() for day in days_string.split(',')]:
+        normalized_day = DAY_ALIASES.get(day_in, None)
+        if normalized_day: work_days_list.append(normalized_day)
+        else: print(f"Warning: Work day '{day_in}' not recognized.")
+    return sorted(set(work_days_list), key=DAY_ABBREVIATIONS.index)
+
+def parse_shift_arg(shift_string):
+    # "name=DAYS@START-END", e.g. "night=F,Sa@22:00-06:00"; the name is optional
+    match = re.fullmatch(r'\s*(?:([^=@]+?)\s*=)?\s*([^@]+?)\s*@\s*([^-]+?)\s*-\s*([^-]+?)\s*', shift_string)
+    if not match: raise ValueError(f"Shift '{shift_string}' not in 'name=DAYS@START-END' format (e.g. 'night=F,Sa@22:00-06:00').")
+    name, days, start_time, end_time = match.groups()
+    return (name, parse_work_days_arg(days), start_time, end_time)
+
+class WorkSchedule:
+    # Work-hours config parsed once: one (name, weekday bitmask, start minute, end minute) per shift,
+    # compiled into a weekday x minute-of-day lookup table so membership is a single index operation.
+    # A shift whose end is not after its start runs overnight into the next day.
+    MINUTES_PER_DAY = 24 * 60
+
+    def __init__(self, shifts):
+        self.shifts, self.labels = [], []
+        for name, work_days, start_time, end_time in shifts:
+            parsed_start_time, parsed_end_time = parse_time_of_day(start_time), parse_time_of_day(end_time)
+            for value, parsed in ((start_time, parsed_start_time), (end_time, parsed_end_time)):
+                if parsed is None:
+                    raise ValueError(f"Invalid time '{value}'{f' in shift {name!r}' if name else ''}. Use e.g. \"09:00\", \"9am\", \"9:30pm\" or \"13\".")
+            day_mask = 0
+            for d_abbr in work_days:
+                if d_abbr in DAY_ABBREVIATIONS: day_mask |= 1 << DAY_ABBREVIATIONS.index(d_abbr)
+            if not day_mask: raise ValueError(f"No valid work days{f' in shift {name!r}' if name else ''}.")
+            self.shifts.append((name, day_mask, parsed_start_time.hour * 60 + parsed_start_time.minute,
+                                parsed_end_time.hour * 60 + parsed_end_time.minute))
+            self.labels.append(f"{f'{name}: ' if name else ''}{start_time} - {end_time} ({', '.join(work_days)})")
+
+        self.minute_table = bytearray(7 * self.MINUTES_PER_DAY)  # 0/1 per minute; plain bytes so numpy is not needed here
+        for _, day_mask, start_minute, end_minute in self.shifts:
+            for day in range(7):
+                if not day_mask >> day & 1: continue
+                day_start = day * self.MINUTES_PER_DAY
+                if end_minute > start_minute:
+                    self.minute_table[day_start + start_minute:day_start + end_minute] = b'\x01' * (end_minute - start_minute)
+                else:
+                    self.minute_table[day_start + start_minute:day_start + self.MINUTES_PER_DAY] = b'\x01' * (self.MINUTES_PER_DAY - start_minute)
+                    next_day_start = (day + 1) % 7 * self.MINUTES_PER_DAY
+                    self.minute_table[next_day_start:next_day_start + end_minute] = b'\x01' * end_minute
+
+    def describe(self):
+        return '; '.join(self.labels)
+
+    def contains(self, dt):
+        return bool(self.minute_table[dt.weekday() * self.MINUTES_PER_DAY + dt.hour * 60 + dt.minute])
+
+    def mask(self, datetimes, minutes=None):
+        # Batch form of contains() for a datetime Series: integer index math plus one table lookup
+        if minutes is None: minutes = local_minutes(datetimes)
+        minute_index = weekday_codes(minutes) * self.MINUTES_PER_DAY + minutes % self.MINUTES_PER_DAY
+        return pd.Series(np.frombuffer(self.minute_table, dtype=bool)[minute_index], index=datetimes.index)
+
+def is_missing(value):
+    # pd.isna() for a single value (None, NaN, NaT, pd.NA); keeps the per-row helpers usable without loading pandas
+    try: return value is None or bool(value != value)
+    except TypeError: return True
+
+def is_sqlite_file(path):
+    try:
+        with open(path, 'rb') as f: return f.read(len(SQLITE_HEADER)) == SQLITE_HEADER
+    except OSError: return False
+
+def open_history_db(db_path):
+    # immutable=1: read the file as-is without taking locks, so a History DB still held open by the browser works
+    return sqlite3.connect(Path(db_path).resolve().as_uri() + '?mode=ro&immutable=1', uri=True)
+
+def iter_history_db(db_path, chunksize=DEFAULT_CHUNKSIZE, since=None):
+    # since: (last_visit_time, id) high-water mark of an earlier run; only URLs visited or added after it are read
+    where, params = (" WHERE last_visit_time > ? OR id > ?", since) if since else ("", ())
+    return iter_query_chunks(db_path, f"SELECT {', '.join(HISTORY_URL_COLUMNS)} FROM urls{where}", params, HISTORY_URL_COLUMNS, chunksize)
+
+def iter_query_chunks(db_path, query, params, columns, chunksize):
+    with closing(open_history_db(db_path)) as conn:
+        cursor = conn.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(chunksize)
+            if not rows: break
+            yield pd.DataFrame.from_records(rows, columns=columns)
+
+def read_sample_rows(path, limit):
+    # -> (column names, up to `limit` rows as dicts) from a History database's urls table or a CSV export, using only
+    # sqlite3/csv so --diagnose starts without pandas. Empty CSV fields become None; CSV rows with extra fields are skipped.
+    if is_sqlite_file(path):
+        with closing(open_history_db(path)) as conn:
+            rows = conn.execute(f"SELECT {', '.join(HISTORY_URL_COLUMNS)} FROM urls LIMIT ?", (limit,)).fetchall()
+        return list(HISTORY_URL_COLUMNS), [dict(zip(HISTORY_URL_COLUMNS, row)) for row in rows]
+    with open(path, newline='', encoding='utf-8', errors='replace') as f:
+        reader = csv.reader(f)
+        columns = next(reader, [])
+        rows = []
+        for record in reader:
+            if len(rows) >= limit: break
+            if not record or len(record) > len(columns): continue
+            rows.append({column: value if value != '' else None for column, value in zip(columns, record)})
+    return columns, rows
+
+def history_high_water(db_path, visits=False):
+    # -> (largest visit time, largest id) of the urls (or visits) table; the next incremental run reads past it
+    table, time_column = ('visits', 'visit_time') if visits else ('urls', 'last_visit_time')
+    with closing(open_history_db(db_path)) as conn:
+        max_time, max_id = conn.execute(f"SELECT max({time_column}), max(id) FROM {table}").fetchone()
+    return (max_time or 0, max_id or 0)
+
+def iter_csv_chunks(csv_file, chunksize=DEFAULT_CHUNKSIZE):
+    with pd.read_csv(csv_file, on_bad_lines='skip', chunksize=chunksize) as reader: yield from reader
+
+def iter_history_visits(db_path, chunksize=DEFAULT_CHUNKSIZE, since=None):
+    # Walks visits_time_index, so chunks come out in visit order without a sort. since: (visit_time, id) high-water
+    # mark; only later visits (or ones added with a higher id) are read
+    where, params = (" WHERE visit_time > ? OR id > ?", since) if since else ("", ())
+    return iter_query_chunks(db_path, f"SELECT {', '.join(HISTORY_VISIT_COLUMNS)} FROM visits{where} ORDER BY visit_time, id", params, HISTORY_VISIT_COLUMNS, chunksize)
+
+class HistorySource:
+    # One browser history input. Every source yields chunks in the schema the analyzer reads: urls rows with
+    # HISTORY_URL_COLUMNS and visits rows with HISTORY_VISIT_COLUMNS, all times in WebKit microseconds.
+    kind, label, has_visits = None, 'history', True
+
+    def __init__(self, path): self.path = path
+    def sample_rows(self, limit): return read_sample_rows(self.path, limit)
+
+class ChromiumHistory(HistorySource):
+    # Chrome, Edge, Brave and other Chromium browsers share the History schema
+    kind, label = 'chromium', 'Chromium History database'
+
+    def iter_urls(self, chunksize=DEFAULT_CHUNKSIZE, since=None): return iter_history_db(self.path, chunksize, since)
+    def iter_visits(self, chunksize=DEFAULT_CHUNKSIZE, since=None): return iter_history_visits(self.path, chunksize, since)
+    def high_water(self, visits=False): return history_high_water(self.path, visits)
+
+class FirefoxHistory(HistorySource):
+    # places.sqlite: moz_places/moz_historyvisits with PRTime (Unix microsecond) times, shifted to WebKit in the query.
+    # Places never visited (bookmarks, ...) have no last visit date and are left out; visit types map to Chromium
+    # core transitions, and Firefox records no visit durations.
+    kind, label = 'firefox', 'Firefox places.sqlite database'
+    URLS_QUERY = (f"SELECT id, url, visit_count, typed, CASE WHEN last_visit_date = 0 THEN 0 ELSE last_visit_date + {WEBKIT_EPOCH_OFFSET_US} END "
+                  "FROM moz_places WHERE last_visit_date IS NOT NULL")
+    VISITS_QUERY = ("SELECT id, place_id, visit_date + {offset}, CASE visit_type {transitions} ELSE 0 END, 0 FROM moz_historyvisits"
+                    .format(offset=WEBKIT_EPOCH_OFFSET_US, transitions=' '.join(f"WHEN {k} THEN {v}" for k, v in FIREFOX_TRANSITIONS.items())))
+
+    def iter_urls(self, chunksize=DEFAULT_CHUNKSIZE, since=None):
+        where, params = (" AND (last_visit_date > ? OR id > ?)", (since[0] - WEBKIT_EPOCH_OFFSET_US, since[1])) if since else ("", ())
+        return iter_query_chunks(self.path, self.URLS_QUERY + where, params, HISTORY_URL_COLUMNS, chunksize)
+
+    def iter_visits(self, chunksize=DEFAULT_CHUNKSIZE, since=None):
+        where, params = (" WHERE visit_date > ? OR id > ?", (since[0] - WEBKIT_EPOCH_OFFSET_US, since[1])) if since else ("", ())
+        return iter_query_chunks(self.path, f"{self.VISITS_QUERY}{where} ORDER BY visit_date, id", params, HISTORY_VISIT_COLUMNS, chunksize)
+
+    def high_water(self, visits=False):
+        table, time_column = ('moz_historyvisits', 'visit_date') if visits else ('moz_places', 'last_visit_date')
+        with closing(open_history_db(self.path)) as conn:
+            max_time, max_id = conn.execute(f"SELECT max({time_column}), max(id) FROM {table}").fetchone()
+        return (max_time + WEBKIT_EPOCH_OFFSET_US if max_time else 0, max_id or 0)
+
+    def sample_rows(self, limit):
+        with closing(open_history_db(self.path)) as conn: rows = conn.execute(self.URLS_QUERY + " LIMIT ?", (limit,)).fetchall()
+        return list(HISTORY_URL_COLUMNS), [dict(zip(HISTORY_URL_COLUMNS, row)) for row in rows]
+
+class CsvHistory(HistorySource):
+    # A CSV export of a Chromium urls table; it has one row per URL and no visits
+    kind, label, has_visits = 'csv', 'CSV export', False
+
+    def iter_urls(self, chunksize=DEFAULT_CHUNKSIZE, since=None): return iter_csv_chunks(self.path, chunksize)
+
+class MergedHistory(HistorySource):
+    # Several profiles of one subject read as one history, in a single pass over each. URL rows are merged by URL
+    # (visit and typed counts added up, the latest visit kept) and renumbered. Visits are merged in time order, and a
+    # visit present in more than one profile (same URL and time, as in synced or copied profiles) is kept once.
+    kind = 'merged'
+
+    def __init__(self, sources):
+        self.sources = sources
+        self.path = ', '.join(str(source.path) for source in sources)
+        self.label = f"{len(sources)} merged histories"
+        self.has_visits = all(source.has_visits for source in sources)
+        self.urls, self.url_ids = None, None
+
+    def merge_urls(self, chunksize):
+        # -> the merged urls table; also sets url_ids, one Series per source mapping its url ids to the merged ones
+        if self.urls is not None: return self.urls
+        frames = []
+        for i, source in enumerate(self.sources):
+            for chunk in source.iter_urls(chunksize):
+                if not all(col in chunk.columns for col in ['url', 'last_visit_time']):
+                    raise ValueError(f"CSV must contain 'url' and 'last_visit_time'. Found: {list(chunk.columns)}")
+                webkit_us, parsed = webkit_microseconds(chunk['last_visit_time'])
+                frames.append(pd.DataFrame({
+                    'source': i, 'source_id': chunk['id'].to_numpy() if 'id' in chunk.columns else chunk.index.to_numpy(), 'url': chunk['url'].to_numpy(),
+                    'visit_count': count_values(chunk, 'visit_count'), 'typed_count': count_values(chunk, 'typed_count'),
+                    'last_visit_time': pd.arrays.IntegerArray(webkit_us, ~parsed),
+                }))
+        rows = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=['source', 'source_id', 'url', 'visit_count', 'typed_count', 'last_visit_time'])
+        groups = rows.groupby('url', sort=False, dropna=False)
+        urls = groups.agg(visit_count=('visit_count', 'sum'), typed_count=('typed_count', 'sum'), last_visit_time=('last_visit_time', 'max')).reset_index()
+        urls.insert(0, 'id', np.arange(1, len(urls) + 1, dtype='int64'))
+        merged_ids = groups.ngroup().to_numpy() + 1
+        self.url_ids = [pd.Series(merged_ids[mask], index=rows['source_id'][mask].to_numpy()) for mask in (rows['source'] == i for i in range(len(self.sources)))]
+        print(f"Merged {len(self.sources)} histories ({', '.join(source.label for source in self.sources)}): {len(rows)} URL rows -> {len(urls)} distinct URLs.")
+        self.urls = urls[HISTORY_URL_COLUMNS]
+        return self.urls
+
+    def iter_urls(self, chunksize=DEFAULT_CHUNKSIZE, since=None):
+        if since: raise ValueError("Incremental analysis (--state) needs a single history file, not merged profiles.")
+        urls = self.merge_urls(chunksize)
+        for start in range(0, len(urls), chunksize): yield urls.iloc[start:start + chunksize]
+
+    def iter_visits(self, chunksize=DEFAULT_CHUNKSIZE, since=None):
+        if since: raise ValueError("Incremental analysis (--state) needs a single history file, not merged profiles.")
+        self.merge_urls(chunksize)
+        streams = [self._renumbered_visits(source, url_ids, chunksize) for source, url_ids in zip(self.sources, self.url_ids)]
+        next_id, duplicates, last_time, last_urls = 1, 0, None, set()
+        for visits in merge_sorted_chunks(streams, 'visit_time'):
+            keep = ~visits.duplicated(['visit_time', 'url']).to_numpy()
+            # Copies of a visit at the last time of the previous chunk may follow in this one
+            if last_time is not None: keep &= ~((visits['visit_time'] == last_time) & visits['url'].isin(last_urls)).to_numpy()
+            duplicates += int((~keep).sum())
+            visits = visits[keep]
+            if visits.empty: continue
+            latest = visits['visit_time'].iloc[-1]
+            last_urls = set(visits.loc[visits['visit_time'] == latest, 'url']) | (last_urls if latest == last_time else set())
+            last_time = latest
+            visits = visits.assign(id=np.arange(next_id, next_id + len(visits), dtype='int64'))
+            next_id += len(visits)
+            yield visits.reset_index(drop=True)
+        if duplicates: print(f"Dropped {duplicates} visits found in more than one profile.")
+
+    @staticmethod
+    def _renumbered_visits(source, url_ids, chunksize):
+        # A source's visits with url ids replaced by merged ones (-1 for visits of URLs missing from its urls table)
+        for visits in source.iter_visits(chunksize):
+            positions = url_ids.index.get_indexer(visits['url'].to_numpy())
+            urls = np.where(positions >= 0, url_ids.to_numpy()[positions], -1)
+            yield visits.assign(url=urls, visit_time=pd.to_numeric(visits['visit_time'], errors='coerce').fillna(0).astype('int64'))
+
+    def high_water(self, visits=False):
+        raise ValueError("Incremental analysis (--state) needs a single history file, not merged profiles.")
+
+    def sample_rows(self, limit): return self.sources[0].sample_rows(limit)
+
+HISTORY_FILE_NAMES = ('History', 'places.sqlite')  # database file names find_history_files looks for in directories
+HISTORY_DB_HINT = "Expected a Chromium 'History' file (Chrome, Edge, Brave, ...) with a 'urls' table, or a Firefox 'places.sqlite'."
+HISTORY_SOURCES = {'urls': ChromiumHistory, 'moz_places': FirefoxHistory}  # the table that identifies each kind of database
+
+def open_history(path):
+    # A History database, places.sqlite or CSV export -> its HistorySource, detected from the file itself;
+    # a list of them (one subject's profiles) -> one MergedHistory
+    if isinstance(path, HistorySource): return path
+    if not isinstance(path, (str, os.PathLike)):
+        paths = list(dict.fromkeys(path))
+        return open_history(paths[0]) if len(paths) == 1 else MergedHistory([open_history(p) for p in paths])
+    if not is_sqlite_file(path): return CsvHistory(path)
+    with closing(open_history_db(path)) as conn: tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    for table, source in HISTORY_SOURCES.items():
+        if table in tables: return source(path)
+    raise ValueError(f"'{path}' is an SQLite database but neither a Chromium History file (urls table) nor a Firefox places.sqlite (moz_places table).")
+
+def history_name(path):
+    return str(path) if isinstance(path, (str, os.PathLike)) else ', '.join(str(p) for p in path)
+
+def count_values(rows, name):
+    # visit_count/typed_count as int64, 0 where the column is missing or a value is not a number
+    if name not in rows.columns: return np.zeros(len(rows), dtype='int64')
+    return pd.to_numeric(rows[name], errors='coerce').fillna(0).astype('int64').to_numpy()
+
+def merge_sorted_chunks(streams, column):
+    # streams: iterators of DataFrames, each ordered by `column` -> DataFrames ordered by it across all of them.
+    # Only rows no stream can still precede are emitted, so one chunk per stream is held at a time.
+    streams, pending = list(streams), [None] * len(streams)
+    while True:
+        for i, stream in enumerate(streams):
+            while stream is not None and (pending[i] is None or pending[i].empty):
+                pending[i] = next(stream, None)
+                if pending[i] is None: streams[i] = stream = None
+        held = [p for p in pending if p is not None and len(p)]
+        if not held: return
+        limit = min((p[column].iloc[-1] for p, stream in zip(pending, streams) if stream is not None), default=None)
+        out = []
+        for i, p in enumerate(pending):
+            if p is None or p.empty: continue
+            n = len(p) if limit is None else int(p[column].searchsorted(limit, side='right'))
+            out.append(p.iloc[:n]); pending[i] = p.iloc[n:]
+        yield pd.concat(out, ignore_index=True).sort_values(column, kind='mergesort', ignore_index=True)
+
+def webkit_microseconds(timestamps):
+    # -> (int64 WebKit microseconds, parsed mask). Integers and integer strings convert exactly; other
+    # numbers go through float and are rounded, as float(str(value)) would be.
+    if pd.api.types.is_integer_dtype(timestamps.dtype):
+        if not timestamps.hasnans: return timestamps.to_numpy(dtype='int64'), np.ones(len(timestamps), dtype=bool)
+        return timestamps.fillna(0).to_numpy(dtype='int64'), timestamps.notna().to_numpy()  # nullable Int64 (merged histories)
+    numeric = pd.to_numeric(timestamps, errors='coerce')
+    if pd.api.types.is_integer_dtype(numeric.dtype) and not numeric.hasnans:
+        return numeric.to_numpy(dtype='int64'), np.ones(len(timestamps), dtype=bool)
+    values = numeric.to_numpy(dtype='float64', na_value=np.nan)
+    parsed = np.isfinite(values) & (np.abs(values) < 2.0 ** 62)
+    micros = np.zeros(len(values), dtype='int64')
+    micros[parsed] = np.rint(values[parsed]).astype('int64')
+    if not (pd.api.types.is_numeric_dtype(timestamps.dtype) or pd.api.types.is_bool_dtype(timestamps.dtype)):
+        text = timestamps.astype(object).where(timestamps.notna(), '').astype(str).str.strip()
+        exact = text.str.fullmatch(r'[+-]?\d{1,18}').to_numpy(dtype=bool)
+        if exact.any():
+            micros[exact] = text[exact].astype('int64').to_numpy()
+            parsed |= exact
+    return micros, parsed
+
+def describe_timestamp_drops(drops):
+    total = sum(drops.values())
+    if not total: return None
+    return f"Skipped {total} rows without a usable timestamp (zero: {drops.get('zero', 0)}, missing: {drops.get('missing', 0)}, invalid or out of range: {drops.get('invalid', 0)})."
+
+def decode_urls(urls):
+    has_escapes = urls.str.contains('%', regex=False)
+    if not has_escapes.any(): return urls
+    return urls.where(~has_escapes, urls[has_escapes].map(unquote))
+
+def split_urls(urls):
+    cleaned = urls.str.lstrip(URL_LEADING_STRIP_CHARS).str.replace(r'[\t\r\n]', '', regex=True)
+    parts = cleaned.str.extract(URL_SPLIT_PATTERN).fillna('')
+    # urlparse (not urlsplit) also drops ";params" from the last path segment for these schemes
+    with_params = parts['scheme'].str.lower().isin(uses_params) & parts['path'].str.contains(';', regex=False)
+    if with_params.any(): parts.loc[with_params, 'path'] = parts.loc[with_params, 'path'].str.replace(r';[^/]*$', '', regex=True)
+    return parts
+
+@lru_cache(maxsize=None)
+def load_public_suffixes(path=PUBLIC_SUFFIX_LIST_PATH):
+    # -> (reversed-label trie of the ICANN section of the Public Suffix List: {'au': {'com': {'$': True}, ...}, ...},
+    # sha256 of the file, which domain resolution depends on); (None, 'fallback') when the file is missing.
+    # '$' marks the end of a rule, '!' an exception rule. The private section (cloudfront.net, github.io, ...) is
+    # left out on purpose: those hosts belong to the provider, which is what the whitelist is written against.
+    trie = {}
+    try:
+        with open(path, 'rb') as f: content = f.read()
+        digest = hashlib.sha256(content).hexdigest()
+        for line in content.decode('utf-8').splitlines():
+            line = line.strip()
+            if line.startswith('// ===END ICANN DOMAINS==='): break
+            if not line or line.startswith('//'): continue
+            rule = line.split()[0].lower()
+            exception = rule.startswith('!')
+            for form in {rule.lstrip('!'), '.'.join(encode_idna_label(label) for label in rule.lstrip('!').split('.'))}:
+                node = trie
+                for label in reversed(form.split('.')): node = node.setdefault(label, {})
+                node['!' if exception else '$'] = True
+    except OSError:
+        print(f"Warning: Public Suffix List '{path}' not found; falling back to a built-in list of second-level domains.")
+        return None, 'fallback'
+    return trie, digest
+
+def encode_idna_label(label):
+    # Hosts in URLs are usually punycode; index both forms of internationalized suffixes
+    if label.isascii(): return label
+    try: return label.encode('idna').decode('ascii')
+    except UnicodeError: return label
+
+def public_suffix_length(labels, suffixes):
+    # Number of trailing labels forming the public suffix (PSL algorithm; unlisted TLDs count as one label)
+    if suffixes is None: return 2 if len(labels) > 2 and labels[-2] in SECOND_LEVEL_LABELS and len(labels[-1]) == 2 else 1
+    node, length = suffixes, 1
+    for depth, label in enumerate(reversed(labels), 1):
+        if label in node:
+            node = node[label]
+            if '!' in node: return depth - 1
+            if '$' in node: length = depth
+        elif '*' in node:
+            node = node['*']
+            length = depth
+        else: break
+    return length
+
+def netloc_host(netloc):
+    # 'user@Example.COM:8080' -> 'example.com'
+    host = netloc.rpartition('@')[2].lower()
+    if host.startswith('['): return host.partition(']')[0] + ']'
+    return host.partition(':')[0].rstrip('.')
+
+def build_trie_pattern(words):
+    # Factor the alternation into a character trie so the regex engine never retries a shared prefix;
+    # at each position the longest word wins.
+    trie = {}
+    for word in words:
+        node = trie
+        for ch in word: node = node.setdefault(ch, {})
+        node[''] = {}
+    def build(node):
+        alternatives = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not alternatives: return ''
+        body = alternatives[0] if len(alternatives) == 1 else '(?:' + '|'.join(alternatives) + ')'
+        return f'(?:{body})?' if '' in node else body
+    return build(trie)
+
+def keyword_boundary_pattern(words):
+    # Same boundaries as r'(?:^|[\W_])kw(?:$|[\W_])', written as lookarounds so matches may overlap
+    return r'(?<![^\W_])(?:' + build_trie_pattern(words) + r')(?![^\W_])'
+
+RULES_FILE_KINDS = {'.json': 'json', '.yaml': 'yaml', '.yml': 'yaml'}  # --rules FILE; other files are plain domain lists
+RULES_LIST_TARGETS = ('whitelist', 'inappropriate')  # --rules TARGET=FILE targets besides category names
+RULES_SECTIONS = {'categories': ('patterns', 'domains', 'domain_files'), 'whitelist': ('domains', 'patterns', 'domain_files'),
+                  'inappropriate': ('keywords', 'domains', 'domain_files')}
+LARGE_KEYWORD_LIST = 5000  # inappropriate keywords beyond this are matched by KeywordSet instead of one regex
+
+def normalize_rule_domain(entry):
+    # 'Example.COM', '*.example.com', '||example.com^' (adblock) or '0.0.0.0 example.com' (hosts file) -> 'example.com'
+    fields = entry.split()
+    if not fields: return ''
+    host = fields[-1].lower()
+    if host.startswith('||'): host = host[2:]
+    host = host.rstrip('^').lstrip('*').strip('.')
+    return '.'.join(encode_idna_label(label) for label in host.split('.')) if host else ''
+
+def parse_domain_list(text):
+    # One domain per line; '#' and '!' start comments
+    domains = (normalize_rule_domain(line.partition('#')[0]) for line in text.splitlines() if not line.lstrip().startswith('!'))
+    return list(dict.fromkeys(domain for domain in domains if domain))
+
+def rules_string_list(value, where):
+    if value is None: return []
+    if not isinstance(value, list) or not all(isinstance(item, str) for item in value): raise ValueError(f"{where} must be a list of strings.")
+    return value
+
+def check_rule_patterns(patterns, where, anchored_only=False):
+    # Regexes are compiled once here so a typo fails at startup, naming its file
+    for pattern in patterns:
+        if anchored_only and not (pattern.startswith('^') and pattern.endswith('$')): continue
+        try: re.compile(pattern)
+        except re.error as e: raise ValueError(f"{where}: invalid regular expression '{pattern}': {e}.")
+    return patterns
+
+def parse_rules_document(document):
+    # A JSON/YAML ruleset -> the same sections with every key present, domains normalized and keywords lower-cased:
+    #   categories: {name: {patterns: [...], domains: [...], domain_files: [...]}}
+    #   whitelist: {domains, patterns, domain_files}    inappropriate: {keywords, domains, domain_files}
+    if not isinstance(document, dict): raise ValueError("a ruleset must be a mapping with 'categories', 'whitelist' and/or 'inappropriate'.")
+    unknown = set(document) - set(RULES_SECTIONS)
+    if unknown: raise ValueError(f"unknown sections {sorted(unknown)}; expected {', '.join(RULES_SECTIONS)}.")
+
+    def section(value, keys, where):
+        if value is None: value = {}
+        if not isinstance(value, dict): raise ValueError(f"{where} must be a mapping of {', '.join(keys)}.")
+        unknown = set(value) - set(keys)
+        if unknown: raise ValueError(f"unknown keys {sorted(unknown)} in {where}; expected {', '.join(keys)}.")
+        rules = {key: rules_string_list(value.get(key), f"{where}.{key}") for key in keys}
+        if 'domains' in rules: rules['domains'] = list(dict.fromkeys(filter(None, map(normalize_rule_domain, rules['domains']))))
+        if 'keywords' in rules: rules['keywords'] = [keyword.lower() for keyword in rules['keywords'] if keyword]
+        return rules
+
+    categories = document.get('categories') or {}
+    if not isinstance(categories, dict): raise ValueError("'categories' must map category names to their rules.")
+    parsed = {'categories': {}}
+    for name, value in categories.items():
+        name = str(name).strip().lower()
+        if not name or name in RULES_LIST_TARGETS: raise ValueError(f"'{name}' cannot be used as a category name.")
+        rules = section(value, RULES_SECTIONS['categories'], f"categories.{name}")
+        check_rule_patterns(rules['patterns'], f"categories.{name}.patterns", anchored_only=True)
+        parsed['categories'][name] = rules
+    for name in RULES_LIST_TARGETS: parsed[name] = section(document.get(name), RULES_SECTIONS[name], name)
+    check_rule_patterns(parsed['whitelist']['patterns'], 'whitelist.patterns')
+    return parsed
+
+def load_yaml(text):
+    # PyYAML is optional: only YAML rulesets need it
+    try: import yaml
+    except ImportError: raise ValueError("YAML rulesets need the PyYAML package (pip install pyyaml); JSON rulesets and domain lists work without it.")
+    try: return yaml.safe_load(text)
+    except yaml.YAMLError as e: raise ValueError(f"invalid YAML: {e}")
+
+def load_rules_file(path, kind, cache_dir=None):
+    # -> (content digest, parsed content) of one rules file: a 'domains' list, or a 'json'/'yaml' ruleset. The parsed
+    # form is pickled to cache_dir under the digest, so a file is only parsed and normalized again once its bytes change.
+    try:
+        with open(path, 'rb') as f: data = f.read()
+    except OSError as e: raise ValueError(f"Cannot read rules file '{path}': {e.strerror}.")
+    digest = hashlib.sha256(f"{RULESET_VERSION}:{kind}:".encode('utf-8') + data).hexdigest()
+    cache_path = os.path.join(cache_dir, f"{digest}.pickle") if cache_dir else None
+    if cache_path and os.path.exists(cache_path):
+        try:
+            with open(cache_path, 'rb') as f: return digest, pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError): pass
+    try:
+        text = data.decode('utf-8-sig')
+        if kind == 'domains': value = parse_domain_list(text)
+        else: value = parse_rules_document(load_yaml(text) if kind == 'yaml' else json.loads(text))
+    except ValueError as e: raise ValueError(f"Rules file '{path}': {e}")
+    if cache_path:
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            with open(tmp_path, 'wb') as f: pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, cache_path)
+        except OSError as e: print(f"Warning: Cannot cache parsed rules of '{path}' in '{cache_dir}': {e}")
+        finally:
+            if os.path.exists(tmp_path): os.remove(tmp_path)
+    return digest, value
+
+def parse_rules_spec(spec):
+    # '--rules FILE' (JSON/YAML ruleset) or '--rules TARGET=FILE' (plain domain list) -> (target or None, path)
+    target, sep, path = spec.partition('=')
+    if sep and re.fullmatch(r'[\w-]+', target) and not os.path.exists(spec): return target.lower(), path
+    if os.path.splitext(spec)[1].lower() not in RULES_FILE_KINDS:
+        raise ValueError(f"'{spec}' is not a .json/.yaml ruleset. Give plain domain lists a target: --rules CATEGORY=FILE, whitelist=FILE or inappropriate=FILE.")
+    return None, spec
+
+def domain_suffixes(host):
+    # 'a.example.com' -> 'a.example.com', 'example.com', 'com': a domain list entry covers the host and its subdomains
+    while host:
+        yield host
+        host = host.partition('.')[2]
+
+class RuleSet:
+    # Rules from --rules files, in the order given, extending the built-in patterns, whitelist and keywords:
+    # categories (new ones are checked after the built-in ones) with patterns and domains, whitelist domains and
+    # patterns, inappropriate keywords and domains. Each file is parsed once per content (load_rules_file);
+    # changed() tells whether any file was modified since, so a long-running process can reload.
+    def __init__(self, specs, cache_dir=None):
+        self.specs = list(specs)
+        self.cache_dir = cache_dir
+        self.load()
+
+    def load(self):
+        self.categories = {}  # name -> {'patterns': [...], 'domains': [...]}, in order of first appearance
+        self.whitelist_domains, self.whitelist_patterns = [], []
+        self.inappropriate_keywords, self.inappropriate_domains = [], []
+        self.files = {}  # path -> (mtime_ns, size) when read
+        digests = []
+        for spec in self.specs:
+            target, path = parse_rules_spec(spec)
+            if target is not None:
+                domains = self._read(path, 'domains', digests, target)
+                if target == 'whitelist': self.whitelist_domains += domains
+                elif target == 'inappropriate': self.inappropriate_domains += domains
+                else: self._add_category(target, [], domains)
+                continue
+            document = self._read(path, RULES_FILE_KINDS[os.path.splitext(path)[1].lower()], digests)
+            def listed_domains(rules, target):
+                # domain_files are relative to the ruleset
+                lists = [self._read(os.path.join(os.path.dirname(path), name), 'domains', digests, target) for name in rules['domain_files']]
+                return rules['domains'] + [domain for domains in lists for domain in domains]
+            for name, rules in document['categories'].items(): self._add_category(name, rules['patterns'], listed_domains(rules, name))
+            self.whitelist_domains += listed_domains(document['whitelist'], 'whitelist')
+            self.whitelist_patterns += document['whitelist']['patterns']
+            self.inappropriate_domains += listed_domains(document['inappropriate'], 'inappropriate')
+            self.inappropriate_keywords += document['inappropriate']['keywords']
+        self.digest = hashlib.sha256(json.dumps(digests).encode('utf-8')).hexdigest()
+
+    def _read(self, path, kind, digests, target=None):
+        try: stat = os.stat(path)
+        except OSError as e: raise ValueError(f"Cannot read rules file '{path}': {e.strerror}.")
+        self.files[path] = (stat.st_mtime_ns, stat.st_size)
+        digest, value = load_rules_file(path, kind, self.cache_dir)
+        digests.append([target, digest])
+        return value
+
+    def _add_category(self, name, patterns, domains):
+        rules = self.categories.setdefault(name, {'patterns': [], 'domains': []})
+        rules['patterns'] += patterns
+        rules['domains'] += domains
+
+    def changed(self):
+        for path, signature in self.files.items():
+            try: stat = os.stat(path)
+            except OSError: return True
+            if (stat.st_mtime_ns, stat.st_size) != signature: return True
+        return False
+
+    def describe(self):
+        domains = sum(len(rules['domains']) for rules in self.categories.values()) + len(self.whitelist_domains) + len(self.inappropriate_domains)
+        patterns = sum(len(rules['patterns']) for rules in self.categories.values()) + len(self.whitelist_patterns)
+        return (f"{len(self.files)} files: {len(self.categories)} categories, {domains} domains, {patterns} patterns, "
+                f"{len(self.inappropriate_keywords)} inappropriate keywords")
+
+class KeywordSet:
+    # Keyword lists too long for one regex (a 100k-word trie takes seconds to compile, and a compiled pattern cannot
+    # be cached): the leftmost, then longest, match between word boundaries, as keyword_boundary_pattern finds it,
+    # looked up in a set at every pair of boundaries no further apart than the longest keyword
+    BOUNDARY_RE = re.compile(r'[\W_]')
+
+    def __init__(self, keywords):
+        self.keywords = frozenset(keywords)
+        self.max_length = max(map(len, self.keywords), default=0)
+
+    def search(self, text):
+        cuts = [m.start() for m in self.BOUNDARY_RE.finditer(text)]
+        ends = cuts + [len(text)]
+        for start in [0] + [cut + 1 for cut in cuts]:
+            for end in reversed(ends[bisect.bisect_right(ends, start):bisect.bisect_right(ends, start + self.max_length)]):
+                if text[start:end] in self.keywords: return text[start:end]
+        return None
+
+class RuleEngine:
+    # All keyword, whitelist and category rules compiled once; categorize_url/is_inappropriate and their
+    # columnar counterparts only ever run these matchers. Priority is unchanged:
+    # custom categories -> whitelisted domain / work keywords -> category_check_order.
+    # ruleset: an optional RuleSet merged into the given rules; its domains are matched by hashed label suffix.
+    def __init__(self, patterns, whitelist, legit_domain_patterns, custom_categories_map, work_keywords,
+                 inappropriate_keywords, category_check_order=CATEGORY_CHECK_ORDER, ruleset=None):
+        # Identifies the effective ruleset; CategoryCache entries are only reused under the same fingerprint.
+        # External rules and the Public Suffix List (domain resolution) enter through digests of their files' contents.
+        self.public_suffixes, public_suffixes_digest = load_public_suffixes()
+        self.fingerprint = hashlib.sha256(json.dumps([
+            RULESET_VERSION, public_suffixes_digest, [[name, list(patterns.get(name, []))] for name in category_check_order], sorted(whitelist),
+            list(legit_domain_patterns), list(custom_categories_map.items()), sorted(set(kw for kw in work_keywords if kw)),
+            sorted(kw for kw in inappropriate_keywords if kw),
+        ] + ([ruleset.digest] if ruleset is not None else [])).encode('utf-8')).hexdigest()
+        external = {}  # category -> domains from the ruleset
+        self.whitelist_suffixes = self.inappropriate_domains = frozenset()
+        if ruleset is not None:
+            category_check_order = list(category_check_order) + [name for name in ruleset.categories if name not in category_check_order]
+            patterns = {name: list(patterns.get(name, [])) + ruleset.categories.get(name, {}).get('patterns', []) for name in category_check_order}
+            external = {name: rules['domains'] for name, rules in ruleset.categories.items()}
+            legit_domain_patterns = list(legit_domain_patterns) + ruleset.whitelist_patterns
+            inappropriate_keywords = set(inappropriate_keywords) | set(ruleset.inappropriate_keywords)
+            self.whitelist_suffixes = frozenset(ruleset.whitelist_domains)
+            self.inappropriate_domains = frozenset(ruleset.inappropriate_domains)
+        self.category_check_order = list(category_check_order)
+        self.category_patterns = {name: list(patterns.get(name, [])) for name in self.category_check_order}  # built-in and ruleset patterns
+        self.whitelist = frozenset(whitelist)
+        self.legit_domain_re = re.compile('|'.join(legit_domain_patterns)) if legit_domain_patterns else None
+        # Histories have far fewer distinct hosts than rows, so per-netloc results are memoized
+        self.resolve_domain = lru_cache(maxsize=DOMAIN_CACHE_SIZE)(self._resolve_domain)
+
+        # Custom keywords: longest first, ties in definition order
+        self.custom_keywords = [kw for kw in sorted(custom_categories_map.keys(), key=len, reverse=True) if kw]
+        self.custom_categories = {kw: custom_categories_map[kw].lower() for kw in self.custom_keywords}
+        self.custom_rank = {}
+        for rank, kw in enumerate(self.custom_keywords): self.custom_rank.setdefault(kw.lower(), (rank, kw))
+        self.custom_re = re.compile('(?=(' + keyword_boundary_pattern({kw.lower() for kw in self.custom_keywords}) + '))',
+                                    re.IGNORECASE) if self.custom_keywords else None
+
+        self.work_keywords = [kw for kw in work_keywords if kw]
+        self.work_substring_re = re.compile(build_trie_pattern(self.work_keywords)) if self.work_keywords else None
+        self.work_keyword_re = re.compile(keyword_boundary_pattern(self.work_keywords), re.IGNORECASE) if self.work_keywords else None
+
+        # Category rules as (category rank, item rank, category, item); the smallest matching rule wins
+        self.domain_regex_rules, domain_rules, path_rules = [], {}, {}
+        for category_rank, category_name in enumerate(category_check_order):
+            for item_rank, pattern_item in enumerate(patterns.get(category_name, [])):
+                rule = (category_rank, item_rank, category_name, pattern_item)
+                if pattern_item.startswith(r'^') and pattern_item.endswith(r'$'):
+                    self.domain_regex_rules.append((rule, re.compile(pattern_item)))
+                    continue
+                domain_rules.setdefault(pattern_item, rule)
+                if category_name not in DOMAIN_ONLY_CATEGORIES: path_rules.setdefault(pattern_item, rule)
+        self.domain_rule_re, self.domain_rule_best = self._compile_substring_rules(domain_rules)
+        self.path_rule_re, self.path_rule_best = self._compile_substring_rules(path_rules)
+        # Ruleset domains rank after their category's patterns; a host is looked up under each of its label suffixes
+        self.domain_suffix_rules = {}
+        for category_rank, category_name in enumerate(category_check_order):
+            for item_rank, domain in enumerate(external.get(category_name, []), len(patterns.get(category_name, []))):
+                self.domain_suffix_rules.setdefault(domain, (category_rank, item_rank, category_name, domain))
+
+        self.inappropriate_keywords = sorted(kw for kw in inappropriate_keywords if kw)
+        self.inappropriate_set = frozenset(self.inappropriate_keywords)
+        self.inappropriate_keyword_set = KeywordSet(self.inappropriate_keywords) if len(self.inappropriate_keywords) > LARGE_KEYWORD_LIST else None
+        self.inappropriate_re = re.compile(keyword_boundary_pattern(self.inappropriate_keywords),
+                                           re.IGNORECASE) if self.inappropriate_keywords and self.inappropriate_keyword_set is None else None
+
+    @staticmethod
+    def _compile_substring_rules(rules):
+        if not rules: return None, {}
+        # The trie match at a position is the longest item there; every shorter item that also matches
+        # at that position is a prefix of it, so the best rule per longest item is precomputed.
+        best = {}
+        for item in rules:
+            prefix_rules = [rules[item[:n]] for n in range(1, len(item) + 1) if item[:n] in rules]
+            best[item] = min(prefix_rules)
+        return re.compile('(?=(' + build_trie_pattern(rules) + '))'), best
+
+    @staticmethod
+    def _fold_keyword(matched, keywords):
+        # IGNORECASE also matches a few non-ASCII case folds (e.g. U+017F for 's'); map those back
+        return next(kw for kw in keywords if re.fullmatch(re.escape(kw), matched, re.IGNORECASE))
+
+    def _resolve_domain(self, netloc):
+        # -> (main domain, whitelisted, matched COMMON_LEGIT_DOMAIN_PATTERNS text or None)
+        host = netloc_host(netloc)
+        if not host: return '', False, None
+        labels = host.split('.')
+        suffix_length = public_suffix_length(labels, self.public_suffixes)
+        ip_literal = host.startswith('[') or host.replace('.', '').isdigit()
+        main_domain = host if ip_literal or len(labels) <= suffix_length + 1 else '.'.join(labels[-suffix_length - 1:])
+        legit = self.legit_domain_re.search(host) if self.legit_domain_re is not None else None
+        legit = legit.group(0) if legit else None
+        whitelisted = main_domain in self.whitelist or legit is not None or bool(self.whitelist_suffixes and any(d in self.whitelist_suffixes for d in domain_suffixes(host)))
+        return main_domain, whitelisted, legit
+
+    def main_domain(self, netloc):
+        return self.resolve_domain(netloc)[0]
+
+    def is_whitelisted(self, domain_full):
+        return self.resolve_domain(domain_full)[1]
+
+    def match_custom(self, url_lower):
+        if self.custom_re is None: return None
+        best = None
+        for m in self.custom_re.finditer(url_lower):
+            entry = self.custom_rank.get(m.group(1).lower())
+            if entry is None:
+                keyword = self._fold_keyword(m.group(1), self.custom_keywords)
+                entry = (self.custom_keywords.index(keyword), keyword)
+            rank, keyword = entry
+            if best is None or rank < best[0]: best = (rank, keyword)
+        return (self.custom_categories[best[1]], best[1]) if best else None
+
+    def match_work_substring(self, domain_full, path_query_lower):
+        if self.work_substring_re is None: return None
+        m = self.work_substring_re.search(domain_full) or self.work_substring_re.search(path_query_lower)
+        return m.group(0) if m else None
+
+    def match_work_keyword(self, url_lower):
+        m = self.work_keyword_re.search(url_lower) if self.work_keyword_re is not None else None
+        return m.group(0) if m else None
+
+    def match_domain_rule(self, domain_full):
+        best = None
+        for rule, regex in self.domain_regex_rules:
+            if regex.match(domain_full): best = rule; break
+        if self.domain_rule_re is not None:
+            for m in self.domain_rule_re.finditer(domain_full):
+                rule = self.domain_rule_best[m.group(1)]
+                if best is None or rule < best: best = rule
+        if self.domain_suffix_rules:
+            for domain in domain_suffixes(netloc_host(domain_full)):
+                rule = self.domain_suffix_rules.get(domain)
+                if rule is not None and (best is None or rule < best): best = rule
+        return best
+
+    def match_path_rule(self, path_query_lower):
+        best = None
+        if self.path_rule_re is not None:
+            for m in self.path_rule_re.finditer(path_query_lower):
+                rule = self.path_rule_best[m.group(1)]
+                if best is None or rule < best: best = rule
+        return best
+
+    def match_category_rules(self, domain_full, path_query_lower, domain_rule=None):
+        if domain_rule is None: domain_rule = self.match_domain_rule(domain_full)
+        path_rule = self.match_path_rule(path_query_lower)
+        rule = min(r for r in (domain_rule, path_rule) if r is not None) if domain_rule or path_rule else None
+        return (rule[2], rule[3]) if rule else ('other', None)
+
+    def classify(self, url_lower, domain_full, path_query_lower):
+        custom = self.match_custom(url_lower)
+        if custom: return custom
+        _, whitelisted, legit = self.resolve_domain(domain_full)
+        if whitelisted:
+            keyword = self.match_work_substring(domain_full, path_query_lower)
+            if keyword: return 'work', keyword
+            if legit: return 'infrastructure_internal', legit
+        keyword = self.match_work_keyword(url_lower)
+        if keyword: return 'work', keyword
+        return self.match_category_rules(domain_full, path_query_lower)
+
+    def match_inappropriate_domain(self, domain_full):
+        # The most specific listed inappropriate domain the host belongs to, or None
+        if not self.inappropriate_domains: return None
+        return next((d for d in domain_suffixes(netloc_host(domain_full)) if d in self.inappropriate_domains), None)
+
+    def match_inappropriate(self, url_lower):
+        if self.inappropriate_keyword_set is not None: return self.inappropriate_keyword_set.search(url_lower)
+        m = self.inappropriate_re.search(url_lower) if self.inappropriate_re is not None else None
+        if not m: return None
+        keyword = m.group(0).lower()
+        return keyword if keyword in self.inappropriate_set else self._fold_keyword(m.group(0), self.inappropriate_keywords)
+
+class RunProfile:
+    # Stage timers and counters behind --profile/--profile-json. Stages nest (a chunk iterator that analyzes while it
+    # reads, say); each stage is charged only the time not spent in stages opened inside it, so they add up to the
+    # instrumented time. rule_hits counts the URLs each category rule matched, to find rules that never fire.
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}  # name -> [seconds, calls], in order of first use
+        self.counters = {}
+        self.rule_hits = {}  # (category, rule or None) -> URLs
+        self._open = []  # time spent in the stages nested in each open stage
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        self._open.append(0.0)
+        try: yield
+        finally:
+            elapsed = time.perf_counter() - start
+            nested = self._open.pop()
+            if self._open: self._open[-1] += elapsed
+            totals = self.stages.setdefault(name, [0.0, 0])
+            totals[0] += elapsed - nested
+            totals[1] += 1
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + int(n)
+
+    def add_rule_hit(self, category, rule, n=1):
+        key = (category, None if is_missing(rule) else rule)
+        self.rule_hits[key] = self.rule_hits.get(key, 0) + int(n)
+
+    def add_rule_hits(self, categories, rules):
+        counts = pd.DataFrame({'category': categories, 'rule': rules}).groupby(['category', 'rule'], dropna=False, observed=True).size()
+        for (category, rule), n in counts.items(): self.add_rule_hit(category, rule, n)
+
+    def unused_rules(self, patterns):
+        # Category patterns (RuleEngine.category_patterns: built-in and --rules categories, in check order) that matched
+        # no URL. Ruleset domain lists are left out; they are routinely far larger than any one history.
+        hit = {rule for _, rule in self.rule_hits}
+        unused = {category: [p for p in rules if p not in hit] for category, rules in patterns.items()}
+        return {category: rules for category, rules in unused.items() if rules}
+
+    def to_dict(self, patterns=None):
+        wall = time.perf_counter() - self.started
+        category_hits = {}
+        for (category, _), n in self.rule_hits.items(): category_hits[category] = category_hits.get(category, 0) + n
+        return {
+            'wall_seconds': round(wall, 6),
+            'stages': {name: {'seconds': round(seconds, 6), 'calls': calls} for name, (seconds, calls) in self.stages.items()},
+            'counters': dict(self.counters), 'category_hits': category_hits,
+            'rule_hits': [{'category': c, 'rule': r, 'urls': n} for (c, r), n in sorted(self.rule_hits.items(), key=lambda item: -item[1])],
+            'unused_rules': self.unused_rules(patterns) if patterns is not None else {},
+        }
+
+    def summary(self, patterns=None):
+        data = self.to_dict(patterns)
+        wall = data['wall_seconds']
+        lines = [f"Profile ({wall:.2f}s wall):", f"  {'stage':<16}{'seconds':>10}{'share':>8}{'calls':>8}"]
+        for name, stage in data['stages'].items():
+            lines.append(f"  {name:<16}{stage['seconds']:>10.3f}{stage['seconds'] / wall * 100 if wall else 0:>7.1f}%{stage['calls']:>8}")
+        other = wall - sum(stage['seconds'] for stage in data['stages'].values())
+        lines.append(f"  {'(other)':<16}{other:>10.3f}{other / wall * 100 if wall else 0:>7.1f}%")
+        if data['counters']: lines.append("  " + ", ".join(f"{name}: {n}" for name, n in data['counters'].items()))
+        if data['category_hits']:
+            lines.append("  URLs per category: " + ", ".join(f"{c}: {n}" for c, n in sorted(data['category_hits'].items(), key=lambda item: -item[1])))
+        for category, rules in data['unused_rules'].items():
+            lines.append(f"  {category} rules that matched nothing ({len(rules)}/{len(patterns[category])}): {', '.join(rules)}")
+        return '\n'.join(lines)
+
+RESULT_CATEGORICAL_COLUMNS = ['domain', 'category', 'weekday', 'inappropriate_reason']
+RESULT_NARROW_DTYPES = {'hour': 'int8', 'visit_count': 'int32', 'typed_count': 'int32', 'inappropriate': bool, 'work_hours': bool}
+
+def local_minutes(datetimes):
+    # Wall-clock minutes since 1970-01-01 in the Series' timezone. Each .dt accessor of an aware Series converts the
+    # times again; from these, hour, weekday and work hours are integer arithmetic on a single conversion.
+    return datetimes.dt.tz_localize(None).to_numpy(dtype='datetime64[us]').astype('int64') // 60000000
+
+def weekday_codes(minutes):
+    return (minutes // WorkSchedule.MINUTES_PER_DAY + 3) % 7  # Monday = 0; 1970-01-01 was a Thursday
+
+def weekday_column(datetimes, minutes=None):
+    return pd.Categorical.from_codes(weekday_codes(local_minutes(datetimes) if minutes is None else minutes), WEEKDAY_NAMES)
+
+def categorical(values):
+    # values as a pd.Categorical, categories in order of first appearance; already categorical values pass through
+    if isinstance(values.dtype, pd.CategoricalDtype): return values.array if isinstance(values, pd.Series) else values
+    codes, uniques = pd.factorize(values)
+    return pd.Categorical.from_codes(codes, uniques)
+
+def compact_result_frame(df):
+    # Narrow dtypes for analyzed rows, which were object/int64 columns (~5x the memory): domains, categories and
+    # reasons become categoricals (categories in order of first appearance), weekday a categorical over WEEKDAY_NAMES,
+    # hour int8, counts int32, flags bool. 'date' is not stored; take df['datetime'].dt.date where it is needed.
+    df = df.drop(columns=['date'], errors='ignore')
+    for column in RESULT_CATEGORICAL_COLUMNS:
+        if column not in df.columns or isinstance(df[column].dtype, pd.CategoricalDtype): continue
+        if column == 'weekday': df[column] = pd.Categorical(df[column], categories=WEEKDAY_NAMES)
+        else: df[column] = categorical(df[column])
+    for column, dtype in RESULT_NARROW_DTYPES.items():
+        if column in df.columns and df[column].dtype != dtype: df[column] = df[column].astype(dtype)
+    return df
+
+def concat_results(frames):
+    # pd.concat(frames, ignore_index=True) for analyzed frames; pd.concat would turn categoricals whose categories
+    # differ from frame to frame into object columns, so their categories are unioned first
+    frames = list(frames)
+    if len(frames) == 1: return frames[0].reset_index(drop=True)
+    for column in frames[0].columns:
+        dtypes = [f[column].dtype for f in frames]
+        if not isinstance(dtypes[0], pd.CategoricalDtype) or all(d == dtypes[0] for d in dtypes[1:]): continue
+        dtype = pd.CategoricalDtype(pd.Index(pd.unique(np.concatenate([d.categories.to_numpy(dtype=object) for d in dtypes]))))
+        frames = [f.assign(**{column: f[column].astype(dtype)}) for f in frames]
+    return pd.concat(frames, ignore_index=True)
+
+DEFAULT_IDLE_GAP = 30  # minutes without a visit that end a browsing session (--idle-gap)
+
+class Sessionizer:
+    # Browsing sessions and dwell time over visits fed in time order, chunk by chunk, in linear time. A gap longer than
+    # idle_gap starts a new session. A visit lasted its recorded visit_duration when there is one, otherwise until the
+    # next visit of its session (0 for a session's last visit), at most idle_gap either way. Only totals by (category,
+    # work_hours) are kept; the last visit of a chunk waits for the first visit of the next one.
+    def __init__(self, idle_gap=DEFAULT_IDLE_GAP):
+        self.idle_gap = idle_gap
+        self.idle_gap_us = int(idle_gap * 60 * 1000000)
+        self.sessions = self.visits = 0
+        self.first_time = self.last_time = None  # UTC microseconds
+        self.pending = None  # (category, work_hours) of the last visit when its dwell depends on the next visit
+        self.dwell = {}  # (category, work_hours) -> microseconds
+
+    @property
+    def empty(self): return self.visits == 0
+
+    def _add_dwell(self, key, us): self.dwell[key] = self.dwell.get(key, 0) + int(us)
+
+    def update(self, df):
+        if df.empty: return
+        times = df['datetime'].to_numpy(dtype='datetime64[us]').astype('int64')
+        recorded = pd.to_numeric(df['visit_duration'], errors='coerce').fillna(0).to_numpy(dtype='int64')
+        categories, work_hours = df['category'].to_numpy(dtype=object), df['work_hours'].to_numpy(dtype=bool)
+        if len(times) > 1 and (np.diff(times) < 0).any():
+            order = np.argsort(times, kind='stable')
+            times, recorded, categories, work_hours = times[order], recorded[order], categories[order], work_hours[order]
+        gaps = np.diff(times)
+        within = gaps <= self.idle_gap_us
+        dwell = np.minimum(np.where(recorded[:-1] > 0, recorded[:-1], np.where(within, gaps, 0)), self.idle_gap_us)
+        chunk = Sessionizer(self.idle_gap)
+        chunk.sessions, chunk.visits = 1 + int((~within).sum()), len(times)
+        chunk.first_time, chunk.last_time = int(times[0]), int(times[-1])
+        for key, us in pd.Series(dwell).groupby([categories[:-1], work_hours[:-1]], sort=False, dropna=False).sum().items(): chunk._add_dwell(key, us)
+        last = (categories[-1], bool(work_hours[-1]))
+        if recorded[-1] > 0: chunk._add_dwell(last, min(recorded[-1], self.idle_gap_us))
+        else: chunk.pending = last
+        self.merge(chunk)
+
+    def merge(self, other):
+        # Folds in a Sessionizer fed with the visits that follow this one's
+        if other.empty: return self
+        if self.empty:
+            self.__dict__.update(other.__dict__)
+            self.dwell = dict(other.dwell)
+            return self
+        gap = max(other.first_time - self.last_time, 0)
+        joined = gap <= self.idle_gap_us
+        if joined and self.pending is not None: self._add_dwell(self.pending, gap)
+        self.sessions += other.sessions - int(joined)
+        self.visits += other.visits
+        self.last_time, self.pending = other.last_time, other.pending
+        for key, us in other.dwell.items(): self._add_dwell(key, us)
+        return self
+
+    def seconds_by(self, work_hours=None):
+        # category -> estimated seconds (during work hours only, or outside them, when work_hours is given)
+        seconds = {}
+        for (category, during), us in self.dwell.items():
+            if work_hours is None or during == work_hours: seconds[category] = seconds.get(category, 0) + us / 1e6
+        return pd.Series(seconds, dtype='float64').sort_values(ascending=False)
+
+    def total_seconds(self, work_hours=None): return float(self.seconds_by(work_hours).sum())
+
+def format_duration(seconds):
+    minutes = int(round(seconds / 60))
+    if minutes >= 60: return f"{minutes // 60}h {minutes % 60:02d}m"
+    return f"{minutes}m" if minutes else f"{seconds:.0f}s"
+
+class ReportAggregator:
+    # Running totals behind every chart, summary figure and table in generate_report. Feeding an analyzed
+    # frame in one piece or chunk by chunk gives the same report, so huge inputs never need a full result_df.
+    TABLE_COLUMNS = ['datetime', 'url', 'visit_count', 'category', 'inappropriate_reason', 'work_hours', 'inappropriate']
+
+    def __init__(self, keep_tables=True, idle_gap=DEFAULT_IDLE_GAP):
+        self.keep_tables = keep_tables
+        self.total = 0
+        self.min_datetime = self.max_datetime = None
+        # value -> count, in order of first appearance (what value_counts() sorts ties by)
+        self.counts = {'work_hours': {}, 'category': {}, 'inappropriate': {}, 'domain': {}, 'weekday': {}}
+        self.hour_counts = np.zeros(24, dtype='int64')
+        self.streaming_hour_counts = np.zeros(24, dtype='int64')
+        self.category_work_hours_counts = {}
+        self.work_hours_category_counts = {}
+        self.inappropriate_work_hours = 0
+        self.inappropriate_daily = None
+        self.tables = {'work': [], 'inappropriate': [], 'non_work': []}
+        self.timestamp_drops = {}  # rows the analyzer skipped, by reason (see BrowserHistoryAnalyzer.take_timestamp_drops)
+        self.sessions = Sessionizer(idle_gap)  # fed only with visit rows (--visits); URL rows carry just each URL's last visit
+
+    @property
+    def empty(self): return self.total == 0
+
+    @staticmethod
+    def _add_counts(totals, values):
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            # value_counts() would list every category, used or not, in category order
+            codes, categories = values.cat.codes.to_numpy(), values.cat.categories
+            counts = np.bincount(codes[codes >= 0], minlength=len(categories))
+            for code in pd.unique(codes[codes >= 0]): totals[categories[code]] = totals.get(categories[code], 0) + int(counts[code])
+            return
+        for key, count in values.value_counts(sort=False).items(): totals[key] = totals.get(key, 0) + int(count)
+
+    @staticmethod
+    def _merge_counts(totals, counts):
+        for key, count in counts.items(): totals[key] = totals.get(key, 0) + count
+
+    def update(self, df):
+        if df.empty: return
+        self.total += len(df)
+        chunk_min, chunk_max = df['datetime'].min(), df['datetime'].max()
+        if self.min_datetime is None or chunk_min < self.min_datetime: self.min_datetime = chunk_min
+        if self.max_datetime is None or chunk_max > self.max_datetime: self.max_datetime = chunk_max
+        for column in ('work_hours', 'category', 'inappropriate', 'weekday'): self._add_counts(self.counts[column], df[column])
+        self._add_counts(self.counts['domain'], df['domain'][df['domain'].str.lower() != 'unknown_domain'])
+        self.hour_counts += np.bincount(df['hour'].to_numpy(), minlength=24)
+        self.streaming_hour_counts += np.bincount(df['hour'][df['category'] == 'streaming'].to_numpy(), minlength=24)
+        for key, count in df.groupby(['category', 'work_hours']).size().items():
+            self.category_work_hours_counts[key] = self.category_work_hours_counts.get(key, 0) + int(count)
+        self._add_counts(self.work_hours_category_counts, df['category'][df['work_hours']])
+        self.inappropriate_work_hours += int((df['work_hours'] & df['inappropriate']).sum())
+        inappropriate = df[df['inappropriate']]
+        if not inappropriate.empty:
+            daily = inappropriate.set_index('datetime').resample('D').size()
+            self.inappropriate_daily = daily if self.inappropriate_daily is None else pd.concat([self.inappropriate_daily, daily]).groupby(level=0).sum()
+        if self.keep_tables:
+            columns = [c for c in self.TABLE_COLUMNS if c in df.columns]
+            self.tables['work'].append(df.loc[df['category'] == 'work', columns])
+            self.tables['inappropriate'].append(inappropriate[columns])
+            self.tables['non_work'].append(df.loc[df['work_hours'] & ~df['category'].isin(['work', 'infrastructure_internal']), columns])
+        if 'visit_duration' in df.columns: self.sessions.update(df)
+
+    def merge(self, other):
+        # Folds in an aggregator fed with the rows that follow this one's (e.g. the next chunk of the same file)
+        self._merge_counts(self.timestamp_drops, other.timestamp_drops)
+        if other.empty: return self
+        self.total += other.total
+        if self.min_datetime is None or other.min_datetime < self.min_datetime: self.min_datetime = other.min_datetime
+        if self.max_datetime is None or other.max_datetime > self.max_datetime: self.max_datetime = other.max_datetime
+        for column, counts in other.counts.items(): self._merge_counts(self.counts[column], counts)
+        self.hour_counts += other.hour_counts
+        self.streaming_hour_counts += other.streaming_hour_counts
+        self._merge_counts(self.category_work_hours_counts, other.category_work_hours_counts)
+        self._merge_counts(self.work_hours_category_counts, other.work_hours_category_counts)
+        self.inappropriate_work_hours += other.inappropriate_work_hours
+        if other.inappropriate_daily is not None:
+            self.inappropriate_daily = other.inappropriate_daily if self.inappropriate_daily is None else pd.concat([self.inappropriate_daily, other.inappropriate_daily]).groupby(level=0).sum()
+        for name, frames in other.tables.items(): self.tables[name].extend(frames)
+        self.sessions.merge(other.sessions)
+        return self
+
+    def value_counts(self, column):
+        counts = self.counts[column]
+        return pd.Series(list(counts.values()), index=pd.Index(list(counts.keys()), name=column), name='count', dtype='int64').sort_values(ascending=False)
+
+    def size_by(self, column):
+        # Equivalent of df.groupby(column).size()
+        if column == 'hour':
+            hours = np.flatnonzero(self.hour_counts)
+            return pd.Series(self.hour_counts[hours], index=pd.Index(hours, name='hour', dtype='int64'))
+        counts = self.counts[column]
+        keys = sorted(counts)
+        return pd.Series([counts[k] for k in keys], index=pd.Index(keys, name=column), dtype='int64')
+
+    def streaming_by_hour(self):
+        return pd.Series(self.streaming_hour_counts, index=pd.Index(range(24), name='hour'))
+
+    def category_by_work_hours(self):
+        counts = pd.Series(self.category_work_hours_counts, dtype='int64')
+        counts.index.names = ['category', 'work_hours']
+        return counts.sort_index().unstack(fill_value=0)
+
+    def inappropriate_per_day(self):
+        if self.inappropriate_daily is None: return pd.Series(dtype=int)
+        return self.inappropriate_daily.resample('D').sum()
+
+    def table(self, name, category=None):
+        frames = [f for f in self.tables[name] if not f.empty]
+        if not frames: return pd.DataFrame(columns=self.TABLE_COLUMNS)
+        table = pd.concat(frames) if len(frames) > 1 else frames[0]
+        return table[table['category'] == category] if category is not None else table
+
+    def summary(self, top_domains=10):
+        # The report's headline figures (Executive Summary, charts' counts, estimated time with --visits) as plain JSON values
+        def when(value): return value.isoformat() if value is not None and pd.notna(value) else None
+        work_hours = int(self.counts['work_hours'].get(True, 0))
+        non_work = sum(v for category, v in self.work_hours_category_counts.items() if category not in ('work', 'infrastructure_internal'))
+        summary = {
+            'records': self.total, 'first_visit': when(self.min_datetime), 'last_visit': when(self.max_datetime),
+            'work_hours': work_hours, 'outside_work_hours': self.total - work_hours,
+            'work_hours_percent': round(work_hours / self.total * 100, 1) if self.total else 0.0,
+            'inappropriate': int(self.counts['inappropriate'].get(True, 0)), 'inappropriate_work_hours': self.inappropriate_work_hours,
+            'non_work_during_work_hours': int(non_work), 'non_work_during_work_hours_percent': round(non_work / work_hours * 100, 1) if work_hours else 0.0,
+            'categories': {str(k): int(v) for k, v in self.value_counts('category').items()},
+            'work_hours_categories': {str(k): int(v) for k, v in sorted(self.work_hours_category_counts.items(), key=lambda kv: -kv[1])},
+            'top_domains': {str(k): int(v) for k, v in self.value_counts('domain').head(top_domains).items()},
+            'hours': [int(v) for v in self.hour_counts],
+            'weekdays': {day: int(self.counts['weekday'].get(day, 0)) for day in WEEKDAY_NAMES},
+            'busiest_days': [str(k) for k in self.size_by('weekday').nlargest(3).index], 'peak_hours': [int(k) for k in self.size_by('hour').nlargest(3).index],
+            'skipped': {str(k): int(v) for k, v in self.timestamp_drops.items()},
+        }
+        if not self.sessions.empty:
+            summary['sessions'] = {'count': self.sessions.sessions, 'seconds': round(self.sessions.total_seconds(), 1),
+                                   'work_hours_seconds': round(self.sessions.total_seconds(True), 1),
+                                   'non_work_during_work_hours_seconds': round(float(self.sessions.seconds_by(True).drop(['work', 'infrastructure_internal'], errors='ignore').sum()), 1),
+                                   'category_seconds': {str(k): round(float(v), 1) for k, v in self.sessions.seconds_by().items()}}
+        return summary
+
+def time_table_html(agg):
+    # Productivity tab: visits next to estimated time per category, during and outside work hours (--visits only)
+    if agg.sessions.empty: return ''
+    rows, seconds = '', {during: agg.sessions.seconds_by(during) for during in (True, False)}
+    for category in agg.sessions.seconds_by().index:
+        cells = ''.join(f"<td>{agg.category_work_hours_counts.get((category, during), 0)}</td><td>{format_duration(seconds[during].get(category, 0))}</td>" for during in (True, False))
+        rows += f"<tr><td>{html.escape(str(category).replace('_', ' ').title())}</td>{cells}</tr>\n"
+    return ("<h3>Estimated Time by Category</h3><table><thead><tr><th>Category</th><th>Visits (Work Hours)</th><th>Time (Work Hours)</th>"
+            f"<th>Visits (Non-Work Hours)</th><th>Time (Non-Work Hours)</th></tr></thead><tbody>\n{rows}</tbody></table>")
+
+def format_report_datetimes(datetimes):
+    # Same text as Timestamp.strftime('%Y-%m-%d %H:%M:%S %Z') for a whole column: the wall clock comes from numpy and
+    # the zone abbreviation is looked up once per (UTC day, UTC offset), at the group's earliest and latest row;
+    # rows of the rare group where the two differ are formatted one by one
+    pattern = '%Y-%m-%d %H:%M:%S %Z'
+    if datetimes.dt.tz is None or datetimes.isna().any() or (datetimes.dt.year < 1000).any():
+        return [v.strftime(pattern) if pd.notna(v) else 'NaT' for v in datetimes]
+    local = datetimes.dt.tz_localize(None).to_numpy(dtype='datetime64[us]')
+    utc_us = datetimes.dt.tz_convert('UTC').dt.tz_localize(None).to_numpy(dtype='datetime64[us]').astype('int64')
+    wall_clock = np.char.replace(np.datetime_as_string(local, unit='s'), 'T', ' ').tolist()
+    groups = pd.DataFrame({'day': utc_us // 86400000000, 'offset': local.astype('int64') - utc_us, 'utc': utc_us})
+    group_ids = groups.groupby(['day', 'offset'], sort=False).ngroup().to_numpy()
+    bounds = groups.assign(row=np.arange(len(groups))).groupby(group_ids)['utc'].agg(['idxmin', 'idxmax'])
+    names = []
+    for first, last in zip(bounds['idxmin'], bounds['idxmax']):
+        name = datetimes.iloc[first].strftime('%Z')
+        names.append(name if datetimes.iloc[last].strftime('%Z') == name else None)
+    return [f"{clock} {names[group]}" if names[group] is not None else value.strftime(pattern)
+            for clock, group, value in zip(wall_clock, group_ids.tolist(), datetimes)]
+
+def table_cells_html(rows, column):
+    # One report table column rendered as <td> cells for all rows at once (see write_table_rows_html)
+    if column not in rows.columns: return ['<td >N/A</td>'] * len(rows)
+    values = rows[column]
+    if column == 'datetime' and isinstance(values.dtype, pd.DatetimeTZDtype): text = format_report_datetimes(values)
+    elif column == 'url':
+        text = []
+        for value in values:
+            if value == "N/A": text.append("N/A"); continue
+            escaped = html.escape(str(value))
+            text.append(f'<a href="{escaped}" target="_blank" title="{escaped}">{escaped[:80]}{"..." if len(escaped) > 80 else ""}</a>')
+    elif column == 'work_hours':
+        flagged = rows['inappropriate'] if 'inappropriate' in rows.columns else [False] * len(rows)
+        return [('<td class="warning-text">Yes</td>' if flag else '<td >Yes</td>') if during else '<td >No</td>'
+                for during, flag in zip(values, flagged)]
+    elif column == 'inappropriate_reason': text = [html.escape(str(v)) if pd.notna(v) else "N/A" for v in values]
+    else: text = [html.escape(str(v)) for v in values]
+    return [f"<td >{t}</td>" for t in text]
+
+def write_table_rows_html(f, dataframe, columns_map, sort_by_col='datetime', ascending_sort=False, block_rows=20000):
+    # Streams <tr> rows to f in blocks; each block is rendered column by column rather than cell by cell
+    if dataframe.empty:
+        f.write(f"<tr><td colspan='{len(columns_map)}' style='text-align:center; padding:10px;'>No data for this section.</td></tr>")
+        return
+    if sort_by_col in dataframe.columns: dataframe = dataframe.sort_values(by=sort_by_col, ascending=ascending_sort)
+    for start in range(0, len(dataframe), block_rows):
+        block = dataframe.iloc[start:start + block_rows]
+        columns = [table_cells_html(block, column) for column in columns_map]
+        f.write(''.join(['<tr>' + ''.join(cells) + '</tr>\n' for cells in zip(*columns)]))
+
+def table_payload(rows, columns_map):
+    # Columnar JSON form of a sorted report table for --paged-tables. Datetimes become UTC epoch seconds plus an index
+    # into the (UTC offset, zone abbreviation) pairs seen; repeated strings (categories, reasons) are interned.
+    columns = []
+    for key in columns_map:
+        if key not in rows.columns: columns.append({'key': key, 'type': 'missing'}); continue
+        values = rows[key]
+        if key == 'datetime' and isinstance(values.dtype, pd.DatetimeTZDtype) and not values.isna().any():
+            utc = values.dt.tz_convert('UTC').dt.tz_localize(None).to_numpy(dtype='datetime64[s]').astype('int64')
+            offsets = values.dt.tz_localize(None).to_numpy(dtype='datetime64[s]').astype('int64') - utc
+            zones = {}
+            codes = [zones.setdefault(zone, len(zones)) for zone in zip(offsets.tolist(), (text.split(' ', 2)[2] for text in format_report_datetimes(values)))]
+            columns.append({'key': key, 'type': 'time', 'values': utc.tolist(), 'codes': codes, 'zones': [list(zone) for zone in zones]})
+        elif key == 'datetime':
+            columns.append({'key': key, 'type': 'text', 'values': [v.strftime('%Y-%m-%d %H:%M:%S %Z') if pd.notna(v) else 'N/A' for v in values]})
+        elif key == 'work_hours' or pd.api.types.is_bool_dtype(values):
+            columns.append({'key': key, 'type': 'bool', 'values': [1 if v else 0 for v in values]})
+        elif pd.api.types.is_numeric_dtype(values):
+            columns.append({'key': key, 'type': 'num', 'values': [None if pd.isna(v) else v.item() if hasattr(v, 'item') else v for v in values]})
+        elif key == 'url':
+            columns.append({'key': key, 'type': 'url', 'values': [str(v) for v in values]})
+        else:
+            codes, uniques = pd.factorize(values)
+            columns.append({'key': key, 'type': 'dict', 'codes': codes.tolist(), 'dict': [str(v) for v in uniques]})
+    payload = {'rows': len(rows), 'columns': columns}
+    if 'work_hours' in columns_map and 'inappropriate' in rows.columns: payload['flagged'] = [1 if v else 0 for v in rows['inappropriate']]
+    return payload
+
+def write_table_data_html(f, dataframe, columns_map, sort_by_col='datetime', ascending_sort=False):
+    # --paged-tables counterpart of write_table_rows_html: the rows go into the <tbody> as one JSON payload that
+    # PAGED_TABLES_SCRIPT renders a page at a time once the table's tab is first shown
+    if dataframe.empty: return write_table_rows_html(f, dataframe, columns_map)
+    if sort_by_col in dataframe.columns: dataframe = dataframe.sort_values(by=sort_by_col, ascending=ascending_sort)
+    payload = json.dumps(table_payload(dataframe, columns_map), separators=(',', ':'), allow_nan=False).replace('<', '\\u003c')
+    f.write(f"<tr class='paged-placeholder'><td colspan='{len(columns_map)}' style='text-align:center; padding:10px;'>Loading {len(dataframe)} rows...</td></tr>")
+    f.write(f'<script type="application/json" class="paged-table-data">{payload}</script>')
+
+PAGED_TABLES_SCRIPT = """
+        <style>
+            .paged-tools { display: flex; flex-wrap: wrap; gap: 8px; align-items: center; margin-top: 15px; font-size: 0.9em; }
+            .paged-tools input, .paged-tools select { padding: 5px 8px; border: 1px solid #ced4da; border-radius: 4px; font-size: 0.95em; }
+            .paged-tools input { flex-grow: 1; min-width: 200px; }
+            .paged-pager { display: flex; gap: 8px; align-items: center; margin-top: 8px; font-size: 0.9em; color: #555; }
+            .paged-pager button { background-color: #f8f9fa; color: #0056b3; border: 1px solid #dee2e6; border-radius: 4px; padding: 5px 12px; cursor: pointer; }
+            .paged-pager button:disabled { color: #aaa; cursor: default; }
+            th.paged-sortable { cursor: pointer; user-select: none; }
+        </style>
+        <script>
+        (function() {
+            function pad(n) { return (n < 10 ? '0' : '') + n; }
+            function cellText(col, i) {
+                switch (col.type) {
+                    case 'time':
+                        var zone = col.zones[col.codes[i]], d = new Date((col.values[i] + zone[0]) * 1000);
+                        return d.getUTCFullYear() + '-' + pad(d.getUTCMonth() + 1) + '-' + pad(d.getUTCDate()) + ' ' + pad(d.getUTCHours()) + ':' + pad(d.getUTCMinutes()) + ':' + pad(d.getUTCSeconds()) + ' ' + zone[1];
+                    case 'dict': return col.codes[i] < 0 ? 'N/A' : col.dict[col.codes[i]];
+                    case 'bool': return col.values[i] ? 'Yes' : 'No';
+                    case 'missing': return 'N/A';
+                    default: return col.values[i] === null ? 'N/A' : String(col.values[i]);
+                }
+            }
+            function sortKey(col, i) {
+                if (col.type === 'time' || col.type === 'num' || col.type === 'bool') return col.values[i] === null ? -Infinity : col.values[i];
+                return cellText(col, i).toLowerCase();
+            }
+            function element(tag, attrs, text) {
+                var el = document.createElement(tag);
+                for (var name in attrs) el.setAttribute(name, attrs[name]);
+                if (text !== undefined) el.textContent = text;
+                return el;
+            }
+            function initTable(holder) {
+                var data = JSON.parse(holder.textContent), table = holder.closest('table'), tbody = holder.parentNode;
+                var cols = data.columns, headers = table.tHead.rows[0].cells, searchText = [];
+                var state = { page: 0, size: 100, sortCol: -1, asc: false, query: '', filters: {} };
+                var order = [], view = [];
+                for (var i = 0; i < data.rows; i++) order.push(i);
+
+                var tools = element('div', {'class': 'paged-tools'});
+                var search = element('input', {'type': 'search', 'placeholder': 'Search ' + data.rows + ' rows...'});
+                tools.appendChild(search);
+                cols.forEach(function(col, c) {
+                    if (col.type !== 'dict' && col.type !== 'bool') return;
+                    var select = element('select', {'title': headers[c].textContent});
+                    select.appendChild(element('option', {'value': ''}, headers[c].textContent + ': All'));
+                    var labels = col.type === 'bool' ? ['No', 'Yes'] : col.dict.slice().sort();
+                    labels.forEach(function(label) { select.appendChild(element('option', {'value': label}, label)); });
+                    select.addEventListener('change', function() { state.filters[c] = select.value; state.page = 0; update(); });
+                    tools.appendChild(select);
+                });
+                var sizeSelect = element('select', {'title': 'Rows per page'});
+                [50, 100, 500, 1000].forEach(function(size) {
+                    var option = element('option', {'value': size}, size + ' per page');
+                    if (size === state.size) option.selected = true;
+                    sizeSelect.appendChild(option);
+                });
+                sizeSelect.addEventListener('change', function() { state.size = +sizeSelect.value; state.page = 0; render(); });
+                tools.appendChild(sizeSelect);
+                table.parentNode.insertBefore(tools, table);
+
+                var pager = element('div', {'class': 'paged-pager'}), prev = element('button', {}, 'Previous'), next = element('button', {}, 'Next'), status = element('span');
+                pager.appendChild(prev); pager.appendChild(next); pager.appendChild(status);
+                table.parentNode.insertBefore(pager, table.nextSibling);
+                prev.addEventListener('click', function() { state.page--; render(); });
+                next.addEventListener('click', function() { state.page++; render(); });
+
+                var searchTimer;
+                search.addEventListener('input', function() {
+                    clearTimeout(searchTimer);
+                    searchTimer = setTimeout(function() { state.query = search.value.trim().toLowerCase(); state.page = 0; update(); }, 200);
+                });
+                Array.prototype.forEach.call(headers, function(th, c) {
+                    th.className += ' paged-sortable';
+                    th.title = 'Sort by ' + th.textContent;
+                    th.addEventListener('click', function() {
+                        state.asc = state.sortCol === c ? !state.asc : cols[c].type === 'url' || cols[c].type === 'dict';
+                        state.sortCol = c;
+                        var col = cols[c], keys = {}, dir = state.asc ? 1 : -1;
+                        order.forEach(function(i) { keys[i] = sortKey(col, i); });
+                        order.sort(function(a, b) { return keys[a] < keys[b] ? -dir : keys[a] > keys[b] ? dir : a - b; });
+                        Array.prototype.forEach.call(headers, function(other, o) { other.textContent = other.textContent.replace(/ [\\u25b2\\u25bc]$/, '') + (o === c ? (state.asc ? ' \\u25b2' : ' \\u25bc') : ''); });
+                        state.page = 0; update();
+                    });
+                });
+
+                function rowText(i) {
+                    if (searchText[i] === undefined) searchText[i] = cols.map(function(col) { return cellText(col, i); }).join(' ').toLowerCase();
+                    return searchText[i];
+                }
+                function update() {
+                    view = order.filter(function(i) {
+                        for (var c in state.filters) if (state.filters[c] && cellText(cols[c], i) !== state.filters[c]) return false;
+                        return !state.query || rowText(i).indexOf(state.query) >= 0;
+                    });
+                    render();
+                }
+                function render() {
+                    var pages = Math.max(1, Math.ceil(view.length / state.size));
+                    state.page = Math.min(Math.max(state.page, 0), pages - 1);
+                    var start = state.page * state.size, rows = document.createDocumentFragment();
+                    view.slice(start, start + state.size).forEach(function(i) {
+                        var tr = element('tr');
+                        cols.forEach(function(col) {
+                            var td = element('td'), text = cellText(col, i);
+                            if (col.type === 'url') {
+                                td.appendChild(element('a', {'href': text, 'target': '_blank', 'title': text}, text.length > 80 ? text.slice(0, 80) + '...' : text));
+                            } else {
+                                td.textContent = text;
+                                if (col.key === 'work_hours' && col.values[i] && data.flagged && data.flagged[i]) td.className = 'warning-text';
+                            }
+                            tr.appendChild(td);
+                        });
+                        rows.appendChild(tr);
+                    });
+                    if (!view.length) {
+                        var tr = element('tr'), td = element('td', {'colspan': cols.length, 'style': 'text-align:center; padding:10px;'}, 'No matching rows.');
+                        tr.appendChild(td); rows.appendChild(tr);
+                    }
+                    tbody.textContent = '';
+                    tbody.appendChild(rows);
+                    prev.disabled = state.page === 0; next.disabled = state.page >= pages - 1;
+                    status.textContent = view.length ? 'Rows ' + (start + 1) + '-' + Math.min(start + state.size, view.length) + ' of ' + view.length + (view.length < data.rows ? ' (filtered from ' + data.rows + ')' : '') + ' | Page ' + (state.page + 1) + ' of ' + pages : '0 of ' + data.rows + ' rows';
+                }
+                update();
+            }
+            function renderVisibleTables() {
+                var holders = document.querySelectorAll('script.paged-table-data');
+                for (var i = 0; i < holders.length; i++) {
+                    var table = holders[i].closest('table');
+                    if (table.offsetParent !== null) { holders[i].className = 'paged-table-loaded'; initTable(holders[i]); }
+                }
+            }
+            // Tables are parsed and rendered the first time their tab is opened
+            ['openMainTab', 'openSubTab'].forEach(function(name) {
+                var original = window[name];
+                window[name] = function() { original.apply(this, arguments); renderVisibleTables(); };
+            });
+        })();
+        </script>"""
+
+CHART_FORMATS = ('png', 'svg')
+DEFAULT_CHART_DPI = 150
+CHART_STYLE_VERSION = 1  # part of every chart file's hash; bump when panel styling changes so cached files are redrawn
+CHART_FIGSIZE = (8, 6.5)
+
+# Report panels by name; render_chart looks them up so worker processes only receive picklable data
+CHART_PLOTTERS = {
+    'work_hours': lambda data, ax, **kwargs: ax.pie(data.values, labels=['Work Hours' if idx else 'Non-Work Hours' for idx in data.index], colors=['lightgreen' if idx else 'lightcoral' for idx in data.index], autopct='%1.1f%%', startangle=90),
+    'categories': lambda data, ax, **kwargs: sns.barplot(x=data.index, y=data.values, ax=ax, hue=data.index, palette="viridis", legend=False, **kwargs.get('sns_params',{})),
+    'inappropriate': lambda data, ax, **kwargs: ax.pie(data.values, labels=['Inappropriate' if idx else 'Appropriate' for idx in data.index], colors=['red' if idx else 'lightblue' for idx in data.index], autopct='%1.1f%%', startangle=90),
+    'hourly': lambda data, ax, **kwargs: sns.barplot(x=data.index, y=data.values, ax=ax, hue=data.index, color="skyblue", legend=False, **kwargs.get('sns_params',{})),
+    'weekday': lambda data, ax, **kwargs: sns.barplot(x=data.index, y=data.values, ax=ax, hue=data.index, palette="Spectral", legend=False, **kwargs.get('sns_params',{})),
+    'top_domains': lambda data, ax, **kwargs: sns.barplot(y=data.index, x=data.values, ax=ax, hue=data.index, palette="coolwarm", orient='h', legend=False, **kwargs.get('sns_params',{})),
+    'streaming_hourly': lambda data, ax, **kwargs: sns.barplot(x=data.index, y=data.values, ax=ax, hue=data.index, color="orange", legend=False, **kwargs.get('sns_params',{})),
+    'category_work_hours': lambda data, ax, **kwargs: data.plot(kind='bar', ax=ax, stacked=False, **kwargs.get('plot_params',{})),
+    'inappropriate_daily': lambda data, ax, **kwargs: data.plot(kind='line', ax=ax, marker='o', color='red', **kwargs.get('plot_params',{})),
+    'category_time': lambda data, ax, **kwargs: sns.barplot(x=data.index, y=data.values, ax=ax, hue=data.index, palette="viridis", legend=False, **kwargs.get('sns_params',{})),
+    'category_work_hours_time': lambda data, ax, **kwargs: data.plot(kind='bar', ax=ax, stacked=False, **kwargs.get('plot_params',{})),
+}
+
+def report_charts_dir(output_file):
+    # Charts live next to their report (report.html -> report_charts/), so runs writing different reports never share files
+    return os.path.splitext(output_file)[0] + '_charts'
+
+def render_chart(key, data, title, xlabel, ylabel, params, path, dpi):
+    import matplotlib
+    matplotlib.use('Agg')  # charts are only ever written to files, also from worker processes
+    import matplotlib.pyplot as plt
+    try: plt.style.use('seaborn-v0_8-darkgrid')
+    except: plt.style.use('ggplot')
+    fig, ax = plt.subplots(figsize=CHART_FIGSIZE)
+    has_data = False
+    if isinstance(data, pd.DataFrame):
+        if not data.empty and not (data.sum(axis=0).eq(0).all() and data.sum(axis=1).eq(0).all()): has_data = True
+    elif isinstance(data, pd.Series):
+        if not data.empty and data.sum() > 0: has_data = True
+
+    if has_data: CHART_PLOTTERS[key](data, ax, **params)
+    else: ax.text(0.5, 0.5, "No Data Available", ha="center", va="center", fontsize=10, color='grey')
+
+    ax.set_title(title, fontsize=14)
+    if xlabel: ax.set_xlabel(xlabel, fontsize=12)
+    if ylabel: ax.set_ylabel(ylabel, fontsize=12)
+    if has_data:
+        if params.get('xtick_rotation'): plt.setp(ax.get_xticklabels(), rotation=params['xtick_rotation'], ha='right', fontsize=10)
+        if params.get('ytick_fontsize'): plt.setp(ax.get_yticklabels(), fontsize=params['ytick_fontsize'])
+        if params.get('axis_equal'): ax.axis('equal')
+        if params.get('legend_title') and ax.get_legend() is not None: ax.legend(title=params['legend_title'], fontsize=10)
+    fig.tight_layout()
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        fig.savefig(tmp_path, dpi=dpi, bbox_inches='tight', format=os.path.splitext(path)[1][1:])
+        os.replace(tmp_path, path)
+    finally:
+        plt.close(fig)
+        if os.path.exists(tmp_path): os.remove(tmp_path)
+    return path
+
+def render_charts(panels, charts_dir, chart_format='png', dpi=DEFAULT_CHART_DPI, workers=1):
+    # panels: (key, data, title, xlabel, ylabel, params) tuples. Each panel is written to <charts_dir>/<key>.<hash>.<format>,
+    # the hash covering its input data, labels, format and DPI: files from earlier runs with the same inputs are reused,
+    # only changed panels are drawn (across `workers` processes), and superseded files are removed.
+    # Returns (title, path) for every panel that is available.
+    try: os.makedirs(charts_dir, exist_ok=True)
+    except OSError as e: print(f"Error saving charts: {e}"); return []
+    charts, jobs = [], []
+    for key, data, title, xlabel, ylabel, params in panels:
+        fingerprint = json.dumps([CHART_STYLE_VERSION, key, title, xlabel, ylabel, params, chart_format, dpi, data.to_json(orient='split', date_format='iso')])
+        path = os.path.join(charts_dir, f"{key}.{hashlib.sha256(fingerprint.encode('utf-8')).hexdigest()[:16]}.{chart_format}")
+        charts.append((title, path))
+        if not os.path.exists(path): jobs.append((key, data, title, xlabel, ylabel, params, path, dpi))
+
+    failed = set()
+    if workers > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as pool:
+            futures = [(job, pool.submit(render_chart, *job)) for job in jobs]
+            for job, future in futures:
+                try: future.result()
+                except Exception as e: print(f"Error saving chart '{job[2]}': {e}"); failed.add(job[6])
+    else:
+        for job in jobs:
+            try: render_chart(*job)
+            except Exception as e: print(f"Error saving chart '{job[2]}': {e}"); failed.add(job[6])
+
+    current = {os.path.basename(path) for _, path in charts}
+    stale = re.compile(r'(%s)\.[0-9a-f]{16}\.(%s)$' % ('|'.join(CHART_PLOTTERS), '|'.join(CHART_FORMATS)))
+    for name in os.listdir(charts_dir):
+        if stale.match(name) and name not in current:
+            try: os.remove(os.path.join(charts_dir, name))
+            except OSError: pass
+    return [(title, path) for title, path in charts if path not in failed]
+
+class CategoryCache:
+    # Persistent url -> (domain, category, inappropriate, reason) store, keyed by the RuleEngine fingerprint so
+    # changing patterns/whitelist/keywords never reuses stale results. Least recently used entries are evicted
+    # past max_entries. Any SQLite failure disables the cache for the rest of the run instead of the analysis.
+    COLUMNS = ['domain', 'category', 'inappropriate', 'inappropriate_reason']
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_entries=DEFAULT_CACHE_SIZE):
+        self.path = path
+        self.max_entries = max_entries
+        self.conn = None
+        self.entries = 0
+        self.disabled = False
+        self.hits = self.misses = 0
+
+    def __getstate__(self):
+        # Batch workers reopen their own connection
+        state = self.__dict__.copy()
+        state['conn'] = None
+        return state
+
+    def connect(self):
+        if self.conn is not None: return self.conn
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""CREATE TABLE IF NOT EXISTS url_categories (
+            ruleset TEXT NOT NULL, url TEXT NOT NULL, domain TEXT, category TEXT, inappropriate INTEGER, reason TEXT,
+            last_used INTEGER NOT NULL, PRIMARY KEY (ruleset, url)) WITHOUT ROWID""")
+        conn.execute("CREATE INDEX IF NOT EXISTS url_categories_last_used ON url_categories (last_used)")
+        conn.execute("CREATE TEMP TABLE lookup_urls (url TEXT PRIMARY KEY)")
+        self.conn = conn
+        with self.transaction(): self.evict()
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        # BEGIN IMMEDIATE takes the write lock up front (waiting out the busy timeout), so concurrent batch
+        # workers queue up instead of failing on a read -> write lock upgrade
+        self.conn.execute("BEGIN IMMEDIATE")
+        try: yield self.conn
+        except BaseException: self.conn.rollback(); raise
+        else: self.conn.commit()
+
+    def close(self):
+        if self.conn is not None: self.conn.close(); self.conn = None
+
+    def disable(self, error):
+        print(f"Warning: categorization cache '{self.path}' disabled: {error}")
+        self.disabled = True
+        self.close()
+
+    def categorize(self, urls, ruleset, compute):
+        # compute(urls Series) -> DataFrame of COLUMNS for the URLs not cached yet; returns COLUMNS for every url
+        if self.disabled: return compute(urls)
+        unique_urls = pd.Index(urls.unique())
+        try: cached = self.lookup(unique_urls, ruleset)
+        except (sqlite3.Error, OSError) as e: self.disable(e); return compute(urls)
+        missing = unique_urls[~unique_urls.isin(cached.index)]
+        computed = compute(pd.Series(missing, dtype=object)) if len(missing) else pd.DataFrame(columns=self.COLUMNS)
+        computed.index = missing
+        if len(missing):
+            try: self.store(computed, ruleset)
+            except (sqlite3.Error, OSError) as e: self.disable(e)
+        self.hits += len(cached); self.misses += len(missing)
+        table = pd.concat([cached, computed]) if len(cached) and len(missing) else (cached if len(cached) else computed)
+        result = table.reindex(urls.to_numpy())
+        result.index = urls.index
+        return result
+
+    def lookup(self, urls, ruleset):
+        conn = self.connect()
+        conn.execute("BEGIN")
+        try:
+            conn.execute("DELETE FROM lookup_urls")
+            conn.executemany("INSERT INTO lookup_urls VALUES (?)", ((url,) for url in urls))
+            rows = conn.execute("""SELECT c.url, c.domain, c.category, c.inappropriate, c.reason FROM lookup_urls l
+                                   JOIN url_categories c ON c.ruleset = ? AND c.url = l.url""", (ruleset,)).fetchall()
+        finally: conn.commit()
+        if rows:
+            with self.transaction():
+                conn.execute("UPDATE url_categories SET last_used = ? WHERE ruleset = ? AND url IN (SELECT url FROM lookup_urls)",
+                             (time.time_ns(), ruleset))
+        cached = pd.DataFrame.from_records(rows, columns=['url'] + self.COLUMNS, index='url') if rows else pd.DataFrame(columns=self.COLUMNS)
+        cached['inappropriate'] = cached['inappropriate'].astype(bool)
+        return cached
+
+    def store(self, computed, ruleset):
+        conn = self.connect()
+        now = time.time_ns()
+        with self.transaction():
+            conn.executemany("INSERT OR REPLACE INTO url_categories VALUES (?, ?, ?, ?, ?, ?, ?)",
+                             ((ruleset, url, domain, category, int(flag), reason, now) for url, domain, category, flag, reason in zip(
+                                 computed.index, computed['domain'], computed['category'], computed['inappropriate'], computed['inappropriate_reason'])))
+            self.entries += len(computed)
+            if self.entries > self.max_entries: self.evict()
+
+    def evict(self):
+        self.entries = self.conn.execute("SELECT COUNT(*) FROM url_categories").fetchone()[0]
+        if self.entries <= self.max_entries: return
+        self.conn.execute("""DELETE FROM url_categories WHERE (ruleset, url) IN
+                             (SELECT ruleset, url FROM url_categories ORDER BY last_used LIMIT ?)""", (self.entries - self.max_entries,))
+        self.entries = self.max_entries
+
+STATE_VERSION = 2
+URL_RESULT_COLUMNS = ['url', 'domain', 'visit_count', 'typed_count', 'category', 'inappropriate', 'inappropriate_reason']
+DERIVED_RESULT_COLUMNS = ['hour', 'weekday']  # not stored in state files; recomputed from 'datetime' on load
+
+def compact_frame(df):
+    # Repetitive string columns (domains, categories, reasons, visits of the same URL) become categoricals
+    df = df.copy(deep=False)
+    for column in df.columns:
+        if pd.api.types.is_string_dtype(df[column]) and len(df) and df[column].nunique(dropna=False) <= len(df) // 2:
+            df[column] = df[column].astype('category')
+    return df
+
+def expand_frame(df, dtypes=None):
+    # Inverse of compact_frame: categoricals go back to their original dtype (dtypes: column -> dtype), or to the
+    # dtype of their categories; missing values in object columns come back as None, as the analyzers produce them
+    df = df.copy(deep=False)
+    for column in df.columns:
+        if not isinstance(df[column].dtype, pd.CategoricalDtype): continue
+        dtype = (dtypes or {}).get(column, df[column].cat.categories.dtype)
+        values = df[column].astype(dtype)
+        df[column] = values.where(df[column].notna(), None) if dtype == object else values
+    return df
+
+def save_analysis_state(path, state):
+    # Written to a temporary file first, so an interrupted run leaves the previous state intact
+    rows = state['rows']
+    state = dict(state, version=STATE_VERSION, columns=list(rows.columns), dtypes=rows.dtypes.to_dict(),
+                 rows=compact_frame(rows.drop(columns=[c for c in DERIVED_RESULT_COLUMNS if c in rows.columns])))
+    if state.get('url_table') is not None:
+        state['url_table_dtypes'] = state['url_table'].dtypes.to_dict()
+        state['url_table'] = compact_frame(state['url_table'])
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        pd.to_pickle(state, tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path): os.remove(tmp_path)
+
+def load_analysis_state(path):
+    # -> the state saved by save_analysis_state, or None (with a warning if the file exists but is unusable)
+    if not os.path.exists(path): return None
+    try: state = pd.read_pickle(path)
+    except Exception as e: print(f"Warning: Cannot read state file '{path}' ({e}); analyzing everything."); return None
+    if not isinstance(state, dict) or state.get('version') != STATE_VERSION:
+        print(f"Warning: State file '{path}' is from another version of this tool; analyzing everything."); return None
+    rows = expand_frame(state['rows'], state.get('dtypes'))
+    if len(rows): rows = add_derived_columns(rows)[state['columns']]
+    state['rows'] = rows
+    if state.get('url_table') is not None: state['url_table'] = expand_frame(state['url_table'], state.get('url_table_dtypes'))
+    return state
+
+def add_derived_columns(rows):
+    # hour/weekday of each row's 'datetime', as _result_frame computes them
+    datetimes = rows['datetime']
+    rows['hour'] = datetimes.dt.hour.astype('int8')
+    rows['weekday'] = weekday_column(datetimes)
+    return rows
+
+EXPORT_FORMATS = {'.parquet': 'parquet', '.pq': 'parquet', '.arrow': 'arrow', '.feather': 'arrow', '.ipc': 'arrow'}
+
+def import_pyarrow():
+    # pyarrow is optional: only --export and --from-analyzed need it
+    try:
+        import pyarrow, pyarrow.ipc, pyarrow.parquet
+    except ImportError: raise ValueError("--export and --from-analyzed need the pyarrow package (pip install pyarrow).")
+    return pyarrow
+
+def export_format(path):
+    # 'parquet' or 'arrow' (IPC file, a.k.a. Feather v2) from the file extension
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in EXPORT_FORMATS: raise ValueError(f"Cannot tell the export format of '{path}'; use one of: {', '.join(EXPORT_FORMATS)}.")
+    return EXPORT_FORMATS[extension]
+
+class AnalyzedDatasetWriter:
+    # Writes analyzed rows (one frame, or chunk after chunk) to a Parquet or Arrow IPC file with the types of
+    # compact_result_frame (categoricals as dictionary-encoded strings) and timestamps with their timezone.
+    # Every chunk is cast to the schema of the first one, with 32-bit dictionary indices so chunks always fit.
+    def __init__(self, path):
+        self.path = path
+        self.format = export_format(path)
+        self.pa = import_pyarrow()
+        self.writer = self.sink = self.schema = None
+        self.rows = 0
+        self.tmp_path = f"{path}.{os.getpid()}.tmp"
+
+    def write(self, df):
+        if df.empty: return
+        pa = self.pa
+        table = pa.Table.from_pandas(compact_result_frame(df), preserve_index=False)
+        if self.schema is None:
+            fields = []
+            for field in table.schema:
+                if pa.types.is_dictionary(field.type): field = field.with_type(pa.dictionary(pa.int32(), pa.string()))
+                elif pa.types.is_null(field.type): field = field.with_type(pa.string())
+                fields.append(field)
+            self.schema = pa.schema(fields, metadata=table.schema.metadata)
+            if self.format == 'parquet': self.writer = pa.parquet.ParquetWriter(self.tmp_path, self.schema, compression='zstd')
+            else:
+                self.sink = pa.OSFile(self.tmp_path, 'wb')
+                self.writer = pa.ipc.new_file(self.sink, self.schema)
+        self.writer.write_table(table.cast(self.schema))
+        self.rows += len(df)
+
+    def close(self):
+        # Moves the finished file into place; returns the number of rows written (None if nothing was written)
+        if self.writer is None: return None
+        self.writer.close()
+        if self.sink is not None: self.sink.close()
+        os.replace(self.tmp_path, self.path)
+        return self.rows
+
+    def abort(self):
+        try:
+            if self.writer is not None: self.writer.close()
+            if self.sink is not None: self.sink.close()
+        except Exception: pass
+        if os.path.exists(self.tmp_path): os.remove(self.tmp_path)
+
+def export_analyzed(df, path):
+    writer = AnalyzedDatasetWriter(path)
+    try:
+        writer.write(df)
+        rows = writer.close()
+    except Exception as e:
+        writer.abort()
+        print(f"Error exporting analyzed records to '{path}': {e}"); return
+    if rows: print(f"Exported {rows} analyzed records to '{path}'.")
+
+def read_analyzed_dataset(path):
+    # Memory-maps a file written by AnalyzedDatasetWriter (format told by its magic bytes) back into a DataFrame
+    pa = import_pyarrow()
+    with open(path, 'rb') as f: magic = f.read(6)
+    if magic[:4] == b'PAR1': table = pa.parquet.read_table(path, memory_map=True)
+    elif magic == b'ARROW1':
+        with pa.memory_map(path) as source: table = pa.ipc.open_file(source).read_all()
+    else: raise ValueError(f"'{path}' is not a Parquet or Arrow IPC file written by --export.")
+    return table.to_pandas()
+
+INDEX_VERSION = 1
+INDEX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS subjects (id INTEGER PRIMARY KEY, case_name TEXT NOT NULL, name TEXT NOT NULL, UNIQUE (case_name, name));
+CREATE TABLE IF NOT EXISTS domains (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE, reversed TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS domains_reversed ON domains (reversed);
+CREATE TABLE IF NOT EXISTS urls (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE);
+CREATE TABLE IF NOT EXISTS records (
+    subject_id INTEGER NOT NULL, url_id INTEGER NOT NULL, visit_time INTEGER NOT NULL, domain_id INTEGER, category TEXT,
+    work_hours INTEGER NOT NULL, inappropriate INTEGER NOT NULL, reason TEXT, PRIMARY KEY (subject_id, url_id, visit_time)) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS records_domain ON records (domain_id, subject_id, visit_time);
+CREATE INDEX IF NOT EXISTS records_category ON records (category, work_hours, visit_time);
+"""
+INDEX_DICTIONARY_INSERTS = {'domains': "INSERT OR IGNORE INTO domains (name, reversed) SELECT name, reverse_host(name) FROM ingest_names",
+                            'urls': "INSERT OR IGNORE INTO urls (name) SELECT name FROM ingest_names"}
+
+def reverse_host(netloc):
+    # 'www.Example.com:8080' -> 'com.example.www', so a domain and all its subdomains are one index range
+    return '.'.join(reversed(netloc_host(netloc).split('.')))
+
+def object_values(series):
+    # Column values as Python objects, None where missing (what sqlite3 binds as NULL)
+    values = series.astype(object)
+    return values.where(series.notna(), None).tolist()
+
+class AnalysisIndex:
+    # Append-only SQLite store of analyzed records from many runs, tagged by case and subject, that the query
+    # subcommand searches. A record is keyed by (subject, URL, visit time), so ingesting the same rows again, or a
+    # later pull that overlaps an earlier one, adds nothing twice. Domains and URLs are stored once each; records are
+    # indexed by (domain, subject, time) and (category, work hours, time). Batch workers write concurrently, as
+    # with CategoryCache. Any failure disables the index for the rest of the run instead of the analysis.
+    def __init__(self, path, case=''):
+        self.path = path
+        self.case = case
+        self.conn = None
+        self.disabled = False
+        self.records = self.added = 0
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['conn'] = None
+        return state
+
+    def connect(self):
+        if self.conn is not None: return self.conn
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        try:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if version != INDEX_VERSION and conn.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()[0]:
+                raise ValueError(f"'{self.path}' is not an index written by this version of octorecon.py.")
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(INDEX_SCHEMA)
+            conn.execute(f"PRAGMA user_version = {INDEX_VERSION}")
+            conn.execute("CREATE TEMP TABLE ingest_names (name TEXT PRIMARY KEY)")
+            conn.create_function('reverse_host', 1, reverse_host, deterministic=True)
+        except BaseException: conn.close(); raise
+        self.conn = conn
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        try: yield self.conn
+        except BaseException: self.conn.rollback(); raise
+        else: self.conn.commit()
+
+    def close(self):
+        if self.conn is not None:
+            try: self.conn.execute("PRAGMA optimize")
+            except sqlite3.Error: pass
+            self.conn.close(); self.conn = None
+
+    def disable(self, error):
+        print(f"Warning: index '{self.path}' disabled, records are not indexed: {error}")
+        self.disabled = True
+        self.close()
+
+    def add(self, df, subject):
+        # Ingests analyzed rows of one subject; returns how many were not in the index yet
+        if self.disabled or df.empty: return 0
+        try:
+            conn = self.connect()
+            with self.transaction():
+                conn.execute("INSERT OR IGNORE INTO subjects (case_name, name) VALUES (?, ?)", (self.case, subject))
+                subject_id = conn.execute("SELECT id FROM subjects WHERE case_name = ? AND name = ?", (self.case, subject)).fetchone()[0]
+                rows = zip(itertools.repeat(subject_id), self._ids('urls', df['url']),
+                           df['datetime'].to_numpy(dtype='datetime64[us]').astype('int64').tolist(), self._ids('domains', df['domain']),
+                           object_values(df['category']), df['work_hours'].astype(int).tolist(), df['inappropriate'].astype(int).tolist(),
+                           object_values(df['inappropriate_reason']))
+                before = conn.total_changes
+                conn.executemany("INSERT OR IGNORE INTO records VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+                added = conn.total_changes - before
+        except (sqlite3.Error, OSError, ValueError) as e: self.disable(e); return 0
+        self.records += len(df); self.added += added
+        return added
+
+    def _ids(self, table, values):
+        # Row ids of values in a dictionary table (domains, urls), adding the new ones; None for missing values
+        codes, names = pd.factorize(values)
+        self.conn.execute("DELETE FROM ingest_names")
+        self.conn.executemany("INSERT INTO ingest_names VALUES (?)", ((name,) for name in names))
+        self.conn.execute(INDEX_DICTIONARY_INSERTS[table])
+        ids = dict(self.conn.execute(f"SELECT n.name, t.id FROM ingest_names n JOIN {table} t ON t.name = n.name"))
+        return np.array([ids[name] for name in names] + [None], dtype=object)[codes].tolist()
+
+    def totals(self):
+        # -> (subjects, records) in the whole index
+        conn = self.connect()
+        return conn.execute("SELECT COUNT(*) FROM subjects").fetchone()[0], conn.execute("SELECT COUNT(*) FROM records").fetchone()[0]
 
 class BrowserHistoryAnalyzer:
-    def __init__(self, start_time, end_time, work_days, work_keywords=[], custom_categories_map=None):
+    def __init__(self, start_time, end_time, work_days, work_keywords=[], custom_categories_map=None, shifts=None, timezone=DEFAULT_TIMEZONE,
+                 ruleset=None, builtin_rules=True):
         self.start_time = start_time
         self.end_time = end_time
         self.work_days = work_days
+        self.shifts = shifts
+        # shifts: optional [(name, work_days, start_time, end_time), ...] replacing the single start/end/days schedule
+        self.schedule = WorkSchedule(shifts if shifts else [(None, work_days, start_time, end_time)])
         self.work_keywords = [wk.lower() for wk in work_keywords if wk]
         self.custom_categories_map = custom_categories_map if custom_categories_map else {}
+        self.category_cache = None  # optional CategoryCache used by the columnar engine
+        self.profile = None  # optional RunProfile (--profile/--profile-json)
+        self.idle_gap = DEFAULT_IDLE_GAP  # minutes; session split of the report's time-based view (--idle-gap)
+        self.ruleset = ruleset  # optional RuleSet from --rules files, merged into the rules below
         
-        self.aedt = pytz.timezone('Australia/Sydney')
-        self.aest = pytz.timezone('Australia/Brisbane')
+        # Local time of the office: timestamps are converted to it before work hours are evaluated
+        try: self.timezone = pytz.timezone(timezone)
+        except pytz.UnknownTimeZoneError: raise ValueError(f"Unknown timezone '{timezone}'. Use an IANA name such as 'Australia/Sydney' or 'Europe/London'.")
+        self.timestamp_drops = {'zero': 0, 'missing': 0, 'invalid': 0}
         
         self.COMMON_LEGIT_DOMAINS_WHITELIST = {
             "microsoft.com", "office.com", "live.com", "sharepoint.com", "outlook.com", "teams.microsoft.com",
@@ -98,305 +1955,671 @@ class BrowserHistoryAnalyzer:
             'escort', 'brothel', 'hooker', 'prostitute',
             'betting', 'poker', 'casino', 'gambling', 'sportsbet', 'betfair', 'bet365', 'neds', 'ladbrokes', 'punt', 'bookmaker', 'slotmachine'
         }
+        if not builtin_rules:  # --no-builtin-rules: only the ruleset files apply
+            self.COMMON_LEGIT_DOMAINS_WHITELIST, self.COMMON_LEGIT_DOMAIN_PATTERNS, self.inappropriate_keywords = set(), [], set()
+            self.patterns = {name: [] for name in self.patterns}
+        self.compile_rules()
+
+    def __getstate__(self):
+        # Pickled for batch worker processes: ship the rule definitions, recompile on arrival
+        state = self.__dict__.copy()
+        del state['rule_engine']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.compile_rules()
+
+    def compile_rules(self):
+        # Call again after changing patterns/whitelists/keywords on an existing analyzer
+        self.rule_engine = RuleEngine(self.patterns, self.COMMON_LEGIT_DOMAINS_WHITELIST, self.COMMON_LEGIT_DOMAIN_PATTERNS,
+                                      self.custom_categories_map, self.work_keywords, self.inappropriate_keywords, ruleset=self.ruleset)
+
+    def reload_rules(self):
+        # Re-reads the --rules files if any changed on disk since they were loaded; returns whether the rules changed.
+        # A file that no longer parses raises ValueError and leaves the current rules in place.
+        if self.ruleset is None or not self.ruleset.changed(): return False
+        self.ruleset = RuleSet(self.ruleset.specs, self.ruleset.cache_dir)
+        self.compile_rules()
+        return True
         
     def parse_timestamp(self, timestamp_str):
-        try:
-            if pd.isna(timestamp_str): return None
-            timestamp = float(str(timestamp_str))
-            WINDOWS_EPOCH_OFFSET = 11644473600
-            unix_timestamp = (timestamp / 1000000) - WINDOWS_EPOCH_OFFSET
-            if timestamp == 0: return None
-            dt = datetime.datetime.fromtimestamp(unix_timestamp, tz=datetime.timezone.utc)
-            try: dt_aware = dt.astimezone(self.aedt)
-            except: dt_aware = dt.astimezone(self.aest)
-            return dt_aware
-        except: return None 
+        # WebKit microseconds -> aware datetime in self.timezone, or None (counted in timestamp_drops)
+        if is_missing(timestamp_str): self.timestamp_drops['missing'] += 1; return None
+        try: webkit_us = int(str(timestamp_str).strip())
+        except ValueError:
+            try: webkit_us = round(float(str(timestamp_str)))
+            except (ValueError, OverflowError): self.timestamp_drops['invalid'] += 1; return None
+        if webkit_us == 0: self.timestamp_drops['zero'] += 1; return None
+        if not MIN_WEBKIT_US <= webkit_us < MAX_WEBKIT_US: self.timestamp_drops['invalid'] += 1; return None
+        return (WEBKIT_EPOCH + datetime.timedelta(microseconds=webkit_us)).astimezone(self.timezone)
+
+    def take_timestamp_drops(self):
+        # Returns and resets the counts of rows skipped for their timestamp since the last call
+        drops, self.timestamp_drops = self.timestamp_drops, {'zero': 0, 'missing': 0, 'invalid': 0}
+        if self.profile is not None:
+            for reason, n in drops.items():
+                if n: self.profile.count(f'rows_dropped_{reason}', n)
+        return drops
+
+    def stage(self, name):
+        # Times a block as a --profile stage; free when not profiling
+        return self.profile.stage(name) if self.profile is not None else nullcontext()
+
+    def timed_chunks(self, chunks):
+        # Yields chunks, charging the time spent producing each (reading and parsing the input) to the 'read' stage
+        if self.profile is None: yield from chunks; return
+        chunks = iter(chunks)
+        while True:
+            with self.profile.stage('read'): chunk = next(chunks, None)
+            if chunk is None: return
+            self.profile.count('rows_read', len(chunk))
+            yield chunk
+
+    def report_timestamp_drops(self):
+        message = describe_timestamp_drops(self.take_timestamp_drops())
+        if message: print(message)
     
     def get_main_domain(self, netloc):
         if not netloc: return ""
-        parts = netloc.split('.')
-        if len(parts) > 2:
-            if parts[-2].lower() in ('com', 'co', 'org', 'net', 'gov', 'edu', 'ac', 'net') and len(parts[-1]) == 2: 
-                return '.'.join(parts[-3:]).lower()
-            return '.'.join(parts[-2:]).lower() 
-        return netloc.lower() 
+        return self.rule_engine.main_domain(netloc)
 
-    def categorize_url(self, url):
-        if pd.isna(url) or not url: return 'other'
+    def match_category(self, url):
+        # Single pass over the URL: returns (category, matching keyword/pattern or None)
+        if is_missing(url) or not url: return 'other', None
         try: decoded_url = unquote(url)
         except Exception: decoded_url = url
-        url_lower = decoded_url.lower()
         parsed_url = urlparse(decoded_url)
-        domain_full = parsed_url.netloc.lower()
-        main_domain = self.get_main_domain(parsed_url.netloc)
         path_query_lower = (parsed_url.path + ('?' if parsed_url.query else '') + parsed_url.query).lower()
+        return self.rule_engine.classify(decoded_url.lower(), parsed_url.netloc.lower(), path_query_lower)
 
-        if self.custom_categories_map:
-            sorted_custom_keywords = sorted(self.custom_categories_map.keys(), key=len, reverse=True)
-            for custom_keyword in sorted_custom_keywords:
-                pattern = r'(?:^|[\W_])' + re.escape(custom_keyword) + r'(?:$|[\W_])'
-                if re.search(pattern, url_lower, re.IGNORECASE):
-                    return self.custom_categories_map[custom_keyword].lower()
-
-        is_whitelisted_domain = False
-        if main_domain in self.COMMON_LEGIT_DOMAINS_WHITELIST:
-            is_whitelisted_domain = True
-        if not is_whitelisted_domain:
-            for legit_pattern in self.COMMON_LEGIT_DOMAIN_PATTERNS: 
-                if re.search(legit_pattern, domain_full):
-                    is_whitelisted_domain = True
-                    break
-        
-        if is_whitelisted_domain:
-            for keyword in self.work_keywords: 
-                if keyword in domain_full or keyword in path_query_lower: return 'work'
-            for legit_pattern in self.COMMON_LEGIT_DOMAIN_PATTERNS: 
-                 if re.search(legit_pattern, domain_full): return 'infrastructure_internal'
-
-        sorted_work_keywords = sorted(self.work_keywords, key=len, reverse=True)
-        for keyword in sorted_work_keywords:
-            pattern = r'(?:^|[\W_])' + re.escape(keyword) + r'(?:$|[\W_])' 
-            if re.search(pattern, url_lower, re.IGNORECASE):
-                return 'work'
-
-        category_check_order = ['infrastructure_internal', 'adult', 'streaming', 'shopping', 'gaming', 'social_media', 'news']
-        for category_name in category_check_order:
-            patterns_for_category = self.patterns.get(category_name, [])
-            for pattern_item in patterns_for_category: 
-                is_regex = pattern_item.startswith(r'^') and pattern_item.endswith(r'$')
-                if is_regex: 
-                    if re.match(pattern_item, domain_full): return category_name
-                else: 
-                    if pattern_item in domain_full: return category_name
-                    if category_name not in ['infrastructure_internal', 'adult'] and pattern_item in path_query_lower:
-                         return category_name
-        return 'other'
-
-    def is_inappropriate(self, url, url_category, domain_full, main_domain):
-        if pd.isna(url) or not url: return False, None
+    def categorize_url(self, url):
+        category, rule = self.match_category(url)
+        if self.profile is not None: self.profile.add_rule_hit(category, rule)
+        return category
+
+    def is_inappropriate(self, url, url_category, domain_full):
+        if is_missing(url) or not url: return False, None
         if url_category in ['work', 'infrastructure_internal']: return False, None
-        if main_domain in self.COMMON_LEGIT_DOMAINS_WHITELIST: return False, None
-        for legit_pattern in self.COMMON_LEGIT_DOMAIN_PATTERNS:
-            if re.search(legit_pattern, domain_full): return False, None
+        if self.rule_engine.is_whitelisted(domain_full): return False, None
         
         try: decoded_url = unquote(url)
         except Exception: decoded_url = url
-        url_lower = decoded_url.lower()
-
-        for keyword in self.inappropriate_keywords:
-            pattern = r'(?:^|[\W_])' + re.escape(keyword) + r'(?:$|[\W_])'
-            if re.search(pattern, url_lower, re.IGNORECASE):
-                 return True, keyword
-        return False, None
+        reason = self.rule_engine.match_inappropriate_domain(domain_full) or self.rule_engine.match_inappropriate(decoded_url.lower())
+        return (True, reason) if reason else (False, None)
     
     def is_work_hours(self, dt):
-        if dt is None or pd.isna(dt): return False
-        day_of_week_num = dt.weekday()
-        day_map_to_int = {'M': 0, 'T': 1, 'W': 2, 'Th': 3, 'F': 4, 'Sa': 5, 'Su': 6}
-        work_day_numbers = [day_map_to_int[d_abbr] for d_abbr in self.work_days if d_abbr in day_map_to_int]
-        if day_of_week_num not in work_day_numbers: return False
-        
-        time_obj = dt.time()
-        time_formats = ["%H:%M", "%I:%M%p", "%H", "%I%p"] 
-        parsed_start_time, parsed_end_time = None, None
-        for fmt in time_formats:
-            try:
-                if parsed_start_time is None:
-                    parsed_start_time = datetime.datetime.strptime(self.start_time.upper().replace(" ", ""), fmt).time()
-            except ValueError: pass
-            try:
-                if parsed_end_time is None:
-                    parsed_end_time = datetime.datetime.strptime(self.end_time.upper().replace(" ", ""), fmt).time()
-            except ValueError: pass
-        
-        if parsed_start_time is None or parsed_end_time is None: return False 
-        
-        if parsed_end_time <= parsed_start_time: 
-            return time_obj >= parsed_start_time or time_obj < parsed_end_time
-        else: 
-            return parsed_start_time <= time_obj < parsed_end_time
+        if is_missing(dt): return False
+        return self.schedule.contains(dt)
     
-    def analyze_csv(self, csv_file):
+    def analyze_csv(self, csv_file, engine='columnar'):
         try:
-            df = pd.read_csv(csv_file, on_bad_lines='skip', low_memory=False)
+            with self.stage('read'): df = pd.read_csv(csv_file, on_bad_lines='skip', low_memory=False)
+            if self.profile is not None: self.profile.count('rows_read', len(df))
             required_columns = ['url', 'last_visit_time']
             if not all(col in df.columns for col in required_columns):
                 print(f"Error: CSV must contain 'url' and 'last_visit_time'. Found: {list(df.columns)}")
                 return pd.DataFrame()
             
-            data = []
-            for index, row in df.iterrows():
-                dt = self.parse_timestamp(row['last_visit_time'])
-                if dt is None: continue
-                
-                url = str(row.get('url', '')) 
-                if not url or pd.isna(url): url = "Unknown_URL"
-
-                parsed_url_for_domain = urlparse(url)
-                domain_full_for_check = parsed_url_for_domain.netloc.lower()
-                main_domain_for_check = self.get_main_domain(parsed_url_for_domain.netloc)
-                url_category = self.categorize_url(url) 
-                is_inappropriate_flag, inappropriate_keyword_reason = self.is_inappropriate(url, url_category, domain_full_for_check, main_domain_for_check)
-                work_hours_flag = self.is_work_hours(dt)
-                
-                data.append({
-                    'visit_id': row.get('id', index), 'url': url,
-                    'domain': domain_full_for_check if url != "Unknown_URL" else "Unknown_Domain",
-                    'visit_count': int(row.get('visit_count', 0)) if pd.notna(row.get('visit_count')) else 0,
-                    'typed_count': int(row.get('typed_count', 0)) if pd.notna(row.get('typed_count')) else 0,
-                    'datetime': dt, 'hour': dt.hour, 'weekday': dt.strftime('%A'),
-                    'date': dt.date(), 'category': url_category, 
-                    'inappropriate': is_inappropriate_flag,
-                    'inappropriate_reason': inappropriate_keyword_reason,
-                    'work_hours': work_hours_flag
-                })
-            
-            if not data: return pd.DataFrame()
-            result_df = pd.DataFrame(data)
-            result_df['datetime'] = pd.to_datetime(result_df['datetime'], errors='coerce')
-            result_df.dropna(subset=['datetime'], inplace=True)
+            result_df = self.analyze_dataframe(df, engine)
+            if result_df.empty: return pd.DataFrame()
             print(f"Successfully processed {len(result_df)} records from {len(df)} initial rows.")
+            self.report_timestamp_drops()
             return result_df
         except Exception as e:
             print(f"Critical error reading or processing CSV file '{csv_file}': {e}")
             traceback.print_exc()
             return pd.DataFrame()
 
-    def generate_report(self, df, output_file='browser_history_report.html'):
-        if df.empty:
-            print("Cannot generate report: No data to analyze")
-            return None
-        
-        try: plt.style.use('seaborn-v0_8-darkgrid')
-        except: plt.style.use('ggplot')
+    def analyze_history_db(self, db_path, engine='columnar', chunksize=DEFAULT_CHUNKSIZE, visits=False):
+        # db_path: a History database or places.sqlite, or a list of inputs (see open_history)
+        try:
+            source = open_history(db_path)
+            if visits and not source.has_visits: print("Warning: --visits needs a History database; a CSV export only has one row per URL."); visits = False
+            if visits:
+                chunks = list(self.iter_visit_chunks(source, engine, chunksize))
+                result_df = concat_results(chunks) if chunks else pd.DataFrame()
+                if result_df.empty: return pd.DataFrame()
+                print(f"Successfully processed {len(result_df)} visits of {result_df['url_id'].nunique()} URLs.")
+                self.report_timestamp_drops()
+                return result_df
+            result_df, total_rows = self.analyze_chunks(source.iter_urls(chunksize), engine)
+            if result_df.empty: return pd.DataFrame()
+            print(f"Successfully processed {len(result_df)} records from {total_rows} initial rows.")
+            self.report_timestamp_drops()
+            return result_df
+        except ValueError as e:
+            print(f"Error: {e}")
+            return pd.DataFrame()
+        except sqlite3.Error as e:
+            print(f"Error reading History database '{history_name(db_path)}': {e}. {HISTORY_DB_HINT}")
+            return pd.DataFrame()
+        except Exception as e:
+            print(f"Critical error reading or processing History database '{history_name(db_path)}': {e}")
+            traceback.print_exc()
+            return pd.DataFrame()
 
-        fig, axes = plt.subplots(3, 3, figsize=(22, 26)) 
-        fig.suptitle('Browser History Analysis', fontsize=22, y=1.01)
-        
-        chart_plot_config = [
-            (
-                lambda data, ax, **kwargs: ax.pie(data.values, labels=['Work Hours' if idx else 'Non-Work Hours' for idx in data.index], colors=['lightgreen' if idx else 'lightcoral' for idx in data.index], autopct='%1.1f%%', startangle=90),
-                df['work_hours'].value_counts(), (0,0), 'Activity: Work vs Non-Work Hours', None, None, {'axis_equal': True}
-            ),
-            (
-                lambda data, ax, **kwargs: sns.barplot(x=data.index, y=data.values, ax=ax, hue=data.index, palette="viridis", legend=False, **kwargs.get('sns_params',{})),
-                df['category'].value_counts(), (0,1), 'Website Categories Accessed', None, 'Visits', {'xtick_rotation': 45}
-            ),
-            (
-                lambda data, ax, **kwargs: ax.pie(data.values, labels=['Inappropriate' if idx else 'Appropriate' for idx in data.index], colors=['red' if idx else 'lightblue' for idx in data.index], autopct='%1.1f%%', startangle=90),
-                df['inappropriate'].value_counts(), (0,2), 'Inappropriate Content Detection', None, None, {'axis_equal': True}
-            ),
-            (
-                lambda data, ax, **kwargs: sns.barplot(x=data.index, y=data.values, ax=ax, hue=data.index, color="skyblue", legend=False, **kwargs.get('sns_params',{})), 
-                df.groupby('hour').size().reindex(range(24), fill_value=0), (1,0), 'Activity by Hour of Day', 'Hour (0-23)', 'Visits', {}
-            ),
-            (
-                lambda data, ax, **kwargs: sns.barplot(x=data.index, y=data.values, ax=ax, hue=data.index, palette="Spectral", legend=False, **kwargs.get('sns_params',{})),
-                df.groupby('weekday').size().reindex(['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday'], fill_value=0), (1,1), 'Activity by Day of Week', None, 'Visits', {'xtick_rotation': 45}
-            ),
-            (
-                lambda data, ax, **kwargs: sns.barplot(y=data.index, x=data.values, ax=ax, hue=data.index, palette="coolwarm", orient='h', legend=False, **kwargs.get('sns_params',{})),
-                df['domain'][df['domain'].str.lower() != 'unknown_domain'].value_counts().nlargest(10), (1,2), 'Top 10 Visited Domains', 'Visits', None, {'ytick_fontsize': 10}
-            ),
-            (
-                lambda data, ax, **kwargs: sns.barplot(x=data.index, y=data.values, ax=ax, hue=data.index, color="orange", legend=False, **kwargs.get('sns_params',{})), 
-                df[df['category'] == 'streaming'].groupby('hour').size().reindex(range(24), fill_value=0), (2,0), 'Streaming Usage by Hour', 'Hour (0-23)', 'Visits', {}
-            ),
-            ( 
-                lambda data, ax, **kwargs: data.plot(kind='bar', ax=ax, stacked=False, **kwargs.get('plot_params',{})), 
-                df.groupby(['category', 'work_hours']).size().unstack(fill_value=0).rename(columns={True: 'Work Hours', False: 'Non-Work Hours'}), (2,1), 'Categories: Work vs Non-Work', None, 'Visits', {'xtick_rotation': 45, 'legend_title': 'Period'}
-            ),
-            (
-                lambda data, ax, **kwargs: data.plot(kind='line', ax=ax, marker='o', color='red', **kwargs.get('plot_params',{})),
-                df[df['inappropriate']].set_index('datetime').resample('D').size() if not df[df['inappropriate']].empty else pd.Series(dtype=int), (2,2), 'Inappropriate Content Over Time', 'Date', 'Count', {'xtick_rotation': 45}
-            )
-        ]
+    def analyze_file(self, path, engine='columnar', chunksize=DEFAULT_CHUNKSIZE, visits=False):
+        # path: a Chromium History database, Firefox places.sqlite or CSV export, or a list of them (see open_history)
+        try: source = open_history(path)
+        except (ValueError, sqlite3.Error) as e: print(f"Error: {e}"); return pd.DataFrame()
+        if source.kind != 'csv': return self.analyze_history_db(source, engine, chunksize, visits)
+        if visits: print("Warning: --visits needs a History database; a CSV export only has one row per URL.")
+        return self.analyze_csv(source.path, engine)
+
+    def load_analyzed(self, path):
+        # Reloads rows written by --export without re-reading the history or re-categorizing a single URL. Only
+        # what depends on this run's settings is recomputed: datetimes are shown in --timezone, and hour, weekday,
+        # date and work_hours follow them and the current work schedule.
+        try:
+            with self.stage('read'): df = read_analyzed_dataset(path)
+            if df.empty or 'datetime' not in df.columns: print(f"Error: '{path}' holds no analyzed rows."); return pd.DataFrame()
+            df = compact_result_frame(df)
+            df['datetime'] = df['datetime'].dt.tz_convert(self.timezone)
+            df = add_derived_columns(df)
+            df['work_hours'] = self.is_work_hours_column(df['datetime']).to_numpy()
+            print(f"Loaded {len(df)} analyzed records from '{path}'.")
+            return df
+        except ValueError as e:
+            print(f"Error: {e}")
+            return pd.DataFrame()
+        except Exception as e:
+            print(f"Critical error reading analyzed dataset '{path}': {e}")
+            traceback.print_exc()
+            return pd.DataFrame()
+
+    def iter_analyzed_chunks(self, path, engine='columnar', chunksize=DEFAULT_CHUNKSIZE, visits=False, summary=False):
+        # Yields (analyzed chunk, input rows it came from); only one chunk of input is held at a time
+        source = open_history(path)
+        if visits and source.has_visits:
+            for chunk in self.iter_visit_chunks(source, engine, chunksize, summary=summary): yield chunk, len(chunk)
+            return
+        if visits: print("Warning: --visits needs a History database; a CSV export only has one row per URL.")
+        for chunk in self.timed_chunks(source.iter_urls(chunksize)):
+            if not all(col in chunk.columns for col in ['url', 'last_visit_time']):
+                raise ValueError(f"CSV must contain 'url' and 'last_visit_time'. Found: {list(chunk.columns)}")
+            yield self.analyze_dataframe(chunk, engine, summary), len(chunk)
+
+    def aggregate_file(self, path, engine='columnar', chunksize=DEFAULT_CHUNKSIZE, visits=False, sinks=(), summary=False):
+        # Streaming counterpart of analyze_file: analyzed chunks go straight into a ReportAggregator
+        # and are dropped, so memory is bounded by the chunk size plus the flagged-URL tables.
+        # sinks: callables that also get every analyzed chunk (AnalyzedDatasetWriter.write for --export, AnalysisIndex.add)
+        # summary: counters only (--summary-only): lean chunks (see _summary_frame) and no flagged-URL tables
+        agg, total_rows = ReportAggregator(keep_tables=not summary, idle_gap=self.idle_gap), 0
+        try:
+            for chunk_result, rows in self.iter_analyzed_chunks(path, engine, chunksize, visits, summary):
+                total_rows += rows
+                with self.stage('aggregate'): agg.update(chunk_result)
+                for sink in sinks: sink(chunk_result)
+        except ValueError as e:
+            print(f"Error: {e}")
+            return ReportAggregator()
+        except sqlite3.Error as e:
+            print(f"Error reading History database '{history_name(path)}': {e}. {HISTORY_DB_HINT}")
+            return ReportAggregator()
+        except Exception as e:
+            print(f"Critical error reading or processing '{history_name(path)}': {e}")
+            traceback.print_exc()
+            return ReportAggregator()
+        agg.timestamp_drops = self.take_timestamp_drops()
+        if not agg.empty:
+            print(f"Successfully processed {agg.total} records from {total_rows} initial rows ({chunksize} rows per chunk).")
+            if describe_timestamp_drops(agg.timestamp_drops): print(describe_timestamp_drops(agg.timestamp_drops))
+        return agg
+
+    def analysis_settings(self, visits=False):
+        # Hash of everything besides the input rows that shapes an analyzed row; incremental state must match it
+        settings = [STATE_VERSION, self.rule_engine.fingerprint, repr(self.schedule.shifts), self.timezone.zone, visits]
+        return hashlib.sha256(json.dumps(settings).encode('utf-8')).hexdigest()
+
+    def analyze_incremental(self, path, state_path, engine='columnar', chunksize=DEFAULT_CHUNKSIZE, visits=False):
+        # analyze_file for repeated pulls of the same subject: only rows past the high-water mark saved in state_path
+        # by the previous run are read and analyzed, then merged with the rows analyzed back then (changed URLs replace
+        # their earlier row) and saved as the new state. Rows the browser has expired since are kept. Without a usable
+        # state (first run, other rules/schedule/timezone) everything is analyzed and the state is written.
+        try: return self.update_state(path, state_path, engine, chunksize, visits)
+        except ValueError as e:
+            print(f"Error: {e}")
+        except sqlite3.Error as e:
+            print(f"Error reading History database '{history_name(path)}': {e}. {HISTORY_DB_HINT}")
+        except Exception as e:
+            print(f"Critical error reading or processing '{history_name(path)}': {e}")
+            traceback.print_exc()
+        return pd.DataFrame()
+
+    def update_state(self, path, state_path, engine='columnar', chunksize=DEFAULT_CHUNKSIZE, visits=False):
+        # analyze_incremental without the error handling (batch workers report failures per subject)
+        self.take_timestamp_drops()  # count only the rows read by this run
+        source = open_history(path)
+        if source.kind == 'merged': raise ValueError("Incremental analysis (--state) needs a single history file, not merged profiles.")
+        if visits and not source.has_visits: print("Warning: --visits needs a History database; a CSV export only has one row per URL."); visits = False
+        settings = self.analysis_settings(visits)
+        state = load_analysis_state(state_path)
+        if state is not None and state['settings'] != settings:
+            print(f"State file '{state_path}' was written with other rules, work hours, timezone or --visits; analyzing everything.")
+            state = None
+        if visits: result_df, url_table, high_water, delta_rows = self._incremental_visits(source, engine, chunksize, state)
+        else:
+            url_table = None
+            reader = self._incremental_csv if source.kind == 'csv' else self._incremental_history_db
+            result_df, high_water, delta_rows = reader(source, engine, chunksize, state)
+
+        print(f"{'Incremental run' if state else 'Full run'}: read {delta_rows} new or changed rows; {len(result_df)} records in total.")
+        # Printed but left counted, so batch_analyze_incremental can still take them for the index
+        if describe_timestamp_drops(self.timestamp_drops): print(describe_timestamp_drops(self.timestamp_drops))
+        try: save_analysis_state(state_path, {'settings': settings, 'high_water': high_water, 'rows': result_df, 'url_table': url_table})
+        except (OSError, pickle.PicklingError) as e: print(f"Warning: Cannot write state file '{state_path}': {e}")
+        return result_df
+
+    @staticmethod
+    def _merge_rows(previous, delta, replaced_ids, sort_by):
+        # Earlier rows minus those re-read (by visit_id), plus the new ones, in the order a full run would produce
+        if previous is None or previous.empty: merged = delta
+        elif delta.empty and not len(replaced_ids): return previous
+        else:
+            previous = previous[~previous['visit_id'].isin(replaced_ids)]
+            merged = concat_results([previous, delta]) if not delta.empty else previous
+        if merged.empty: return pd.DataFrame()
+        return merged.sort_values(sort_by, kind='mergesort').reset_index(drop=True)
+
+    def _incremental_history_db(self, source, engine, chunksize, state):
+        high_water = {'urls': source.high_water()}
+        replaced_ids = []
+
+        def delta_chunks():
+            for chunk in source.iter_urls(chunksize, state['high_water']['urls'] if state else None):
+                replaced_ids.append(chunk['id'].to_numpy())
+                yield chunk
+
+        delta, delta_rows = self.analyze_chunks(delta_chunks(), engine)
+        replaced_ids = np.concatenate(replaced_ids) if replaced_ids else np.array([], dtype='int64')
+        return self._merge_rows(state['rows'] if state else None, delta, replaced_ids, ['visit_id']), high_water, delta_rows
 
-        for plot_func, data_series, ax_idx, title, xlabel, ylabel, params in chart_plot_config:
-            current_ax = axes[ax_idx]
-            has_data = False
-            if isinstance(data_series, pd.DataFrame):
-                if not data_series.empty and not (data_series.sum(axis=0).eq(0).all() and data_series.sum(axis=1).eq(0).all()):
-                    has_data = True
-            elif isinstance(data_series, pd.Series):
-                if not data_series.empty and data_series.sum() > 0: has_data = True
+    def _incremental_csv(self, source, engine, chunksize, state):
+        # CSV exports have no index to seek with, so the file is still read, but only rows past the mark are analyzed
+        since = state['high_water']['urls'] if state else None
+        mark = list(since) if since else [0, 0]
+        replaced_ids = []
+
+        def delta_chunks():
+            for chunk in source.iter_urls(chunksize):
+                if not all(col in chunk.columns for col in ['url', 'last_visit_time', 'id']):
+                    raise ValueError(f"Incremental analysis of a CSV needs the 'id', 'url' and 'last_visit_time' columns of the urls table. Found: {list(chunk.columns)}")
+                times = pd.to_numeric(chunk['last_visit_time'], errors='coerce')
+                ids = pd.to_numeric(chunk['id'], errors='coerce')
+                if times.notna().any(): mark[0] = max(mark[0], int(times.max()))
+                if ids.notna().any(): mark[1] = max(mark[1], int(ids.max()))
+                if since: chunk = chunk[(times > since[0]) | (ids > since[1])]
+                if len(chunk):
+                    replaced_ids.append(chunk['id'].to_numpy())
+                    yield chunk
+
+        delta, delta_rows = self.analyze_chunks(delta_chunks(), engine)
+        replaced_ids = np.concatenate(replaced_ids) if replaced_ids else np.array([], dtype='int64')
+        return self._merge_rows(state['rows'] if state else None, delta, replaced_ids, ['visit_id']), {'urls': tuple(mark)}, delta_rows
+
+    def _incremental_visits(self, source, engine, chunksize, state):
+        high_water = {'urls': source.high_water(), 'visits': source.high_water(visits=True)}
+        url_delta = self.analyze_url_tables(source.iter_urls(chunksize, state['high_water']['urls'] if state else None), engine)
+        url_table, previous = (state['url_table'], state['rows']) if state else (None, None)
+        if url_table is None or url_table.empty: url_table = url_delta
+        elif len(url_delta): url_table = pd.concat([url_table[~url_table.index.isin(url_delta.index)], url_delta])
+
+        if previous is not None and len(previous) and len(url_delta):
+            # Earlier visits of URLs that changed since (new visit counts, ...) take the URL's current analysis
+            stale = previous['url_id'].isin(url_delta.index).to_numpy()
+            if stale.any():
+                previous = previous.copy()
+                fresh = url_delta.loc[previous['url_id'].to_numpy()[stale]]
+                for column in URL_RESULT_COLUMNS:
+                    values = fresh[column]
+                    if isinstance(previous[column].dtype, pd.CategoricalDtype):
+                        new = pd.Index(values.dropna().unique()).difference(previous[column].cat.categories)
+                        if len(new): previous[column] = previous[column].cat.add_categories(new)
+                    else: values = values.astype(previous[column].dtype)
+                    previous.loc[stale, column] = values.to_numpy()
+
+        chunks = list(self.iter_visit_chunks(source, engine, chunksize, url_table, state['high_water']['visits'] if state else None))
+        delta = concat_results(chunks) if chunks else pd.DataFrame()
+        result_df = self._merge_rows(previous, delta, delta['visit_id'].to_numpy() if len(delta) else [], ['datetime', 'visit_id'])
+        return result_df, url_table, high_water, len(url_delta) + len(delta)
+
+    def analyze_chunks(self, chunks, engine='columnar'):
+        # Analyzes each chunk as it arrives; returns the combined result and the number of input rows seen
+        results, total_rows = [], 0
+        for chunk in self.timed_chunks(chunks):
+            total_rows += len(chunk)
+            chunk_result = self.analyze_dataframe(chunk, engine)
+            if not chunk_result.empty: results.append(chunk_result)
+        if not results: return pd.DataFrame(), total_rows
+        return concat_results(results), total_rows
+
+    def analyze_dataframe(self, df, engine='columnar', summary=False):
+        # summary: only the columns ReportAggregator counts (see _summary_frame); the rows engine always builds full rows
+        if engine == 'rows':
+            with self.stage('analyze_rows'): return self._analyze_rows(df)
+        if engine == 'columnar': return self._analyze_columnar(df, summary)
+        raise ValueError(f"Unknown analysis engine '{engine}'. Expected one of: {', '.join(ANALYSIS_ENGINES)}")
+
+    def _analyze_rows(self, df):
+        data = []
+        for index, row in df.iterrows():
+            dt = self.parse_timestamp(row['last_visit_time'])
+            if dt is None: continue
             
-            if has_data:
-                plot_func(data_series, current_ax, **params)
-            else:
-                current_ax.text(0.5, 0.5, "No Data Available", ha="center", va="center", fontsize=10, color='grey')
+            url = str(row.get('url', '')) 
+            if not url or pd.isna(url): url = "Unknown_URL"
 
-            current_ax.set_title(title, fontsize=14)
-            if xlabel: current_ax.set_xlabel(xlabel, fontsize=12)
-            if ylabel: current_ax.set_ylabel(ylabel, fontsize=12)
+            parsed_url_for_domain = urlparse(url)
+            domain_full_for_check = parsed_url_for_domain.netloc.lower()
+            url_category = self.categorize_url(url) 
+            is_inappropriate_flag, inappropriate_keyword_reason = self.is_inappropriate(url, url_category, domain_full_for_check)
+            work_hours_flag = self.is_work_hours(dt)
             
-            if has_data: 
-                if params.get('xtick_rotation'): 
-                    plt.setp(current_ax.get_xticklabels(), rotation=params['xtick_rotation'], ha='right', fontsize=10)
-                if params.get('ytick_fontsize'): 
-                    plt.setp(current_ax.get_yticklabels(), fontsize=params['ytick_fontsize'])
-                if params.get('axis_equal'): 
-                    current_ax.axis('equal')
-                if params.get('legend_title') and hasattr(current_ax, 'legend') and current_ax.get_legend() is not None:
-                     current_ax.legend(title=params['legend_title'], fontsize=10)
-
-
-        plt.tight_layout(rect=[0, 0, 1, 0.98])
-        charts_image_path = 'browser_analysis_charts.png'
-        try: plt.savefig(charts_image_path, dpi=300, bbox_inches='tight')
-        except Exception as e: print(f"Error saving charts: {e}"); charts_image_path = None
-        plt.close(fig)
+            data.append({
+                'visit_id': row.get('id', index), 'url': url,
+                'domain': domain_full_for_check if url != "Unknown_URL" else "Unknown_Domain",
+                'visit_count': int(row.get('visit_count', 0)) if pd.notna(row.get('visit_count')) else 0,
+                'typed_count': int(row.get('typed_count', 0)) if pd.notna(row.get('typed_count')) else 0,
+                'datetime': dt, 'hour': dt.hour, 'weekday': dt.strftime('%A'),
+                'category': url_category, 
+                'inappropriate': is_inappropriate_flag,
+                'inappropriate_reason': inappropriate_keyword_reason,
+                'work_hours': work_hours_flag
+            })
         
-        min_date = df['datetime'].min(); max_date = df['datetime'].max()
+        if not data: return pd.DataFrame()
+        result_df = pd.DataFrame(data)
+        result_df['datetime'] = pd.to_datetime(result_df['datetime'], errors='coerce')
+        result_df.dropna(subset=['datetime'], inplace=True)
+        return compact_result_frame(result_df)
+
+    # Columnar equivalents of parse_timestamp/get_main_domain/categorize_url/is_inappropriate/is_work_hours.
+    # Each rule runs once over a whole column instead of once per row; results must match _analyze_rows.
+    def parse_timestamp_column(self, timestamps):
+        # One int64 subtraction and one tz_convert for the whole column
+        with self.stage('timestamps'):
+            webkit_us, parsed = webkit_microseconds(timestamps)
+            missing = timestamps.isna().to_numpy()
+            zero = parsed & (webkit_us == 0)
+            valid = parsed & ~zero & (webkit_us >= MIN_WEBKIT_US) & (webkit_us < MAX_WEBKIT_US)
+            self.timestamp_drops['missing'] += int(missing.sum())
+            self.timestamp_drops['zero'] += int(zero.sum())
+            self.timestamp_drops['invalid'] += int((~valid & ~zero & ~missing).sum())
+            dt = pd.to_datetime(webkit_us[valid] - WEBKIT_EPOCH_OFFSET_US, unit='us', utc=True).tz_convert(self.timezone)
+            return pd.Series(dt, index=timestamps.index[valid])
+
+    def get_main_domain_column(self, netlocs):
+        return self.resolve_domain_column(netlocs)['main_domain']
+
+    def resolve_domain_column(self, netlocs):
+        # RuleEngine.resolve_domain once per distinct netloc, broadcast back to the rows
+        distinct = netlocs.unique()
+        info = pd.DataFrame([self.rule_engine.resolve_domain(netloc) for netloc in distinct],
+                            columns=['main_domain', 'whitelisted', 'legit'], index=distinct)
+        if info.empty: info = info.astype({'whitelisted': bool})
+        return info.reindex(netlocs.to_numpy()).set_axis(netlocs.index)
+
+    def categorize_url_column(self, urls):
+        return self.match_category_column(urls)['category']
+
+    def match_category_column(self, urls):
+        decoded = decode_urls(urls)
+        return self._match_category_columns(decoded.str.lower(), split_urls(decoded))
+
+    def _match_category_columns(self, url_lower, parts):
+        rules = self.rule_engine
+        domain_full = parts['netloc'].str.lower()
+        domain_info = self.resolve_domain_column(domain_full)
+        query = parts['query']
+        path_query_lower = (parts['path'] + query.where(query == '', '?' + query)).str.lower()
+
+        matches = pd.DataFrame({'category': None, 'rule': None}, index=url_lower.index, dtype=object)
+        # Each stage only looks at rows no earlier stage has claimed
+        pending = pd.DataFrame({'url_lower': url_lower, 'domain_full': domain_full, 'path_query_lower': path_query_lower,
+                                'whitelisted': domain_info['whitelisted'], 'legit': domain_info['legit']})
+        def assign(hits):
+            nonlocal pending
+            hits = hits.dropna()
+            if len(hits):
+                matches.loc[hits.index, 'category'] = [hit[0] for hit in hits]
+                matches.loc[hits.index, 'rule'] = [hit[1] for hit in hits]
+                pending = pending.drop(hits.index)
+
+        if rules.custom_re is not None:
+            assign(pending['url_lower'].map(rules.match_custom).astype(object))
+
+        whitelisted = pending[pending['whitelisted'].to_numpy(dtype=bool)]
+        if len(whitelisted) and rules.work_substring_re is not None:
+            keywords = [rules.match_work_substring(d, pq) for d, pq in zip(whitelisted['domain_full'], whitelisted['path_query_lower'])]
+            assign(pd.Series([('work', kw) if kw else None for kw in keywords], index=whitelisted.index, dtype=object))
+        assign(pending['legit'].dropna().map(lambda matched: ('infrastructure_internal', matched)).astype(object))
+
+        if rules.work_keyword_re is not None:
+            assign(pending['url_lower'].map(rules.match_work_keyword).astype(object).dropna().map(lambda keyword: ('work', keyword)))
+
+        # Domain rules only depend on the host, so they are resolved once per distinct host
+        domain_rules = {domain: rules.match_domain_rule(domain) for domain in pending['domain_full'].unique()}
+        hits = [rules.match_category_rules(d, pq, domain_rules[d]) for d, pq in zip(pending['domain_full'], pending['path_query_lower'])]
+        assign(pd.Series(hits, index=pending.index, dtype=object))
+        return matches
+
+    def is_inappropriate_column(self, url_lower, url_categories, domains_full):
+        # url_lower: unquoted, lower-cased URLs (what is_inappropriate matches keywords against)
+        rules = self.rule_engine
+        candidates = ~url_categories.isin(['work', 'infrastructure_internal']) & ~self.resolve_domain_column(domains_full)['whitelisted'].astype(bool)
+        reasons = pd.Series(None, index=url_lower.index, dtype=object)
+        if candidates.any() and rules.inappropriate_domains:
+            # Listed domains first (once per distinct host); the keywords are only searched where none matched
+            hosts = domains_full[candidates]
+            listed = {host: rules.match_inappropriate_domain(host) for host in hosts.unique()}
+            reasons[candidates] = hosts.map(listed).astype(object)
+            candidates = candidates & reasons.isna()
+        if candidates.any(): reasons[candidates] = url_lower[candidates].map(rules.match_inappropriate).astype(object)
+        return reasons.notna(), reasons
+
+    def is_work_hours_column(self, datetimes, minutes=None):
+        with self.stage('work_hours'): return self.schedule.mask(datetimes, minutes)
+
+    def _time_columns(self, datetimes):
+        # hour, weekday and work_hours of analyzed rows, from one timezone conversion (see local_minutes)
+        minutes = local_minutes(datetimes)
+        return {'hour': (minutes % WorkSchedule.MINUTES_PER_DAY // 60).astype('int8'), 'weekday': weekday_column(datetimes, minutes),
+                'work_hours': self.is_work_hours_column(datetimes, minutes).to_numpy()}
+
+    def _analyze_columnar(self, df, summary=False):
+        datetimes = self.parse_timestamp_column(df['last_visit_time'])
+        if datetimes.empty: return pd.DataFrame()
+        rows = df.loc[datetimes.index] if df.index.is_unique else df[df.index.isin(datetimes.index)]
+        visit_ids = rows['id'].to_numpy() if 'id' in rows.columns else rows.index.to_numpy()
+        rows = rows.reset_index(drop=True)
+        if summary: return self._summary_frame(self._summary_url_columns(rows), datetimes.reset_index(drop=True))
+        url_columns = self._analyze_url_columns(rows)
+        return self._result_frame(visit_ids, url_columns, datetimes.reset_index(drop=True))
+
+    def analyze_url_table(self, df, engine='columnar', summary=False):
+        # Timestamp-independent part of the analysis (URL, domain, counts, category, inappropriate flag) for
+        # each row of a urls table, indexed by url id. Visit-level analysis broadcasts this to every visit.
+        url_ids = df['id'].to_numpy() if 'id' in df.columns else df.index.to_numpy()
+        rows = df.reset_index(drop=True)
+        if engine == 'columnar': url_columns = self._summary_url_columns(rows) if summary else self._analyze_url_columns(rows)
+        else:
+            with self.stage('analyze_rows'): url_columns = self._analyze_url_rows(rows)
+        url_columns.index = pd.Index(url_ids, name='url_id')
+        return url_columns
+
+    def _url_info(self, rows):
+        # -> (URL strings, their domain/category/inappropriate/reason through the categorization cache, mask of empty URLs)
+        urls = rows['url'].astype(object).where(rows['url'].notna(), 'nan').astype(str)
+        unknown_url = urls == ''
+        urls = urls.where(~unknown_url, 'Unknown_URL')
+        if self.category_cache is None: return urls, self._categorize_url_column(urls), unknown_url
+        with self.stage('cache'): return urls, self.category_cache.categorize(urls, self.rule_engine.fingerprint, self._categorize_url_column), unknown_url
+
+    def _analyze_url_columns(self, rows):
+        urls, url_info, unknown_url = self._url_info(rows)
+        return pd.DataFrame({
+            'url': urls.to_numpy(dtype=object), 'domain': url_info['domain'].where(~unknown_url, 'Unknown_Domain').to_numpy(dtype=object),
+            'visit_count': count_values(rows, 'visit_count'), 'typed_count': count_values(rows, 'typed_count'),
+            'category': url_info['category'].to_numpy(dtype=object), 'inappropriate': url_info['inappropriate'].to_numpy(dtype=bool),
+            'inappropriate_reason': url_info['inappropriate_reason'].to_numpy(dtype=object),
+        })
+
+    def _categorize_url_column(self, urls):
+        # Everything about a URL that depends only on the URL string and the ruleset
+        with self.stage('categorize'):
+            raw_parts = split_urls(urls)
+            domains_full = raw_parts['netloc'].str.lower()
+            decoded = decode_urls(urls)
+            decoded_parts = raw_parts if decoded is urls else split_urls(decoded)
+            url_lower = decoded.str.lower()
+            matches = self._match_category_columns(url_lower, decoded_parts)
+            categories = matches['category']
+            if self.profile is not None: self.profile.add_rule_hits(categories, matches['rule'])
+        with self.stage('inappropriate'):
+            inappropriate_flags, inappropriate_reasons = self.is_inappropriate_column(url_lower, categories, domains_full)
+        return pd.DataFrame({'domain': domains_full, 'category': categories, 'inappropriate': inappropriate_flags,
+                             'inappropriate_reason': inappropriate_reasons}, index=urls.index)
+
+    def _analyze_url_rows(self, rows):
+        data = []
+        for _, row in rows.iterrows():
+            url = str(row.get('url', ''))
+            if not url or pd.isna(url): url = "Unknown_URL"
+            parsed_url_for_domain = urlparse(url)
+            domain_full_for_check = parsed_url_for_domain.netloc.lower()
+            url_category = self.categorize_url(url)
+            is_inappropriate_flag, inappropriate_keyword_reason = self.is_inappropriate(url, url_category, domain_full_for_check)
+            data.append({
+                'url': url, 'domain': domain_full_for_check if url != "Unknown_URL" else "Unknown_Domain",
+                'visit_count': int(row.get('visit_count', 0)) if pd.notna(row.get('visit_count')) else 0,
+                'typed_count': int(row.get('typed_count', 0)) if pd.notna(row.get('typed_count')) else 0,
+                'category': url_category, 'inappropriate': is_inappropriate_flag, 'inappropriate_reason': inappropriate_keyword_reason,
+            })
+        return pd.DataFrame(data, columns=['url', 'domain', 'visit_count', 'typed_count', 'category', 'inappropriate', 'inappropriate_reason'])
+
+    def _summary_url_columns(self, rows):
+        # The URL columns a summary counts, domains and categories as categoricals; no URL strings, reasons or counts
+        _, url_info, unknown_url = self._url_info(rows)
+        return pd.DataFrame({'domain': categorical(url_info['domain'].where(~unknown_url, 'Unknown_Domain')), 'category': categorical(url_info['category']),
+                             'inappropriate': url_info['inappropriate'].to_numpy(dtype=bool)})
+
+    def _summary_frame(self, url_columns, datetimes, extra_columns=None):
+        # --summary-only counterpart of _result_frame, with just what ReportAggregator(keep_tables=False) reads
+        with self.stage('frame'):
+            times = self._time_columns(datetimes)
+            summary_df = pd.DataFrame({
+                'domain': categorical(url_columns['domain']), 'datetime': datetimes, 'hour': times['hour'], 'weekday': times['weekday'],
+                'category': categorical(url_columns['category']), 'inappropriate': url_columns['inappropriate'].to_numpy(dtype=bool),
+                'work_hours': times['work_hours'],
+            })
+            for name, values in (extra_columns or {}).items(): summary_df[name] = values
+            return summary_df
+
+    def _result_frame(self, visit_ids, url_columns, datetimes, extra_columns=None):
+        with self.stage('frame'):
+            times = self._time_columns(datetimes)
+            result_df = pd.DataFrame({
+                'visit_id': visit_ids, 'url': url_columns['url'].to_numpy(), 'domain': url_columns['domain'].to_numpy(),
+                'visit_count': url_columns['visit_count'].to_numpy(), 'typed_count': url_columns['typed_count'].to_numpy(),
+                'datetime': datetimes, 'hour': times['hour'], 'weekday': times['weekday'],
+                'category': url_columns['category'].to_numpy(),
+                'inappropriate': url_columns['inappropriate'].to_numpy(),
+                'inappropriate_reason': url_columns['inappropriate_reason'].to_numpy(),
+                'work_hours': times['work_hours'],
+            })
+            for name, values in (extra_columns or {}).items(): result_df[name] = values
+            return compact_result_frame(result_df)
+
+    def analyze_url_tables(self, chunks, engine='columnar', summary=False):
+        tables = [self.analyze_url_table(chunk, engine, summary) for chunk in self.timed_chunks(chunks)]
+        if not tables: return pd.DataFrame(columns=URL_RESULT_COLUMNS, index=pd.Index([], name='url_id'))
+        url_table = pd.concat(tables)
+        if summary: url_table = url_table.assign(domain=categorical(url_table['domain']), category=categorical(url_table['category']))
+        if not url_table.index.is_unique: url_table = url_table[~url_table.index.duplicated(keep='last')]
+        return url_table
+
+    def iter_visit_chunks(self, db_path, engine='columnar', chunksize=DEFAULT_CHUNKSIZE, url_table=None, since=None, summary=False):
+        # One analyzed row per visit. URLs are analyzed once; their results are looked up by url id for
+        # every visit, so the per-visit cost is a hash lookup and a handful of column takes.
+        # url_table/since: an already analyzed urls table, and the visits high-water mark (see analyze_incremental)
+        source = open_history(db_path)
+        if url_table is None: url_table = self.analyze_url_tables(source.iter_urls(chunksize), engine, summary)
+        for visits in self.timed_chunks(source.iter_visits(chunksize, since)):
+            datetimes = self.parse_timestamp_column(visits['visit_time'])
+            positions = url_table.index.get_indexer(visits['url'].to_numpy()[datetimes.index.to_numpy()])
+            known = positions >= 0
+            if not known.any(): continue
+            visits = visits.iloc[datetimes.index[known]]
+            if summary:
+                yield self._summary_frame(url_table.iloc[positions[known]], datetimes[known].reset_index(drop=True),
+                                          {'visit_duration': visits['visit_duration'].to_numpy()})
+                continue
+            yield self._result_frame(visits['id'].to_numpy(), url_table.iloc[positions[known]],
+                                     datetimes[known].reset_index(drop=True),
+                                     {'url_id': visits['url'].to_numpy(), 'transition': visits['transition'].to_numpy(),
+                                      'visit_duration': visits['visit_duration'].to_numpy()})
+
+    def generate_report(self, df, output_file='browser_history_report.html', paged_tables=False, chart_format='png', chart_dpi=DEFAULT_CHART_DPI, chart_workers=1):
+        # df: the analyzed DataFrame, or a ReportAggregator already fed with it (see aggregate_file).
+        # paged_tables embeds table rows as JSON rendered page by page in the browser instead of as <tr> markup.
+        # Charts go to report_charts_dir(output_file), one file per panel (see render_charts).
+        if isinstance(df, ReportAggregator): agg = df
+        else:
+            agg = ReportAggregator(idle_gap=self.idle_gap)
+            agg.update(df)
+        if agg.empty:
+            print("Cannot generate report: No data to analyze")
+            return None
+        
+        chart_panels = [
+            ('work_hours', agg.value_counts('work_hours'), 'Activity: Work vs Non-Work Hours', None, None, {'axis_equal': True}),
+            ('categories', agg.value_counts('category'), 'Website Categories Accessed', None, 'Visits', {'xtick_rotation': 45}),
+            ('inappropriate', agg.value_counts('inappropriate'), 'Inappropriate Content Detection', None, None, {'axis_equal': True}),
+            ('hourly', agg.size_by('hour').reindex(range(24), fill_value=0), 'Activity by Hour of Day', 'Hour (0-23)', 'Visits', {}),
+            ('weekday', agg.size_by('weekday').reindex(WEEKDAY_NAMES, fill_value=0), 'Activity by Day of Week', None, 'Visits', {'xtick_rotation': 45}),
+            ('top_domains', agg.value_counts('domain').nlargest(10), 'Top 10 Visited Domains', 'Visits', None, {'ytick_fontsize': 10}),
+            ('streaming_hourly', agg.streaming_by_hour(), 'Streaming Usage by Hour', 'Hour (0-23)', 'Visits', {}),
+            ('category_work_hours', agg.category_by_work_hours().rename(columns={True: 'Work Hours', False: 'Non-Work Hours'}), 'Categories: Work vs Non-Work', None, 'Visits', {'xtick_rotation': 45, 'legend_title': 'Period'}),
+            ('inappropriate_daily', agg.inappropriate_per_day(), 'Inappropriate Content Over Time', 'Date', 'Count', {'xtick_rotation': 45}),
+        ]
+        sessions = agg.sessions
+        if not sessions.empty:
+            # Time-based counterparts of the category panels (visits only; see Sessionizer)
+            time_by_period = pd.DataFrame({'Work Hours': sessions.seconds_by(True), 'Non-Work Hours': sessions.seconds_by(False)}).fillna(0) / 3600
+            chart_panels += [
+                ('category_time', sessions.seconds_by() / 3600, 'Estimated Time by Category', None, 'Hours', {'xtick_rotation': 45}),
+                ('category_work_hours_time', time_by_period.sort_index(), 'Estimated Time: Work vs Non-Work Hours', None, 'Hours', {'xtick_rotation': 45, 'legend_title': 'Period'}),
+            ]
+        with self.stage('charts'): charts = render_charts(chart_panels, report_charts_dir(output_file), chart_format, chart_dpi, chart_workers)
+        report_dir = os.path.dirname(os.path.abspath(output_file))
+        charts_html = ''.join(f'<img src="{html.escape(quote(os.path.relpath(path, report_dir).replace(os.sep, "/")))}" alt="{html.escape(title)}" title="{html.escape(title)}">' for title, path in charts)
+        
+        min_date = agg.min_datetime; max_date = agg.max_datetime
         min_date_str = min_date.strftime('%Y-%m-%d %H:%M:%S %Z') if pd.notna(min_date) else "N/A"
         max_date_str = max_date.strftime('%Y-%m-%d %H:%M:%S %Z') if pd.notna(max_date) else "N/A"
-        total_s, work_h_s, inapp_s = len(df), df['work_hours'].sum(), df['inappropriate'].sum()
-        stream_s = (df['category'] == 'streaming').sum() if 'category' in df.columns else 0
-        game_s = (df['category'] == 'gaming').sum() if 'category' in df.columns else 0
-        shop_s = (df['category'] == 'shopping').sum() if 'category' in df.columns else 0
+        total_s, work_h_s, inapp_s = agg.total, agg.counts['work_hours'].get(True, 0), agg.counts['inappropriate'].get(True, 0)
+        stream_s = agg.counts['category'].get('streaming', 0)
+        game_s = agg.counts['category'].get('gaming', 0)
+        shop_s = agg.counts['category'].get('shopping', 0)
         work_h_p = (work_h_s / total_s * 100) if total_s > 0 else 0
         non_work_h_s = total_s - work_h_s; non_work_h_p = (non_work_h_s / total_s * 100) if total_s > 0 else 0
 
-        def generate_table_rows_html(dataframe, columns_map, sort_by_col='datetime', ascending_sort=False):
-            html_rows = ""
-            if dataframe.empty:
-                return f"<tr><td colspan='{len(columns_map)}' style='text-align:center; padding:10px;'>No data for this section.</td></tr>"
-            
-            df_to_sort = dataframe.copy() 
-            if sort_by_col not in df_to_sort.columns:
-                sorted_df = df_to_sort
-            else:
-                sorted_df = df_to_sort.sort_values(by=sort_by_col, ascending=ascending_sort)
-
-            for _, row in sorted_df.iterrows():
-                html_rows += "<tr>"
-                for col_key in columns_map.keys(): 
-                    val = row.get(col_key, "N/A")
-                    display_val = ""; td_attrs = ""
-                    if col_key == 'datetime' and pd.notna(val): 
-                        display_val = val.strftime('%Y-%m-%d %H:%M:%S %Z')
-                    elif col_key == 'url' and val != "N/A":
-                        escaped_url = html.escape(str(val))
-                        display_val = f'<a href="{escaped_url}" target="_blank" title="{escaped_url}">{escaped_url[:80]}{"..." if len(escaped_url)>80 else ""}</a>'
-                    elif col_key == 'work_hours': 
-                        status = "Yes" if val else "No"
-                        display_val = status
-                        if val and row.get('inappropriate', False): 
-                            td_attrs = 'class="warning-text"' 
-                    elif col_key == 'inappropriate_reason': 
-                        display_val = html.escape(str(val)) if pd.notna(val) else "N/A"
-                    else: 
-                        display_val = html.escape(str(val))
-                    html_rows += f"<td {td_attrs}>{display_val}</td>"
-                html_rows += "</tr>\n"
-            return html_rows
+        sessions_summary_html, time_html = '', '<li>Time-based figures (sessions, time per category) need --visits: URL rows only carry each URL\'s last visit.</li>'
+        if not sessions.empty:
+            total_time = sessions.total_seconds()
+            sessions_summary_html = f"""
+                <li>Browsing sessions (split after {sessions.idle_gap:g} min without a visit): {sessions.sessions}, estimated time {format_duration(total_time)} (average session {format_duration(total_time / sessions.sessions)})</li>"""
+            work_time = sessions.seconds_by(True)
+            non_work_time = float(work_time.drop(['work', 'infrastructure_internal'], errors='ignore').sum())
+            time_html = f"<li>During work hours, an estimated {format_duration(non_work_time)} of {format_duration(work_time.sum())} of browsing ({(non_work_time / work_time.sum() * 100) if work_time.sum() > 0 else 0:.1f}%) was spent on sites categorized as non-work related.</li>"
 
         inappropriate_cols_map = {'datetime':'DateTime', 'url':'URL', 'category':'Assigned Category', 'inappropriate_reason':'Reason (Keyword)', 'work_hours':'During Work Hours'}
         activity_cols_map = {'datetime':'DateTime', 'url':'URL', 'visit_count':'Visit Count', 'work_hours': 'During Work Hours'} 
         # THIS IS WHERE non_work_activity_cols_map IS NOW DEFINED CORRECTLY BEFORE USE
         non_work_activity_cols_map = {'datetime':'DateTime', 'url':'URL', 'visit_count':'Visit Count'} 
 
-        all_categories_in_data = df['category'].unique().tolist()
+        all_categories_in_data = list(agg.counts['category'])
         non_work_sub_tab_categories = [
             cat for cat in all_categories_in_data 
             if cat not in ['work', 'infrastructure_internal', 'other'] and not pd.isna(cat)
@@ -406,7 +2629,11 @@ class BrowserHistoryAnalyzer:
             non_work_sub_tab_categories.append('other')
 
 
-        html_content = f"""
+        write_rows = write_table_data_html if paged_tables else write_table_rows_html
+        tmp_file = output_file + '.tmp'
+        try:
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                f.write(f"""
         <!DOCTYPE html><html lang="en"><head><meta charset="UTF-8"><title>Browser History Report</title>
         <style>
             body {{ font-family: Segoe UI, Arial, sans-serif; margin: 0; padding:0; background-color: #f0f2f5; color: #333; }}
@@ -431,6 +2658,7 @@ class BrowserHistoryAnalyzer:
             .summary-box {{ background-color: #e7f3fe; border-left: 4px solid #007bff; padding: 15px 20px; margin: 20px 0; border-radius: 4px; }}
             .summary-box h2 {{margin-top:0; color: #0056b3;}} .summary-box ul {{ list-style-type: none; padding-left: 0; }} .summary-box li {{ margin-bottom: 10px; font-size: 0.95em; }}
             .warning-text {{ color: #d93025; font-weight: bold; }}
+            .chart-container {{ display: grid; grid-template-columns: repeat(auto-fill, minmax(480px, 1fr)); gap: 15px; }}
             .chart-container img {{ max-width: 100%; height: auto; border: 1px solid #dee2e6; margin-top:15px; border-radius:4px; }}
             .footer {{ text-align: center; margin-top: 30px; padding-top: 20px; border-top: 1px solid #dee2e6; font-size: 0.85em; color: #6c757d; }}
             h2 {{color: #0056b3; margin-top:0; border-bottom: 1px solid #eee; padding-bottom:8px;}} h4 {{color: #333; margin-top:20px; margin-bottom: 5px;}}
@@ -438,7 +2666,7 @@ class BrowserHistoryAnalyzer:
         </head><body><div class="report-container">
             <div class="header"><h1>Workplace Browser History Analysis</h1>
                 <p>Generated: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')} | Analysis Period: {min_date_str} to {max_date_str}</p>
-                <p>Work Hours: {self.start_time} - {self.end_time} ({', '.join(self.work_days)})</p>
+                <p>Work Hours: {self.schedule.describe()} | Timezone: {self.timezone.zone}</p>
             </div>
 
             <div class="main-tab-buttons">
@@ -451,7 +2679,7 @@ class BrowserHistoryAnalyzer:
             </div>
 
             <div id="Summary" class="main-tab-content"><div class="summary-box"><h2>Executive Summary</h2><ul>
-                <li>Total browsing sessions analyzed: {total_s}</li>
+                <li>Records analyzed: {total_s} ({'one per visit' if not sessions.empty else 'one per URL, at its last visit'})</li>{sessions_summary_html}
                 <li>Activity during work hours: {work_h_s} ({work_h_p:.1f}%)</li>
                 <li>Activity outside work hours: {non_work_h_s} ({non_work_h_p:.1f}%)</li>
                 <li>Potentially inappropriate content detected (post-filtering): {inapp_s} instances</li>
@@ -461,54 +2689,62 @@ class BrowserHistoryAnalyzer:
             </ul></div><p>This report provides an automated analysis of browser history. All findings, especially those flagged as 'inappropriate', require careful manual review and contextual understanding before any conclusions are drawn. The tool uses keyword matching and categorization rules which may produce false positives or misclassifications.</p></div>
 
             <div id="Visuals" class="main-tab-content"><h2>Visual Analysis</h2><div class="chart-container">
-                {f'<img src="{os.path.basename(charts_image_path)}" alt="Browser Analysis Charts">' if charts_image_path and os.path.exists(charts_image_path) else "<p><em>Charts image not available.</em></p>"}
+                {charts_html or "<p><em>Charts image not available.</em></p>"}
             </div></div>
 
             <div id="WorkActivity" class="main-tab-content"><h2>Work-Related Activity</h2>
-                <p>Browsing sessions categorized as 'work' based on provided keywords or custom rules.</p><table>
+                <p>Records categorized as 'work' based on provided keywords or custom rules.</p><table>
                 <thead><tr>{''.join(f"<th>{v}</th>" for v in activity_cols_map.values())}</tr></thead><tbody>
-                {generate_table_rows_html(df[df['category'] == 'work'], activity_cols_map)}
+                """)
+                write_rows(f, agg.table('work'), activity_cols_map)
+                f.write(f"""
             </tbody></table></div>
 
             <div id="Inappropriate" class="main-tab-content"><h2>Potentially Inappropriate Content</h2>
                 <p>URLs flagged based on keywords, after excluding 'work', 'infrastructure_internal', whitelisted domains, and common government/education domains. <strong>Manual verification is essential.</strong></p><table>
                 <thead><tr>{''.join(f"<th>{v}</th>" for v in inappropriate_cols_map.values())}</tr></thead><tbody>
-                {generate_table_rows_html(df[df['inappropriate']], inappropriate_cols_map)}
+                """)
+                write_rows(f, agg.table('inappropriate'), inappropriate_cols_map)
+                f.write(f"""
             </tbody></table></div>
 
             <div id="NonWork" class="main-tab-content"><h2>Non-Work Activity During Work Hours</h2>
                 <div class="sub-tab-buttons">
-        """
-        for cat_name in non_work_sub_tab_categories:
-            cat_id_safe = re.sub(r'\W+', '', cat_name) 
-            html_content += f"""<button class="sub-tab-button nw-sub-button" onclick="openSubTab(event, 'NW_{cat_id_safe}', 'NonWorkSubTabs')" data-sub-tabtarget="NW_{cat_id_safe}">{cat_name.replace('_',' ').title()}</button>\n"""
+        """)
+                for cat_name in non_work_sub_tab_categories:
+                    cat_id_safe = re.sub(r'\W+', '', cat_name) 
+                    f.write(f"""<button class="sub-tab-button nw-sub-button" onclick="openSubTab(event, 'NW_{cat_id_safe}', 'NonWorkSubTabs')" data-sub-tabtarget="NW_{cat_id_safe}">{cat_name.replace('_',' ').title()}</button>\n""")
         
-        html_content += """</div>""" 
+                f.write("""</div>""")
         
-        for cat_name in non_work_sub_tab_categories:
-            cat_id_safe = re.sub(r'\W+', '', cat_name)
-            html_content += f"""<div id="NW_{cat_id_safe}" class="sub-tab-content NonWorkSubTabs"><h4>{cat_name.replace('_',' ').title()} During Work Hours</h4><table><thead><tr>{''.join(f"<th>{v}</th>" for v in non_work_activity_cols_map.values())}</tr></thead><tbody>
-            {generate_table_rows_html(df[(df['category'] == cat_name) & (df['work_hours'])], non_work_activity_cols_map)}
-            </tbody></table></div>\n"""
+                for cat_name in non_work_sub_tab_categories:
+                    cat_id_safe = re.sub(r'\W+', '', cat_name)
+                    f.write(f"""<div id="NW_{cat_id_safe}" class="sub-tab-content NonWorkSubTabs"><h4>{cat_name.replace('_',' ').title()} During Work Hours</h4><table><thead><tr>{''.join(f"<th>{v}</th>" for v in non_work_activity_cols_map.values())}</tr></thead><tbody>
+            """)
+                    write_rows(f, agg.table('non_work', cat_name), non_work_activity_cols_map)
+                    f.write(f"""
+            </tbody></table></div>\n""")
 
-        html_content += """</div>""" 
+                f.write("""</div>""")
             
-        html_content += f"""
-            <div id="Productivity" class="main-tab-content"><div class="summary-box"><h2>Productivity Indicators</h2><ul>"""
+                f.write(f"""
+            <div id="Productivity" class="main-tab-content"><div class="summary-box"><h2>Productivity Indicators</h2><ul>""")
         
-        non_work_cats_for_prod_indicator = [cat for cat in all_categories_in_data if cat not in ['work', 'infrastructure_internal']]
-        non_work_browsing_wh = len(df[df['work_hours'] & df['category'].isin(non_work_cats_for_prod_indicator)]) if total_s > 0 and 'category' in df.columns else 0
-        inapp_work_wh = len(df[df['work_hours'] & df['inappropriate']]) if total_s > 0 and 'inappropriate' in df.columns else 0
-        non_work_browsing_wh_p = (non_work_browsing_wh / work_h_s * 100) if work_h_s > 0 else 0
-        active_days_series = df.groupby('weekday').size(); active_days_str = ', '.join(active_days_series.nlargest(3).index.tolist()) if not active_days_series.empty else 'N/A'
-        peak_hours_series = df.groupby('hour').size(); peak_hours_str = ', '.join(map(str, peak_hours_series.nlargest(3).index.tolist())) + ":00" if not peak_hours_series.empty else 'N/A'
-
-        html_content += f"""
-                <li>During work hours, approx. {non_work_browsing_wh} of {work_h_s} browsing sessions ({non_work_browsing_wh_p:.1f}%) were to sites categorized as non-work related.</li>
+                non_work_cats_for_prod_indicator = [cat for cat in all_categories_in_data if cat not in ['work', 'infrastructure_internal']]
+                non_work_browsing_wh = sum(agg.work_hours_category_counts.get(cat, 0) for cat in non_work_cats_for_prod_indicator)
+                inapp_work_wh = agg.inappropriate_work_hours
+                non_work_browsing_wh_p = (non_work_browsing_wh / work_h_s * 100) if work_h_s > 0 else 0
+                active_days_series = agg.size_by('weekday'); active_days_str = ', '.join(active_days_series.nlargest(3).index.tolist()) if not active_days_series.empty else 'N/A'
+                peak_hours_series = agg.size_by('hour'); peak_hours_str = ', '.join(map(str, peak_hours_series.nlargest(3).index.tolist())) + ":00" if not peak_hours_series.empty else 'N/A'
+
+                f.write(f"""
+                <li>During work hours, approx. {non_work_browsing_wh} of {work_h_s} records ({non_work_browsing_wh_p:.1f}%) were to sites categorized as non-work related.</li>
+                {time_html}
                 <li>{inapp_work_wh} instances of potentially inappropriate content (post-filtering) were accessed during work hours.</li>
                 <li>Most active browsing days: {active_days_str}</li>
                 <li>Peak browsing hours (approx.): {peak_hours_str}</li>
             </ul></div>
+            {time_table_html(agg)}
             <h3>Recommendations</h3><ol>
                 <li>Review findings with relevant stakeholders, emphasizing manual verification of flagged content.</li>
                 <li>Reinforce company's Acceptable Use Policy (AUP).</li>
@@ -581,13 +2817,15 @@ class BrowserHistoryAnalyzer:
                     openMainTab(null, firstMainTabTargetId); 
                 }}
             }});
-        </script></body></html>"""
+        </script>""")
+                if paged_tables: f.write(PAGED_TABLES_SCRIPT)
+                f.write("</body></html>")
         
-        try:
-            with open(output_file, 'w', encoding='utf-8') as f: f.write(html_content)
+            os.replace(tmp_file, output_file)
             return output_file
-        except IOError as e:
+        except (IOError, OSError) as e:
             print(f"Error writing HTML report: {e}")
+            if os.path.exists(tmp_file): os.remove(tmp_file)
             return None
 
 def parse_custom_categories_arg(cat_string):
@@ -606,82 +2844,939 @@ def parse_custom_categories_arg(cat_string):
         elif item: print(f"Warning: Custom category item '{item}' not in 'keyword(category)' format. Skipping.")
     return custom_map
 
-def main():
-    parser = argparse.ArgumentParser(
-        description='Analyze browser history for workplace investigation. Ensure CSV has "url" and "last_visit_time" columns.',
-        formatter_class=argparse.RawTextHelpFormatter
-    )
-    parser.add_argument('csv_file', help='Path to CSV browser history file.')
+def add_analysis_arguments(parser):
     parser.add_argument('--starttime', default='09:00', help='Work start time (e.g., "09:00", "9am", "13"). Default: 09:00.')
     parser.add_argument('--endtime', default='17:00', help='Work end time (e.g., "17:00", "5pm", "17"). Default: 17:00.')
     parser.add_argument('--days', default='M,T,W,Th,F', help='Comma-separated work days (M,T,W,Th,F,Sa,Su). Default: M,T,W,Th,F.')
+    parser.add_argument('--shift', action='append', default=[],
+                        help='Named work shift "name=DAYS@START-END" (repeatable), e.g. --shift "early=M,T,W@06:00-14:00" --shift "night=F,Sa@22:00-06:00".\nWhen given, shifts replace --starttime/--endtime/--days. Overnight shifts continue into the next day.')
+    parser.add_argument('--timezone', default=DEFAULT_TIMEZONE,
+                        help=f'IANA timezone of the office; visit times are converted to it before work hours are applied. Default: {DEFAULT_TIMEZONE}.')
     parser.add_argument('--work-keywords', default='', 
                         help='Comma-separated keywords/domains considered work-related (e.g., "mycompany.com,jira,salesforce").')
     parser.add_argument('--custom-categories', default='',
                         help='User-defined categories. Format: "keyword1(categoryA),keyword with space(categoryB)".\nExample: --custom-categories "my internal app(work),company cars(auto)"')
-    parser.add_argument('--output', default='browser_history_report.html', help='Output HTML file name.')
-    parser.add_argument('--diagnose', action='store_true', help='Show timestamp/category diagnosis for first few CSV rows and exit.')
-    
-    args = parser.parse_args()
-    
-    if not os.path.exists(args.csv_file):
-        print(f"Error: CSV file '{args.csv_file}' not found."); return
+    parser.add_argument('--visits', action='store_true',
+                        help='Analyze every visit from the History "visits" table instead of one row per URL (History databases only).')
+    parser.add_argument('--idle-gap', type=float, default=DEFAULT_IDLE_GAP, metavar='MINUTES',
+                        help=f'With --visits: minutes without a visit that end a browsing session; also the most time credited to one visit.\nDefault: {DEFAULT_IDLE_GAP}.')
+    parser.add_argument('--engine', choices=ANALYSIS_ENGINES, default='columnar',
+                        help='Analysis engine: "columnar" evaluates rules over whole columns, "rows" is the original per-row loop. Default: columnar.')
+    parser.add_argument('--paged-tables', action='store_true',
+                        help='Embed report tables as compact JSON rendered a page at a time (with sorting, filters and search) instead of\nwriting every row as HTML. Keeps reports of very large histories small and quick to open.')
+    parser.add_argument('--chart-format', choices=CHART_FORMATS, default='png', help='Image format of the report charts. Default: png.')
+    parser.add_argument('--chart-dpi', type=int, default=DEFAULT_CHART_DPI, help=f'Resolution of PNG charts. Default: {DEFAULT_CHART_DPI}.')
+    parser.add_argument('--rules', action='append', default=[], metavar='FILE',
+                        help='Ruleset file extending the built-in rules (repeatable): a .json/.yaml ruleset, or a plain domain list given as\nCATEGORY=FILE, whitelist=FILE or inappropriate=FILE (one domain per line; hosts files work too).')
+    parser.add_argument('--no-builtin-rules', action='store_true', help='Use only the --rules files, not the built-in patterns, whitelist and keywords.')
+    parser.add_argument('--cache', action='store_true',
+                        help='Keep a persistent URL categorization cache in --cache-path, reused across runs. It stores every analyzed URL\n(a copy of the subject\'s history that outlives the case), so it is off unless asked for.')
+    parser.add_argument('--no-cache', action='store_true', help='Use no persistent cache at all: overrides --cache, and also skips the parsed --rules cache.')
+    parser.add_argument('--cache-path', default=DEFAULT_CACHE_PATH, help=f'Categorization cache file (SQLite), with --cache. Default: {DEFAULT_CACHE_PATH}.')
+    parser.add_argument('--cache-size', type=int, default=DEFAULT_CACHE_SIZE,
+                        help=f'Maximum cached URLs; least recently used entries are evicted beyond this. Default: {DEFAULT_CACHE_SIZE}.')
+    parser.add_argument('--index', metavar='FILE',
+                        help='Also add the analyzed records to this SQLite index (created if missing), tagged with --case and the subject,\nfor cross-subject searches with "octorecon.py query". Re-adding the same records is a no-op.')
+    parser.add_argument('--case', default='', help='Case name the records are tagged with in --index.')
 
-    work_days_input = [day.strip().upper() for day in args.days.split(',')]
-    valid_day_map = {'M': 'M', 'MON': 'M', 'TU': 'T', 'TUE':'T', 'T': 'T', 'W': 'W', 'WED':'W', 
-                     'TH': 'Th', 'THU':'Th', 'F': 'F', 'FRI':'F', 'SA': 'Sa', 'SAT':'Sa', 'SU': 'Su', 'SUN':'Su'}
-    work_days_list = []
-    day_order_map = {day: i for i, day in enumerate(['M', 'T', 'W', 'Th', 'F', 'Sa', 'Su'])}
-    for day_in in work_days_input:
-        normalized_day = valid_day_map.get(day_in, None)
-        if normalized_day: work_days_list.append(normalized_day)
-        else: print(f"Warning: Work day '{day_in}' not recognized.")
-    work_days_list = sorted(list(set(work_days_list)), key=lambda d: day_order_map.get(d, 99)) 
-    if not work_days_list: print("Error: No valid work days provided."); return
+def rules_cache_dir(cache_path):
+    # Parsed --rules files are kept next to the categorization cache
+    return os.path.join(os.path.dirname(os.path.abspath(cache_path)), 'rules')
+
+def build_analyzer(args):
+    # Returns None (after printing why) when the schedule or categories given on the command line are invalid
+    work_days_list = parse_work_days_arg(args.days)
+    if not work_days_list: print("Error: No valid work days provided."); return None
 
     work_keywords_list = [keyword.strip().lower() for keyword in args.work_keywords.split(',') if keyword.strip()]
     custom_categories_map = parse_custom_categories_arg(args.custom_categories)
     if custom_categories_map: print(f"Using custom categories: {custom_categories_map}")
 
-    analyzer = BrowserHistoryAnalyzer(args.starttime, args.endtime, work_days_list, work_keywords_list, custom_categories_map)
+    if args.cache_size < 1: print("Error: --cache-size must be a positive number of entries."); return None
+    if args.chart_dpi < 1: print("Error: --chart-dpi must be a positive number."); return None
+    if not args.idle_gap > 0: print("Error: --idle-gap must be a positive number of minutes."); return None
+
+    try:
+        shifts = [parse_shift_arg(shift) for shift in args.shift]
+        ruleset = RuleSet(args.rules, None if args.no_cache else rules_cache_dir(args.cache_path)) if args.rules else None
+        if ruleset is not None: print(f"Using rules from {ruleset.describe()}")
+        analyzer = BrowserHistoryAnalyzer(args.starttime, args.endtime, work_days_list, work_keywords_list, custom_categories_map, shifts, args.timezone,
+                                          ruleset=ruleset, builtin_rules=not args.no_builtin_rules)
+    except ValueError as e: print(f"Error: {e}"); return None
+    if args.cache and not args.no_cache and args.engine == 'columnar': analyzer.category_cache = CategoryCache(args.cache_path, args.cache_size)
+    analyzer.idle_gap = args.idle_gap
+    return analyzer
+
+def find_history_files(sources):
+    # Directories are searched recursively for History/places.sqlite databases and CSV exports; anything else is a file or glob
+    paths = []
+    for source in sources:
+        if os.path.isdir(source):
+            for root, dirs, files in os.walk(source):
+                dirs.sort()
+                for name in sorted(files):
+                    path = os.path.join(root, name)
+                    if name.lower().endswith('.csv') or (name in HISTORY_FILE_NAMES and is_sqlite_file(path)): paths.append(path)
+        elif os.path.isfile(source): paths.append(source)
+        else: paths.extend(sorted(p for p in glob.glob(source, recursive=True) if os.path.isfile(p)))
+    return list(dict.fromkeys(os.path.abspath(p) for p in paths))
+
+def batch_subject_names(paths):
+    # alice/Default/History -> alice_Default_History, relative to the directory all inputs share (directories, as
+    # subjects of --merge-profiles, keep their whole name)
+    if not paths: return []
+    base = os.path.commonpath([os.path.dirname(p) for p in paths])
+    names, seen = [], {}
+    for path in paths:
+        relative = os.path.relpath(path, base)
+        name = re.sub(r'[^\w.-]+', '_', relative if os.path.isdir(path) else os.path.splitext(relative)[0]).strip('_') or 'history'
+        seen[name] = seen.get(name, 0) + 1
+        names.append(name if seen[name] == 1 else f"{name}_{seen[name]}")
+    return names
+
+# Set once per worker process by init_batch_worker, so the analyzer is unpickled (and its rules compiled) once
+batch_analyzer = batch_index = None
+
+def init_batch_worker(analyzer, index=None):
+    global batch_analyzer, batch_index
+    batch_analyzer, batch_index = analyzer, index
+
+def batch_index_add(df, subject):
+    if batch_index is not None: batch_index.add(df, subject)
+
+def batch_analyze_chunk(chunk, engine, subject, summary=False):
+    agg = ReportAggregator(keep_tables=not summary, idle_gap=batch_analyzer.idle_gap)
+    result = batch_analyzer.analyze_dataframe(chunk, engine, summary)
+    agg.update(result)
+    batch_index_add(result, subject)
+    agg.timestamp_drops = batch_analyzer.take_timestamp_drops()
+    return agg
+
+def batch_analyze_visits(path, engine, chunksize, subject, summary=False):
+    return batch_analyzer.aggregate_file(path, engine, chunksize, visits=True, sinks=[lambda df: batch_index_add(df, subject)], summary=summary)
+
+def batch_analyze_incremental(path, state_path, engine, chunksize, visits, subject):
+    agg = ReportAggregator(idle_gap=batch_analyzer.idle_gap)
+    result = batch_analyzer.update_state(path, state_path, engine, chunksize, visits)
+    agg.update(result)
+    batch_index_add(result, subject)
+    agg.timestamp_drops = batch_analyzer.take_timestamp_drops()
+    return agg
+
+def batch_generate_report(agg, output_file, report_options):
+    return batch_analyzer.generate_report(agg, output_file, **report_options)
+
+def iter_raw_chunks(path, chunksize):
+    for chunk in open_history(path).iter_urls(chunksize):
+        if not all(col in chunk.columns for col in ['url', 'last_visit_time']):
+            raise ValueError(f"CSV must contain 'url' and 'last_visit_time'. Found: {list(chunk.columns)}")
+        yield chunk
+
+def write_batch_index(subjects, index_file):
+    rows = ""
+    for subject in subjects:
+        agg = subject.get('agg')
+        if subject.get('report'):
+            total, work_h, inapp = agg.total, agg.counts['work_hours'].get(True, 0), agg.counts['inappropriate'].get(True, 0)
+            link = f'<a href="{html.escape(os.path.relpath(subject["report"], os.path.dirname(os.path.abspath(index_file))))}">{html.escape(subject["name"])}</a>'
+            inapp_attrs = ' class="warning-text"' if inapp else ''
+            rows += (f"<tr><td>{link}</td><td>{html.escape(subject['path'])}</td><td>{total}</td><td>{sum(agg.timestamp_drops.values())}</td>"
+                     f"<td>{work_h} ({work_h / total * 100:.1f}%)</td><td{inapp_attrs}>{inapp}</td><td>OK</td></tr>\n")
+        else:
+            rows += (f"<tr><td>{html.escape(subject['name'])}</td><td>{html.escape(subject['path'])}</td><td>-</td><td>-</td><td>-</td><td>-</td>"
+                     f"<td class=\"warning-text\">{html.escape(subject.get('error') or 'No data processed')}</td></tr>\n")
+    html_content = f"""<!DOCTYPE html><html lang="en"><head><meta charset="UTF-8"><title>Browser History Batch Report</title>
+<style>
+    body {{ font-family: Segoe UI, Arial, sans-serif; margin: 0; padding:0; background-color: #f0f2f5; color: #333; }}
+    .report-container {{ max-width: 90%; margin: 20px auto; background: #fff; padding: 25px; box-shadow: 0 2px 10px rgba(0,0,0,0.08); border-radius: 8px; }}
+    h1 {{ color: #0056b3; font-weight:600; text-align: center; }} p {{ text-align: center; color:#555; }}
+    table {{ border-collapse: collapse; width: 100%; margin-top: 15px; font-size: 0.9em; }}
+    th, td {{ border: 1px solid #e9ecef; padding: 10px 12px; text-align: left; word-break: break-word; }}
+    th {{ background-color: #007bff; color: white; font-weight:600; }}
+    tr:nth-child(even) {{ background-color: #f8f9fa; }} tr:hover {{ background-color: #e9ecef; }}
+    .warning-text {{ color: #d93025; font-weight: bold; }}
+</style></head><body><div class="report-container">
+<h1>Workplace Browser History Analysis - Batch</h1>
+<p>Generated: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')} | {len(subjects)} subjects</p>
+<table><tr><th>Subject</th><th>Source</th><th>Records</th><th>Skipped (no usable timestamp)</th><th>During Work Hours</th><th>Potentially Inappropriate</th><th>Status</th></tr>
+{rows}</table>
+</div></body></html>
+"""
+    with open(index_file, 'w', encoding='utf-8') as f: f.write(html_content)
+    return index_file
+
+SUMMARY_FORMATS = ('.json', '.csv')
+SUMMARY_CSV_PREFIXES = {'categories': 'category', 'work_hours_categories': 'work_hours_category', 'weekdays': 'weekday', 'sessions': 'session'}
+
+def flatten_summary(value, prefix=''):
+    # ReportAggregator.summary() -> one CSV row: nested counts become prefixed columns (category_news, weekday_Monday,
+    # session_seconds, ...), lists and the top domains a single text cell
+    if isinstance(value, dict) and prefix != 'top_domains':
+        row = {}
+        for key, item in value.items(): row.update(flatten_summary(item, f"{prefix}_{key}" if prefix else SUMMARY_CSV_PREFIXES.get(key, key)))
+        return row
+    if isinstance(value, dict): return {prefix: '; '.join(f"{key} ({count})" for key, count in value.items())}
+    if isinstance(value, list): return {prefix: ', '.join(map(str, value))}
+    return {prefix: value}
+
+def write_summaries(summaries, path):
+    # --summary-only output: summaries (one dict, or a list of them) as JSON, or as a CSV with one row per summary
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        if path.lower().endswith('.json'): json.dump(summaries, f, indent=2)
+        else:
+            rows = [flatten_summary(summary) for summary in (summaries if isinstance(summaries, list) else [summaries])]
+            writer = csv.DictWriter(f, fieldnames=list(dict.fromkeys(key for row in rows for key in row)))
+            writer.writeheader()
+            writer.writerows(rows)
+    return path
+
+def batch_main(argv):
+    parser = argparse.ArgumentParser(
+        prog='octorecon.py batch',
+        description='Analyze many History databases / CSV exports (e.g. one per employee and profile) in parallel.\nWrites one report per subject plus an index page linking them.',
+        formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument('inputs', nargs='+', help='Directories (searched recursively for "History"/"places.sqlite" files and *.csv), files or glob patterns.')
+    add_analysis_arguments(parser)
+    parser.add_argument('--output-dir', default='octorecon_reports', help='Directory for the per-subject reports and index.html. Default: octorecon_reports.')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Worker processes. Default: number of CPUs.')
+    parser.add_argument('--state-dir', metavar='DIR',
+                        help='Incremental mode: keep one state file per subject (<subject>.state) in DIR and on later runs only analyze\nrows visited or added since. Each subject is then analyzed by a single worker.')
+    parser.add_argument('--chunksize', type=int, default=DEFAULT_CHUNKSIZE,
+                        help=f'Large inputs are split into chunks of this many rows so one big file is spread over several workers. Default: {DEFAULT_CHUNKSIZE}.')
+    parser.add_argument('--merge-profiles', action='store_true',
+                        help='Treat each input as one subject: every browser profile found under a directory is merged into a single\nreport (e.g. batch --merge-profiles cases/*/).')
+    parser.add_argument('--summary-only', action='store_true',
+                        help='Only count: write summary.json and summary.csv (one row per subject) to --output-dir instead of reports.')
+    args = parser.parse_args(argv)
+    if args.workers < 1: print("Error: --workers must be at least 1."); return
+    if args.chunksize < 1: print("Error: --chunksize must be a positive number of rows."); return
+    if args.merge_profiles and args.state_dir: print("Error: --state-dir cannot be combined with --merge-profiles."); return
+    if args.summary_only and (args.state_dir or args.index): print("Error: --summary-only cannot be combined with --state-dir or --index."); return
 
-    if args.diagnose:
-        print(f"Diagnosing CSV: '{args.csv_file}' (first 5 rows)...")
+    if args.merge_profiles: groups = [(os.path.abspath(source), find_history_files([source])) for source in args.inputs]
+    else: groups = [(path, [path]) for path in find_history_files(args.inputs)]
+    groups = [(key, paths) for key, paths in groups if paths]
+    if not groups: print("Error: No History databases or CSV files found."); return
+    analyzer = build_analyzer(args)
+    if analyzer is None: return
+    os.makedirs(args.output_dir, exist_ok=True)
+    # Each report is already built in a worker process, so its charts are drawn there rather than in a nested pool
+    report_options = {'paged_tables': args.paged_tables, 'chart_format': args.chart_format, 'chart_dpi': args.chart_dpi}
+    subjects = [{'name': name, 'path': ', '.join(paths), 'inputs': paths[0] if len(paths) == 1 else paths, 'chunks': []}
+                for name, (_, paths) in zip(batch_subject_names([key for key, _ in groups]), groups)]
+    print(f"Analyzing {len(subjects)} inputs with {args.workers} worker processes...")
+
+    index = open_index(args.index, args.case) if args.index else None
+    if args.index and index is None: return
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=init_batch_worker, initargs=(analyzer, index)) as pool:
+        pending, reports = set(), []
+
+        def start_report(subject):
+            # Chunk results are merged in input order, so each report matches a single-file run
+            agg = ReportAggregator(keep_tables=not args.summary_only, idle_gap=analyzer.idle_gap)
+            try:
+                for future in subject['chunks']: agg.merge(future.result())
+            except Exception as e: subject['error'] = f"{type(e).__name__}: {e}"; subject['chunks'] = []; return
+            subject['chunks'] = []
+            if agg.empty: return
+            subject['agg'] = agg
+            if args.summary_only: return
+            output_file = os.path.join(args.output_dir, f"{subject['name']}.html")
+            reports.append((subject, pool.submit(batch_generate_report, agg, output_file, report_options)))
+
+        for i, subject in enumerate(subjects):
+            try:
+                if args.state_dir:
+                    state_path = os.path.join(args.state_dir, f"{subject['name']}.state")
+                    subject['chunks'].append(pool.submit(batch_analyze_incremental, subject['inputs'], state_path, args.engine, args.chunksize, args.visits, subject['name']))
+                elif args.visits and open_history(subject['inputs']).has_visits:
+                    subject['chunks'].append(pool.submit(batch_analyze_visits, subject['inputs'], args.engine, args.chunksize, subject['name'], args.summary_only))
+                else:
+                    for chunk in iter_raw_chunks(subject['inputs'], args.chunksize):
+                        # Bound the raw chunks queued in memory
+                        while len(pending) >= args.workers * 2: pending = wait(pending, return_when=FIRST_COMPLETED).not_done
+                        future = pool.submit(batch_analyze_chunk, chunk, args.engine, subject['name'], args.summary_only)
+                        subject['chunks'].append(future); pending.add(future)
+            except Exception as e:
+                subject['error'] = f"{type(e).__name__}: {e}"; subject['chunks'] = []
+                print(f"Error reading '{subject['path']}': {e}")
+                continue
+            for earlier in subjects[:i + 1]:
+                if earlier['chunks'] and all(f.done() for f in earlier['chunks']): start_report(earlier)
+        for subject in subjects:
+            if subject['chunks']: start_report(subject)
+        for subject, future in reports:
+            try: subject['report'] = future.result()
+            except Exception as e: subject['error'] = f"Report failed: {e}"
+
+    if args.summary_only:
+        summaries = []
+        for subject in subjects:
+            summary = {'subject': subject['name'], 'source': subject['path'], 'error': None if subject.get('agg') else subject.get('error') or 'No data processed'}
+            summaries.append({**summary, **subject['agg'].summary()} if subject.get('agg') else summary)
+            print(f"  {subject['name']}: {subject['agg'].total} records" if subject.get('agg') else f"  {subject['name']}: FAILED ({summary['error']})")
+        for name in ('summary.json', 'summary.csv'): print(f"Summary: {write_summaries(summaries, os.path.join(args.output_dir, name))}")
+        return
+    for subject in subjects:
+        status = f"{subject['agg'].total} records -> {subject['report']}" if subject.get('report') else f"FAILED ({subject.get('error') or 'no data processed'})"
+        print(f"  {subject['name']}: {status}")
+    index_file = write_batch_index(subjects, os.path.join(args.output_dir, 'index.html'))
+    print(f"\nIndex: file://{os.path.abspath(index_file).replace(os.sep, '/')}")
+    if index is not None: print_index_totals(index)
+
+QUERY_GROUPS = {  # --by: grouping column of records, output labels, their columns and the join that resolves them
+    'subject': ('r.subject_id', ['case', 'subject'], 's.case_name, s.name', 'JOIN subjects s ON s.id = g.key'),
+    'domain': ('r.domain_id', ['domain'], 'd.name', 'LEFT JOIN domains d ON d.id = g.key'),
+    'category': ('r.category', ['category'], 'g.key', ''),
+}
+QUERY_RECORD_COLUMNS = ['time', 'case', 'subject', 'domain', 'category', 'work_hours', 'inappropriate', 'reason', 'url']
+QUERY_FORMATS = ('table', 'csv', 'json')
+
+def split_list_args(values):
+    # Repeatable, comma-separated options -> one flat list
+    return [item.strip() for value in values for item in value.split(',') if item.strip()]
+
+def parse_index_time(value, timezone):
+    # 'YYYY-MM-DD' or 'YYYY-MM-DD HH:MM[:SS]', in timezone unless it carries an offset -> Unix microseconds
+    try: dt = datetime.datetime.fromisoformat(value.strip())
+    except ValueError: raise ValueError(f"Cannot parse time '{value}'. Use YYYY-MM-DD or 'YYYY-MM-DD HH:MM'.")
+    if dt.tzinfo is None: dt = timezone.localize(dt)
+    return (dt - WEBKIT_EPOCH) // datetime.timedelta(microseconds=1) - WEBKIT_EPOCH_OFFSET_US
+
+def query_conditions(conn, args, timezone):
+    # Filters of the query subcommand -> (WHERE clause over records r, parameters). Domains and subjects are looked up
+    # in their small tables first and inlined as id lists, so SQLite reaches the records through the (domain, subject,
+    # time) index.
+    conditions, params = [], []
+    domains = [reverse_host(domain) for domain in split_list_args(args.domain)]
+    if domains:
+        ranges = ' OR '.join(['reversed = ? OR (reversed >= ? AND reversed < ?)'] * len(domains))
+        ids = conn.execute(f"SELECT id FROM domains WHERE {ranges}", [bound for domain in domains for bound in (domain, domain + '.', domain + '/')])
+        conditions.append(f"r.domain_id IN ({', '.join(str(row[0]) for row in ids)})")  # the domains and their subdomains
+    subject_filters, subject_params = [], []
+    for column, values in (('case_name', split_list_args(args.case)), ('name', split_list_args(args.subject))):
+        if values: subject_filters.append(f"{column} IN ({', '.join('?' * len(values))})"); subject_params += values
+    if subject_filters:
+        ids = conn.execute(f"SELECT id FROM subjects WHERE {' AND '.join(subject_filters)}", subject_params)
+        conditions.append(f"r.subject_id IN ({', '.join(str(row[0]) for row in ids)})")
+    categories = [category.lower() for category in split_list_args(args.category)]
+    if categories: conditions.append(f"r.category IN ({', '.join('?' * len(categories))})"); params += categories
+    if args.work_hours is not None: conditions.append("r.work_hours = ?"); params.append(int(args.work_hours))
+    if args.inappropriate: conditions.append("r.inappropriate = 1")
+    if args.since: conditions.append("r.visit_time >= ?"); params.append(parse_index_time(args.since, timezone))
+    if args.until: conditions.append("r.visit_time < ?"); params.append(parse_index_time(args.until, timezone))
+    return (' WHERE ' + ' AND '.join(conditions) if conditions else ''), params
+
+def run_index_query(conn, args, timezone):
+    # -> (column names, rows) for --records or the grouped summary
+    where, params = query_conditions(conn, args, timezone)
+    limit = args.limit if args.limit > 0 else -1
+    if args.records:
+        rows = conn.execute(f"""SELECT r.visit_time, s.case_name, s.name, d.name, r.category, r.work_hours, r.inappropriate, r.reason, u.name
+                                FROM records r JOIN subjects s ON s.id = r.subject_id LEFT JOIN domains d ON d.id = r.domain_id
+                                JOIN urls u ON u.id = r.url_id{where} ORDER BY r.visit_time LIMIT ?""", params + [limit]).fetchall()
+        return QUERY_RECORD_COLUMNS, [(format_index_time(row[0], timezone), *row[1:5], bool(row[5]), bool(row[6]), *row[7:]) for row in rows]
+    key, labels, label_columns, join = QUERY_GROUPS[args.by]
+    rows = conn.execute(f"""SELECT {label_columns}, g.records, g.subjects, g.work_hours, g.inappropriate, g.first, g.last FROM (
+                                SELECT {key} AS key, COUNT(*) AS records, COUNT(DISTINCT r.subject_id) AS subjects, SUM(r.work_hours) AS work_hours,
+                                       SUM(r.inappropriate) AS inappropriate, MIN(r.visit_time) AS first, MAX(r.visit_time) AS last
+                                FROM records r{where} GROUP BY {key}) g {join} ORDER BY g.records DESC LIMIT ?""", params + [limit]).fetchall()
+    columns = labels + ['records', 'subjects', 'work_hours', 'inappropriate', 'first', 'last']
+    rows = [(*row[:-2], format_index_time(row[-2], timezone), format_index_time(row[-1], timezone)) for row in rows]
+    if args.by == 'subject':  # always 1
+        drop = columns.index('subjects')
+        columns, rows = columns[:drop] + columns[drop + 1:], [row[:drop] + row[drop + 1:] for row in rows]
+    return columns, rows
+
+def format_index_time(microseconds, timezone):
+    return datetime.datetime.fromtimestamp(microseconds // 1000000, timezone).isoformat(sep=' ')
+
+def print_query_table(columns, rows, max_width=80):
+    cells = [[('-' if value in (None, '') else str(value)) for value in row] for row in rows]
+    cells = [[value if len(value) <= max_width else value[:max_width - 3] + '...' for value in row] for row in cells]
+    widths = [max([len(column)] + [len(row[i]) for row in cells]) for i, column in enumerate(columns)]
+    for row in [columns] + cells: print('  '.join(value.ljust(width) for value, width in zip(row, widths)).rstrip())
+
+def query_main(argv):
+    parser = argparse.ArgumentParser(
+        prog='octorecon.py query',
+        description='Search an index built with --index across subjects and cases, e.g. who visited a domain during work hours:\n'
+                    '  octorecon.py query cases.sqlite --domain dropbox.com --work-hours --since 2024-07-01 --until 2024-10-01',
+        formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument('index', help='Index file written by --index.')
+    parser.add_argument('--domain', action='append', default=[], help='Domains (comma-separated, repeatable); subdomains match too.')
+    parser.add_argument('--category', action='append', default=[], help='Categories (comma-separated, repeatable), e.g. social_media,streaming.')
+    parser.add_argument('--subject', action='append', default=[], help='Only these subjects (comma-separated, repeatable).')
+    parser.add_argument('--case', action='append', default=[], help='Only these cases (comma-separated, repeatable).')
+    hours = parser.add_mutually_exclusive_group()
+    hours.add_argument('--work-hours', dest='work_hours', action='store_const', const=True, help='Only records during work hours.')
+    hours.add_argument('--non-work-hours', dest='work_hours', action='store_const', const=False, help='Only records outside work hours.')
+    parser.add_argument('--inappropriate', action='store_true', help='Only records flagged as potentially inappropriate.')
+    parser.add_argument('--since', help='Records at or after this time: YYYY-MM-DD or "YYYY-MM-DD HH:MM", in --timezone.')
+    parser.add_argument('--until', help='Records before this time (exclusive), same format as --since.')
+    parser.add_argument('--timezone', default=DEFAULT_TIMEZONE, help=f'Timezone of --since/--until and of the times shown. Default: {DEFAULT_TIMEZONE}.')
+    parser.add_argument('--by', choices=QUERY_GROUPS, default='subject', help='Group the matching records by subject, domain or category. Default: subject.')
+    parser.add_argument('--records', action='store_true', help='List the matching records (in time order) instead of grouping them.')
+    parser.add_argument('--limit', type=int, default=100, help='Maximum rows printed; 0 for all. Default: 100.')
+    parser.add_argument('--format', choices=QUERY_FORMATS, default='table', help='Output format. Default: table.')
+    args = parser.parse_args(argv)
+    if not os.path.isfile(args.index): print(f"Error: Index '{args.index}' not found."); return
+    try: timezone = pytz.timezone(args.timezone)
+    except pytz.UnknownTimeZoneError: print(f"Error: Unknown timezone '{args.timezone}'."); return
+
+    start = time.perf_counter()
+    index = AnalysisIndex(args.index)
+    try: columns, rows = run_index_query(index.connect(), args, timezone)
+    except (sqlite3.Error, ValueError) as e: print(f"Error: {e}"); return
+    finally: index.close()
+    elapsed = time.perf_counter() - start
+    if args.format == 'json': print(json.dumps([dict(zip(columns, row)) for row in rows], indent=2))
+    elif args.format == 'csv':
+        writer = csv.writer(sys.stdout)
+        writer.writerow(columns)
+        writer.writerows(rows)
+    else:
+        print_query_table(columns, rows)
+        print(f"\n{len(rows)} rows{' (--limit reached)' if len(rows) == args.limit else ''} in {elapsed * 1000:.0f} ms.")
+
+DEFAULT_SERVE_PORT = 8765
+SERVE_REPORT_NAME = 'report.html'  # each job's report, in its job directory (charts in report_charts/ beside it)
+SERVE_UPLOAD_BLOCK = 1 << 20
+SERVE_MAX_JSON = 1 << 20  # bytes of a JSON job request (options and paths, never file contents)
+SERVE_TRUE = ('1', 'true', 'yes', 'on')
+
+def init_serve_worker(analyzer, index=None):
+    # Once per worker process, so that a job pays only for its own analysis: pandas and the chart stack are imported
+    # here rather than by the first job each worker runs
+    init_batch_worker(analyzer, index)
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot
+    # pd/np/sns are lazy_import modules; warm them here too, or each worker's first job would pay for importing them
+    load_lazy_modules(pd, np, sns)
+
+def serve_worker_ready(_): return os.getpid()
+
+def serve_run_job(inputs, subject, engine, chunksize, visits, output_file, report_options):
+    # One job in a warm worker -> JSON-ready result, including what the analysis printed
+    log, timings, summary, report, error, rules_reloaded = io.StringIO(), {}, None, None, None, False
+    added = batch_index.added if batch_index is not None else 0
+    with redirect_stdout(log):
         try:
-            df_diag = pd.read_csv(args.csv_file, nrows=20, on_bad_lines='skip', low_memory=False) 
-            if df_diag.empty: print("Diagnostic CSV empty/unreadable."); return
-            print(f"Columns: {list(df_diag.columns)}")
-            if 'last_visit_time' in df_diag.columns and 'url' in df_diag.columns:
-                print("\nSample Processing:")
-                for i, row_diag in df_diag.head(5).iterrows():
-                    ts_raw, url_raw = row_diag['last_visit_time'], str(row_diag.get('url','Unknown_URL'))
-                    print(f"\n--- Row {i+1} ---\n  Raw URL: '{url_raw[:100]}{'...' if len(url_raw)>100 else ''}'\n  Raw Timestamp: '{ts_raw}'")
-                    parsed_dt = analyzer.parse_timestamp(ts_raw)
-                    print(f"    Parsed Timestamp: {parsed_dt.strftime('%Y-%m-%d %H:%M:%S %Z') if parsed_dt else 'Failed'}")
-                    p_url = urlparse(url_raw); domain_f, main_d = p_url.netloc.lower(), analyzer.get_main_domain(p_url.netloc)
-                    category = analyzer.categorize_url(url_raw)
-                    is_inapp, reason = analyzer.is_inappropriate(url_raw, category, domain_f, main_d)
-                    print(f"    Full Domain: '{domain_f}', Main Domain: '{main_d}'\n    Categorized as: '{category}'")
-                    print(f"    Flagged Inappropriate: {'Yes (Reason: ' + reason + ')' if is_inapp else 'No'}")
-            else: print("Error: 'last_visit_time' and/or 'url' columns NOT found.")
-        except Exception as e: print(f"Error during diagnosis: {e}\n{traceback.format_exc()}"); return
-        return 
+            start = time.perf_counter()
+            rules_reloaded = batch_analyzer.reload_rules()
+            agg = batch_analyzer.aggregate_file(inputs, engine, chunksize, visits=visits, sinks=[lambda df: batch_index_add(df, subject)])
+            timings['analysis'] = round(time.perf_counter() - start, 3)
+            if agg.empty: error = 'No data processed'
+            else:
+                summary = agg.summary()
+                if output_file:
+                    start = time.perf_counter()
+                    report = batch_analyzer.generate_report(agg, output_file, **report_options)
+                    timings['report'] = round(time.perf_counter() - start, 3)
+                    if not report: error = 'Report failed'
+        except Exception as e: error = f"{type(e).__name__}: {e}"
+    messages = [line for line in log.getvalue().splitlines() if line.strip()]
+    if summary is None and error == 'No data processed': error = next((m for m in messages if m.startswith(('Error', 'Critical error'))), error)
+    result = {'summary': summary, 'report': bool(report), 'rules_reloaded': rules_reloaded, 'timings': timings, 'messages': messages, 'error': error}
+    if batch_index is not None: result['indexed'] = batch_index.added - added
+    return result
+
+class ServeJobs:
+    # The jobs of one `serve` process. Jobs wait in a FIFO queue and are handed to the pool as workers free up, so at
+    # most `workers` run at a time; up to `queue_size` more may wait (or upload), and further ones are refused.
+    # Finished jobs beyond `keep` are dropped oldest first, together with their directories (uploads and reports).
+    def __init__(self, make_pool, jobs_dir, workers, queue_size, keep, job_options):
+        self.make_pool, self.pool = make_pool, make_pool()
+        self.jobs_dir, self.workers, self.queue_size, self.keep = jobs_dir, workers, queue_size, keep
+        self.job_options = job_options  # engine and report options shared by every job
+        self.jobs = {}  # id -> job, in submission order
+        self.queue = collections.deque()
+        self.running = 0
+        self.lock = threading.RLock()  # re-entered when a future is already done as its callback is added
+
+    def active(self): return sum(1 for job in self.jobs.values() if job['finished'] is None)
+
+    def create(self, subject):
+        # A new job with its directory, or None when the queue is full
+        with self.lock:
+            if self.active() >= self.workers + self.queue_size: return None
+            job_id = os.urandom(8).hex()
+            job = {'id': job_id, 'dir': os.path.join(self.jobs_dir, job_id), 'status': 'uploading', 'subject': subject, 'inputs': [],
+                   'visits': False, 'submitted': datetime.datetime.now().astimezone().isoformat(timespec='seconds'),
+                   'finished': None, 'seconds': None, 'result': None, 'error': None, 'done': threading.Event()}
+            os.makedirs(job['dir'])
+            self.jobs[job_id] = job
+            return job
+
+    def start(self, job, inputs, visits, chunksize, report):
+        job['visits'], job['started'] = visits, time.perf_counter()
+        job['args'] = (inputs if len(inputs) > 1 else inputs[0], job['subject'], self.job_options['engine'], chunksize, visits,
+                       os.path.join(job['dir'], SERVE_REPORT_NAME) if report else None, self.job_options['report'])
+        with self.lock:
+            job['status'] = 'queued'
+            self.queue.append(job)
+            self._dispatch()
+
+    def _dispatch(self):
+        # With the lock held: hands queued jobs to free workers
+        while self.queue and self.running < self.workers:
+            job = self.queue.popleft()
+            try: future = self.pool.submit(serve_run_job, *job['args'])
+            except BrokenProcessPool:
+                # A worker died (e.g. out of memory): this and later jobs get a fresh pool
+                self.pool = self.make_pool()
+                future = self.pool.submit(serve_run_job, *job['args'])
+            job['status'] = 'running'
+            self.running += 1
+            future.add_done_callback(lambda future, job=job: self._finish(job, future))
+
+    def _finish(self, job, future):
+        try: job['result'] = future.result()
+        except Exception as e: job['error'] = f"{type(e).__name__}: {e}"
+        else: job['error'] = job['result'].pop('error')
+        with self.lock:
+            self.running -= 1
+            self._close(job, 'failed' if job['error'] else 'done')
+            self._dispatch()
+            finished = [j for j in self.jobs.values() if j['finished'] is not None]
+            for old in finished[:max(len(finished) - self.keep, 0)]: self._drop(old)
+
+    def _close(self, job, status):
+        job['status'], job['finished'] = status, datetime.datetime.now().astimezone().isoformat(timespec='seconds')
+        if 'started' in job: job['seconds'] = round(time.perf_counter() - job['started'], 3)
+        job.pop('args', None)
+        job['done'].set()
+
+    def fail(self, job, error):
+        # A job that never reached the queue (failed upload)
+        with self.lock:
+            job['error'] = error
+            self._close(job, 'failed')
+            self._drop(job)
+
+    def _drop(self, job):
+        self.jobs.pop(job['id'], None)
+        shutil.rmtree(job['dir'], ignore_errors=True)
+
+    def delete(self, job):
+        # Cancels a queued job or forgets a finished one; False while it uploads or runs
+        with self.lock:
+            if job['status'] in ('uploading', 'running'): return False
+            if job['status'] == 'queued':
+                self.queue.remove(job)
+                job['error'] = 'Cancelled'
+                self._close(job, 'cancelled')
+            self._drop(job)
+            return True
+
+    def describe(self, job):
+        description = {key: job[key] for key in ('id', 'status', 'subject', 'inputs', 'visits', 'submitted', 'finished', 'seconds', 'error')}
+        if job['result'] is not None:
+            description.update(job['result'])
+            if description['report']: description['report'] = f"/jobs/{job['id']}/{SERVE_REPORT_NAME}"
+            else: del description['report']
+        return description
+
+    def shutdown(self):
+        with self.lock:
+            for job in self.queue: self._close(job, 'cancelled')
+            self.queue.clear()
+        self.pool.shutdown(wait=True)
+
+def serve_flag(value):
+    return value if isinstance(value, bool) else str(value).strip().lower() in SERVE_TRUE
+
+def serve_main(argv):
+    parser = argparse.ArgumentParser(
+        prog='octorecon.py serve',
+        description='Run a local HTTP API that analyzes History databases / CSV exports with warm worker processes: rules,\n'
+                    'caches and imports are set up once, so each job costs only its analysis. For example:\n'
+                    '  curl --data-binary @History "http://127.0.0.1:8765/jobs?subject=alice&wait=1"\n'
+                    '  curl -d \'{"paths": ["/cases/bob/History"], "visits": true}\' -H "Content-Type: application/json" http://127.0.0.1:8765/jobs',
+        formatter_class=argparse.RawTextHelpFormatter
+    )
+    add_analysis_arguments(parser)
+    parser.add_argument('--host', default='127.0.0.1', help='Address to listen on. Default: 127.0.0.1 (this machine only).')
+    parser.add_argument('--port', type=int, default=DEFAULT_SERVE_PORT, help=f'Port to listen on. Default: {DEFAULT_SERVE_PORT}.')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Worker processes, i.e. jobs run at the same time. Default: number of CPUs.')
+    parser.add_argument('--queue-size', type=int, default=32, help='Jobs that may wait for a worker; beyond that new jobs get 503. Default: 32.')
+    parser.add_argument('--keep-jobs', type=int, default=100, help='Finished jobs (results, uploads and reports) kept; older ones are deleted. Default: 100.')
+    parser.add_argument('--jobs-dir', metavar='DIR', help='Directory for uploads and reports. Default: a temporary directory removed on exit.')
+    parser.add_argument('--max-upload', type=int, default=4096, metavar='MB', help='Largest accepted upload, in MB. Default: 4096.')
+    parser.add_argument('--chunksize', type=int, default=DEFAULT_CHUNKSIZE, help=f'Rows analyzed at a time within a job. Default: {DEFAULT_CHUNKSIZE}.')
+    parser.add_argument('--quiet', action='store_true', help='Do not log every request.')
+    args = parser.parse_args(argv)
+    if args.workers < 1: print("Error: --workers must be at least 1."); return
+    if args.queue_size < 0 or args.keep_jobs < 0: print("Error: --queue-size and --keep-jobs cannot be negative."); return
+    if args.chunksize < 1: print("Error: --chunksize must be a positive number of rows."); return
+
+    analyzer = build_analyzer(args)
+    if analyzer is None: return
+    index = open_index(args.index, args.case) if args.index else None
+    if args.index and index is None: return
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    import mimetypes
+    import tempfile
+
+    jobs_dir = args.jobs_dir or tempfile.mkdtemp(prefix='octorecon-serve-')
+    os.makedirs(jobs_dir, exist_ok=True)
+    make_pool = lambda: ProcessPoolExecutor(max_workers=args.workers, initializer=init_serve_worker, initargs=(analyzer, index))
+    jobs = ServeJobs(make_pool, jobs_dir, args.workers, args.queue_size, args.keep_jobs,
+                     {'engine': args.engine, 'report': {'paged_tables': args.paged_tables, 'chart_format': args.chart_format, 'chart_dpi': args.chart_dpi}})
+
+    class ServeRequestHandler(BaseHTTPRequestHandler):
+        server_version = 'octorecon'
+
+        def log_message(self, format, *log_args):
+            if not args.quiet: super().log_message(format, *log_args)
+
+        def send_body(self, status, body, content_type, headers=()):
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            for name, value in headers: self.send_header(name, value)
+            self.end_headers()
+            if self.command != 'HEAD': self.wfile.write(body)
+
+        def send_json(self, status, payload, headers=()):
+            self.send_body(status, (json.dumps(payload, indent=2) + '\n').encode('utf-8'), 'application/json', headers)
+
+        def send_error_json(self, status, message, headers=()):
+            self.send_json(status, {'error': message}, headers)
+
+        def route(self):
+            url = urlparse(self.path)
+            return [unquote(part) for part in url.path.split('/') if part], parse_qs(url.query)
+
+        def find_job(self, job_id):
+            job = jobs.jobs.get(job_id)
+            if job is None: self.send_error_json(404, f"No job '{job_id}'.")
+            return job
+
+        def do_GET(self):
+            parts, _ = self.route()
+            if parts in ([], ['health']):
+                return self.send_json(200, {'status': 'ok', 'workers': args.workers, 'queue_size': args.queue_size, 'active_jobs': jobs.active(),
+                                            'engine': args.engine, 'rules': analyzer.ruleset.describe() if analyzer.ruleset else None})
+            if parts == ['jobs']: return self.send_json(200, [jobs.describe(job) for job in list(jobs.jobs.values())])
+            if len(parts) < 2 or parts[0] != 'jobs': return self.send_error_json(404, 'Not found.')
+            job = self.find_job(parts[1])
+            if job is None: return
+            if len(parts) == 2: return self.send_json(200, jobs.describe(job))
+            # The report and its chart files; nothing else in the job directory (such as the upload) is served
+            report_charts = os.path.basename(report_charts_dir(SERVE_REPORT_NAME))
+            if not (parts[2:] == [SERVE_REPORT_NAME] or (len(parts) == 4 and parts[2] == report_charts and re.fullmatch(r'\w[\w.-]*', parts[3]))):
+                return self.send_error_json(404, 'Not found.')
+            if job['finished'] is None: return self.send_error_json(409, f"Job '{job['id']}' is not finished.")
+            try:
+                with open(os.path.join(job['dir'], *parts[2:]), 'rb') as f: body = f.read()
+            except OSError: return self.send_error_json(404, 'Not found.')
+            content_type = 'text/html; charset=utf-8' if parts[-1] == SERVE_REPORT_NAME else mimetypes.guess_type(parts[-1])[0] or 'application/octet-stream'
+            self.send_body(200, body, content_type)
+
+        do_HEAD = do_GET
+
+        def do_DELETE(self):
+            parts, _ = self.route()
+            if len(parts) != 2 or parts[0] != 'jobs': return self.send_error_json(404, 'Not found.')
+            job = self.find_job(parts[1])
+            if job is None: return
+            if not jobs.delete(job): return self.send_error_json(409, f"Job '{job['id']}' is running.")
+            self.send_json(200, {'id': job['id'], 'deleted': True})
+
+        def do_POST(self):
+            parts, query = self.route()
+            if parts != ['jobs']: return self.send_error_json(404, 'Not found.')
+            try: length = int(self.headers.get('Content-Length', ''))
+            except ValueError: return self.send_error_json(411, 'Content-Length required.')
+            if length < 0: return self.send_error_json(400, 'Invalid Content-Length.')
+            content_type = self.headers.get_content_type()
+            options = {name: values[-1] for name, values in query.items()}  # job options: query string, then JSON body
+            if content_type == 'application/json':
+                if length > SERVE_MAX_JSON: return self.send_error_json(413, f"JSON job requests are limited to {SERVE_MAX_JSON // 1024} KB.")
+                try: body = json.loads(self.rfile.read(length) or b'{}')
+                except ValueError as e: return self.send_error_json(400, f"Invalid JSON: {e}")
+                if not isinstance(body, dict): return self.send_error_json(400, 'The JSON body must be an object.')
+                options.update(body)
+                paths = options.get('paths') or options.get('path')
+                paths = [paths] if isinstance(paths, str) else paths
+                if not paths or not isinstance(paths, list) or not all(isinstance(p, str) for p in paths):
+                    return self.send_error_json(400, "Give 'paths' (a list of files or directories) or upload a file as the request body.")
+            elif content_type.startswith('multipart/'):
+                return self.send_error_json(415, 'Send the file itself as the request body, e.g. curl --data-binary @History.')
+            else:
+                paths = None
+                if length > args.max_upload * 2**20: return self.send_error_json(413, f"Uploads are limited to {args.max_upload} MB.")
+            try:
+                visits = serve_flag(options.get('visits', args.visits))
+                report = serve_flag(options.get('report', True))
+                chunksize = int(options.get('chunksize', args.chunksize))
+                if chunksize < 1: raise ValueError
+            except (TypeError, ValueError): return self.send_error_json(400, "'chunksize' must be a positive number of rows.")
+            subject = str(options.get('subject') or '')
+            if index is not None and not subject: return self.send_error_json(400, "This server has an --index: give the job a 'subject'.")
+
+            if paths is not None:
+                missing = [p for p in paths if not os.path.exists(p)]
+                if missing: return self.send_error_json(400, f"'{missing[0]}' not found.")
+                inputs = find_history_files(paths)
+                if not inputs: return self.send_error_json(400, 'No History databases or CSV files found.')
+            job = jobs.create(subject)
+            if job is None:
+                return self.send_error_json(503, 'The job queue is full; retry later.', [('Retry-After', '5')])
+            if paths is None:
+                name = re.sub(r'[^\w.-]+', '_', os.path.basename(str(options.get('name') or ''))).strip('._')
+                upload = os.path.join(job['dir'], name or 'upload')
+                try:
+                    with open(upload, 'wb') as f:
+                        remaining = length
+                        while remaining:
+                            block = self.rfile.read(min(remaining, SERVE_UPLOAD_BLOCK))
+                            if not block: raise OSError('the upload ended early')
+                            f.write(block)
+                            remaining -= len(block)
+                except OSError as e:
+                    jobs.fail(job, str(e))
+                    return self.send_error_json(400, f"Upload failed: {e}")
+                if not name:
+                    # Nameless uploads are named by content; analysis detects the format either way
+                    name = 'History' if is_sqlite_file(upload) else 'history.csv'
+                    os.replace(upload, os.path.join(job['dir'], name))
+                inputs = [os.path.join(job['dir'], name)]
+            job['inputs'] = [os.path.basename(p) for p in inputs] if paths is None else inputs  # uploads by name only
+            jobs.start(job, inputs, visits, chunksize, report)
+            if serve_flag(options.get('wait', False)):
+                job['done'].wait()
+                return self.send_json(200, jobs.describe(job))
+            self.send_json(202, jobs.describe(job), [('Location', f"/jobs/{job['id']}")])
+
+    try: server = ThreadingHTTPServer((args.host, args.port), ServeRequestHandler)
+    except OSError as e:
+        print(f"Error: Cannot listen on {args.host}:{args.port}: {e}")
+        jobs.shutdown()
+        if not args.jobs_dir: shutil.rmtree(jobs_dir, ignore_errors=True)
+        return
+    server.daemon_threads = True
+    start = time.perf_counter()
+    list(jobs.pool.map(serve_worker_ready, range(args.workers)))  # start (and warm up) every worker before the first request
+    print(f"{args.workers} workers ready in {time.perf_counter() - start:.1f}s.")
+    import signal
+    signal.signal(signal.SIGTERM, signal.default_int_handler)  # stop on SIGTERM as on Ctrl+C, finishing running jobs
+    print(f"Serving on http://{args.host}:{server.server_address[1]}/ (jobs in {jobs_dir}). Press Ctrl+C to stop.")
+    try: server.serve_forever()
+    except KeyboardInterrupt: print("\nStopping; waiting for running jobs...")
+    finally:
+        server.server_close()
+        jobs.shutdown()
+        if not args.jobs_dir: shutil.rmtree(jobs_dir, ignore_errors=True)
+
+def open_index(path, case=''):
+    # An AnalysisIndex whose file has been checked (and created) up front; None, after printing why, if it can't be used
+    index = AnalysisIndex(path, case)
+    try: index.connect()
+    except (sqlite3.Error, OSError, ValueError) as e: print(f"Error: Cannot open index '{path}': {e}"); return None
+    index.close()
+    return index
+
+def print_index_totals(index):
+    if index.disabled: return
+    try: subjects, records = index.totals()
+    except (sqlite3.Error, ValueError) as e: print(f"Error reading index '{index.path}': {e}"); return
+    finally: index.close()
+    print(f"Index '{index.path}': {records} records of {subjects} subjects.")
+
+def diagnose(analyzer, path):
+    # --diagnose: how the first rows of one input are parsed and categorized, read without pandas
+    try:
+        source = open_history(path)
+        print(f"Diagnosing {source.label}: '{path}' (first 5 rows)...")
+        columns_diag, rows_diag = source.sample_rows(5)
+        if not rows_diag: print("Diagnostic CSV empty/unreadable."); return
+        print(f"Columns: {columns_diag}")
+        if 'last_visit_time' in columns_diag and 'url' in columns_diag:
+            print("\nSample Processing:")
+            for i, row_diag in enumerate(rows_diag):
+                ts_raw, url_raw = row_diag['last_visit_time'], str(row_diag.get('url','Unknown_URL'))
+                print(f"\n--- Row {i+1} ---\n  Raw URL: '{url_raw[:100]}{'...' if len(url_raw)>100 else ''}'\n  Raw Timestamp: '{ts_raw}'")
+                parsed_dt = analyzer.parse_timestamp(ts_raw)
+                print(f"    Parsed Timestamp: {parsed_dt.strftime('%Y-%m-%d %H:%M:%S %Z') if parsed_dt else 'Failed'}")
+                p_url = urlparse(url_raw); domain_f, main_d = p_url.netloc.lower(), analyzer.get_main_domain(p_url.netloc)
+                category = analyzer.categorize_url(url_raw)
+                is_inapp, reason = analyzer.is_inappropriate(url_raw, category, domain_f)
+                print(f"    Full Domain: '{domain_f}', Main Domain: '{main_d}'\n    Categorized as: '{category}'")
+                print(f"    Flagged Inappropriate: {'Yes (Reason: ' + reason + ')' if is_inapp else 'No'}")
+        else: print("Error: 'last_visit_time' and/or 'url' columns NOT found.")
+    except ValueError as e: print(f"Error: {e}")
+    except Exception as e: print(f"Error during diagnosis: {e}\n{traceback.format_exc()}")
+
+def main():
+    if sys.argv[1:2] == ['batch']: return batch_main(sys.argv[2:])
+    if sys.argv[1:2] == ['query']: return query_main(sys.argv[2:])
+    if sys.argv[1:2] == ['serve']: return serve_main(sys.argv[2:])
+    parser = argparse.ArgumentParser(
+        description='Analyze browser history for workplace investigation. Accepts Chromium (Chrome, Edge, Brave) History and Firefox places.sqlite\ndatabases directly, or a CSV with "url" and "last_visit_time" columns.\nRun "octorecon.py batch --help" to analyze many History files in parallel, "octorecon.py query --help" to search an --index,\n"octorecon.py serve --help" to run a local analysis API.',
+        formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument('history_files', nargs='*', metavar='history_file',
+                        help='A Chromium "History" or Firefox "places.sqlite" file, or a CSV export of a urls table. Several files, or a directory\n(searched recursively), are the profiles of one subject and are merged into one report.')
+    add_analysis_arguments(parser)
+    parser.add_argument('--output', default='browser_history_report.html', help='Output HTML file name.')
+    parser.add_argument('--subject', help='Subject (e.g. employee) the records are tagged with in --index.')
+    parser.add_argument('--diagnose', action='store_true', help='Show timestamp/category diagnosis for first few CSV rows and exit.')
+    parser.add_argument('--chunksize', type=int, default=None,
+                        help=f'Stream the input in chunks of this many rows and aggregate the report incrementally,\nso memory stays flat however large the CSV or History file is.\nWithout it the whole result is kept in memory (History databases are still read {DEFAULT_CHUNKSIZE} rows at a time).')
+    parser.add_argument('--state', metavar='FILE',
+                        help='Incremental mode: keep the analyzed rows and a high-water mark in FILE, and on later runs only read and\nanalyze rows visited or added since (the report still covers everything). Created on the first run.')
+    parser.add_argument('--export', metavar='FILE',
+                        help='Also save the analyzed records to FILE as Parquet (.parquet/.pq) or Arrow IPC (.arrow/.feather/.ipc),\nwith dictionary-encoded domains/categories. Needs pyarrow.')
+    parser.add_argument('--from-analyzed', metavar='FILE',
+                        help='Report from a file written by --export instead of a History file: nothing is re-read or re-categorized,\nbut --timezone and the work schedule are applied anew. Needs pyarrow.')
+    parser.add_argument('--chart-workers', type=int, default=os.cpu_count() or 1, help='Processes drawing the report charts in parallel. Default: number of CPUs.')
+    parser.add_argument('--summary-only', action='store_true',
+                        help='Only count: stream the input (in --chunksize chunks) into the summary figures, without building the analyzed\nrecords, tables or charts. Writes JSON or CSV when --output ends in .json/.csv, otherwise prints JSON\n(progress messages then go to stderr).')
+    parser.add_argument('--profile', action='store_true',
+                        help='Print per-stage timings, row/cache counters and category rule hits, and run cProfile over the analysis\nand report, saving <output>.pstats (python -m pstats <output>.pstats). cProfile slows the run down.')
+    parser.add_argument('--profile-json', metavar='FILE', help='Save the stage timings and counters as JSON (without cProfile unless --profile is given).')
     
-    print(f"Analyzing history from '{args.csv_file}'...")
-    analyzed_df = analyzer.analyze_csv(args.csv_file)
-    if analyzed_df.empty: print("No data processed. Report skipped."); return
+    args = parser.parse_args()
+    
+    if bool(args.history_files) == bool(args.from_analyzed):
+        print("Error: give either a History file (or CSV) or --from-analyzed FILE."); return
+    if args.from_analyzed and (args.state or args.diagnose):
+        print("Error: --state and --diagnose need a History file, not --from-analyzed."); return
+    for input_path in args.history_files or [args.from_analyzed]:
+        if not os.path.exists(input_path):
+            print(f"Error: {'History' if args.history_files else 'Analyzed'} file '{input_path}' not found."); return
+    if args.history_files:
+        files_only = all(os.path.isfile(path) for path in args.history_files)
+        args.history_paths = list(dict.fromkeys(args.history_files)) if files_only else find_history_files(args.history_files)
+        if not args.history_paths: print("Error: No History databases or CSV files found."); return
+        if args.state and len(args.history_paths) > 1: print("Error: --state needs a single history file, not merged profiles."); return
+        # One file is analyzed as before; several are the profiles of one subject (see MergedHistory)
+        args.history = args.history_paths[0] if len(args.history_paths) == 1 else args.history_paths
+    try:
+        if args.export: export_format(args.export)
+        if args.export or args.from_analyzed: import_pyarrow()
+    except ValueError as e: print(f"Error: {e}"); return
+    if args.chunksize is not None and args.chunksize < 1: print("Error: --chunksize must be a positive number of rows."); return
+    if args.index and not args.subject and not args.diagnose: print("Error: --index needs --subject NAME."); return
+    if args.chart_workers < 1: print("Error: --chart-workers must be at least 1."); return
+    if args.summary_only and (args.index or args.export or args.state):
+        print("Error: --summary-only cannot be combined with --index, --export or --state."); return
+    # A summary printed as JSON keeps stdout to itself; everything else is logged to stderr
+    args.summary_stream = sys.stdout
+    with redirect_stdout(sys.stderr) if args.summary_only and not args.output.lower().endswith(SUMMARY_FORMATS) else nullcontext():
+        analyzer = build_analyzer(args)
+        if analyzer is None: return
+
+        if args.diagnose:
+            for path in args.history_paths: diagnose(analyzer, path)
+            return
+
+        if args.profile or args.profile_json: analyzer.profile = RunProfile()
+        profiler = None
+        if args.profile:
+            import cProfile
+            profiler = cProfile.Profile()
+            profiler.enable()
+        try: (summarize if args.summary_only else analyze_and_report)(args, analyzer)
+        finally:
+            if profiler is not None: profiler.disable()
+            if analyzer.profile is not None: write_profile(args, analyzer, profiler)
+
+def close_category_cache(analyzer):
+    cache = analyzer.category_cache
+    if cache is not None and not cache.disabled:
+        print(f"Categorization cache: {cache.hits} URLs reused, {cache.misses} categorized ({cache.path})")
+        if analyzer.profile is not None: analyzer.profile.count('cache_hits', cache.hits); analyzer.profile.count('cache_misses', cache.misses)
+        cache.close()
+
+def summarize(args, analyzer):
+    # --summary-only: the input is streamed into a ReportAggregator that keeps counters only; analysis builds just the
+    # columns they need (see _summary_frame), so neither analyzed records nor a report are ever materialized
+    if args.from_analyzed:
+        report_data = ReportAggregator(keep_tables=False, idle_gap=analyzer.idle_gap)
+        analyzed_df = analyzer.load_analyzed(args.from_analyzed)
+        with analyzer.stage('aggregate'): report_data.update(analyzed_df)
+        del analyzed_df
+    else:
+        print(f"Summarizing history from '{history_name(args.history)}'...")
+        report_data = analyzer.aggregate_file(args.history, engine=args.engine, chunksize=args.chunksize or DEFAULT_CHUNKSIZE,
+                                              visits=args.visits, summary=True)
+    close_category_cache(analyzer)
+    if report_data.empty: print("No data processed. Summary skipped."); return
+    summary = {'subject': args.subject, 'source': args.from_analyzed or history_name(args.history)}
+    summary = {**{key: value for key, value in summary.items() if value}, **report_data.summary()}
+    if not args.output.lower().endswith(SUMMARY_FORMATS): print(json.dumps(summary, indent=2), file=args.summary_stream); return
+    try: print(f"Summary: {write_summaries(summary, args.output)}")
+    except OSError as e: print(f"Error writing '{args.output}': {e}")
+
+def analyze_and_report(args, analyzer):
+    analyzed_df = None
+    index = open_index(args.index, args.case) if args.index else None
+    if args.index and index is None: return
+    if args.from_analyzed:
+        analyzed_df = analyzer.load_analyzed(args.from_analyzed)
+    else:
+        print(f"Analyzing history from '{history_name(args.history)}'...")
+        if args.state:
+            analyzed_df = analyzer.analyze_incremental(args.history, args.state, engine=args.engine,
+                                                       chunksize=args.chunksize or DEFAULT_CHUNKSIZE, visits=args.visits)
+        elif args.chunksize:
+            writer = AnalyzedDatasetWriter(args.export) if args.export else None
+            sinks = ([writer.write] if writer else []) + ([lambda df: index.add(df, args.subject)] if index else [])
+            report_data = analyzer.aggregate_file(args.history, engine=args.engine, chunksize=args.chunksize, visits=args.visits, sinks=sinks)
+            if writer is not None and report_data.empty: writer.abort()
+            elif writer is not None: print(f"Exported {writer.close()} analyzed records to '{args.export}'.")
+        else:
+            analyzed_df = analyzer.analyze_file(args.history, engine=args.engine, visits=args.visits)
+    if analyzed_df is not None:
+        if args.export and not analyzed_df.empty: export_analyzed(analyzed_df, args.export)
+        if index is not None:
+            with analyzer.stage('index'): index.add(analyzed_df, args.subject)
+        report_data = ReportAggregator(idle_gap=analyzer.idle_gap)
+        with analyzer.stage('aggregate'): report_data.update(analyzed_df)
+        del analyzed_df
+    close_category_cache(analyzer)
+    if index is not None and index.records:
+        print(f"Indexed {index.added} new of {index.records} records for subject '{args.subject}'.")
+        print_index_totals(index)
+    if report_data.empty: print("No data processed. Report skipped."); return
     
     print(f"Generating report to '{args.output}'...")
-    output_filepath = analyzer.generate_report(analyzed_df, args.output)
+    with analyzer.stage('html'):
+        output_filepath = analyzer.generate_report(report_data, args.output, paged_tables=args.paged_tables, chart_format=args.chart_format,
+                                                   chart_dpi=args.chart_dpi, chart_workers=args.chart_workers)
     
     if output_filepath and os.path.exists(output_filepath):
         abs_path_report = os.path.abspath(output_filepath)
         print(f"\nReport: file://{abs_path_report.replace(os.sep, '/')}")
-        if os.path.exists('browser_analysis_charts.png'): print(f"Charts: file://{os.path.abspath('browser_analysis_charts.png').replace(os.sep, '/')}")
-        total, work_h = len(analyzed_df), analyzed_df['work_hours'].sum()
+        charts_dir = report_charts_dir(output_filepath)
+        if os.path.isdir(charts_dir): print(f"Charts: file://{os.path.abspath(charts_dir).replace(os.sep, '/')}")
+        total, work_h = report_data.total, report_data.counts['work_hours'].get(True, 0)
         print(f"\nSummary: Total Records: {total}, Work Hours Records: {work_h} ({(work_h/total*100) if total else 0:.1f}%)")
-        print(f"Potentially Inappropriate (post-filtering): {analyzed_df['inappropriate'].sum()}")
+        print(f"Potentially Inappropriate (post-filtering): {report_data.counts['inappropriate'].get(True, 0)}")
     else: print("Failed to generate report.")
 
+def write_profile(args, analyzer, profiler):
+    profile = analyzer.profile
+    print(f"\n{profile.summary(analyzer.rule_engine.category_patterns)}")
+    if profile.counters.get('cache_hits'):
+        print(f"  ({profile.counters['cache_hits']} URLs came from the categorization cache and are not in the rule counts; run without --cache for complete counts.)")
+    if profiler is not None:
+        pstats_path = os.path.splitext(args.output)[0] + '.pstats'
+        try:
+            profiler.dump_stats(pstats_path)
+            print(f"cProfile: {pstats_path} (view with: python -m pstats {pstats_path})")
+        except OSError as e: print(f"Error writing '{pstats_path}': {e}")
+    if args.profile_json:
+        try:
+            with open(args.profile_json, 'w', encoding='utf-8') as f: json.dump(profile.to_dict(analyzer.rule_engine.category_patterns), f, indent=2)
+            print(f"Profile JSON: {args.profile_json}")
+        except OSError as e: print(f"Error writing '{args.profile_json}': {e}")
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,42 @@
+"""
+Compact layout of analyzed frames (compact_result_frame): narrow dtypes, no stored 'date' column, and fewer bytes per
+row than the all-object layout benchmarks/memory.py compares against.
+"""
+
+import os
+import sys
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.join(REPO_DIR, 'benchmarks'))
+import pandas as pd
+import octorecon
+import synthetic_history
+from memory import legacy_layout
+
+def analyzed_frame(rows=2000):
+    analyzer = octorecon.BrowserHistoryAnalyzer('09:00', '17:00', octorecon.parse_work_days_arg('M,T,W,Th,F'),
+                                                synthetic_history.WORK_KEYWORDS.split(','))
+    urls, _ = next(synthetic_history.HistoryGenerator(rows).chunks())
+    return analyzer.analyze_dataframe(urls)
+
+def test_compact_dtypes():
+    df = analyzed_frame()
+    assert not df.empty
+    for column in ('domain', 'category', 'weekday', 'inappropriate_reason'):
+        assert isinstance(df[column].dtype, pd.CategoricalDtype), column
+    assert list(df['weekday'].cat.categories) == octorecon.WEEKDAY_NAMES
+    assert df['hour'].dtype == 'int8'
+    assert df['visit_count'].dtype == 'int32' and df['typed_count'].dtype == 'int32'
+    assert df['inappropriate'].dtype == bool and df['work_hours'].dtype == bool
+    assert 'date' not in df.columns
+
+def test_bytes_per_row_below_legacy_layout():
+    df = analyzed_frame()
+    compact = df.memory_usage(deep=True, index=False).sum() / len(df)
+    legacy = legacy_layout(df).memory_usage(deep=True, index=False).sum() / len(df)
+    assert compact < legacy, f"{compact:.1f} bytes/row, legacy layout {legacy:.1f}"
+
+def test_compact_result_frame_narrows_legacy_frames():
+    df = analyzed_frame(500)
+    assert octorecon.compact_result_frame(legacy_layout(df)).dtypes.to_dict() == df.dtypes.to_dict()